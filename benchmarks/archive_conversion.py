@@ -0,0 +1,110 @@
+"""
+Convert a generated archive against a local fake Telegraph server
+
+Builds a ZIP or TAR of synthetic images with a few files that cannot be
+embedded, converts it with each upload concurrency and prints the per-file
+results and throughput.
+
+Run from the repository root:
+
+    python -m benchmarks.archive_conversion --files 100 --latency 0.05 --concurrency 1 4 8
+"""
+import io
+import os
+import time
+import random
+import asyncio
+import tarfile
+import zipfile
+import argparse
+
+# The Telegraph endpoints and settings are read at import time
+os.environ['TELEGRAPH_UPLOAD_URL'] = 'http://127.0.0.1:8082/upload'
+os.environ['TELEGRAPH_API_URL'] = 'http://127.0.0.1:8082'
+os.environ['TELEGRAPH_ACCESS_TOKEN'] = 'benchmark'
+os.environ['TELEGRAPH_TOKENS_PATH'] = ''
+os.environ['DEDUP_CACHE_ENABLED'] = 'false'
+os.environ['IMAGE_OPTIMIZE'] = 'false'
+
+from bot import archive_summary
+from telegraph_client import convert_archive
+from utils.http_client import init_http_session, close_http_session
+from benchmarks.fakes import FakeTelegraph
+
+# Leading bytes that make the content sniffer recognise each kind of file
+HEADERS = {
+    '.jpg': b'\xff\xd8\xff\xe0\x00\x10JFIF\x00',
+    '.png': b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR',
+    '.gif': b'GIF89a',
+    '.pdf': b'%PDF-1.7\n',
+    '.exe': b'MZ\x90\x00'
+}
+
+def build_archive(files: int, file_size: int, archive_format: str) -> bytes:
+    """Create an archive of mostly images plus some files that cannot be embedded"""
+    rng = random.Random(42)
+    members = []
+    for index in range(files):
+        if index % 50 == 49:
+            extension = '.exe'
+        elif index % 25 == 24:
+            extension = '.pdf'
+        else:
+            extension = rng.choice(['.jpg', '.png', '.gif'])
+        members.append((f"photos/img_{index:04d}{extension}", HEADERS[extension] + rng.randbytes(file_size)))
+    members.append(('__MACOSX/._img_0000.jpg', b'\x00' * 64))
+
+    buffer = io.BytesIO()
+    if archive_format == 'zip':
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in members:
+                archive.writestr(name, data)
+    else:
+        with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+            for name, data in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+async def main(args) -> None:
+    telegraph = FakeTelegraph(latency=args.latency)
+    await telegraph.start()
+    await init_http_session()
+
+    file_name = f"photos.{'zip' if args.format == 'zip' else 'tar.gz'}"
+    archive = build_archive(args.files, args.file_size, args.format)
+    print(f"{file_name}: {args.files} files, {len(archive) / 1024 ** 2:.1f}MB, "
+          f"{args.latency * 1000:.0f}ms per Telegraph request\n")
+
+    try:
+        for index, concurrency in enumerate(args.concurrency):
+            pages_before = len(telegraph.pages)
+            started = time.perf_counter()
+            result = await convert_archive(io.BytesIO(archive), file_name, concurrency=concurrency)
+            wall = time.perf_counter() - started
+
+            if index == 0:
+                if args.verbose:
+                    for entry in result['files']:
+                        print(f"  {entry['name']:28} {entry['size']:8} bytes  {entry['status']:15} "
+                              f"{entry.get('media_url') or entry.get('reason')}")
+                print(archive_summary(file_name, result) + "\n")
+
+            converted = sum(1 for entry in result['files'] if entry.get('media_url'))
+            print(f"concurrency {concurrency:3}: {converted / wall:7.1f} files/s, "
+                  f"{result['bytes'] / wall / 1024 ** 2:6.2f} MB/s, {wall:6.2f}s, "
+                  f"{len(telegraph.pages) - pages_before} pages")
+    finally:
+        await close_http_session()
+        await telegraph.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--file-size', type=int, default=200 * 1024, help="Bytes per file")
+    parser.add_argument('--format', choices=('zip', 'tar'), default='zip')
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per fake Telegraph request")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--verbose', action='store_true', help="Print the result of every file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,172 @@
+"""
+Measure how long the bot takes from process start until it serves updates
+
+The import profile runs `python -X importtime -c "import bot"` a few times
+and breaks the fastest run down by module. Time to ready starts the bot
+through start_bot against the fake Bot API and Telegraph, with a latency
+on every request so getMe costs a real round trip. It measures the wall
+time until the first getUpdates and reads the phase breakdown the bot
+exports as m2t_startup_seconds. Both are run with and without the startup
+warm-up.
+
+Budgets make it a regression check; the exit status is 1 when one is
+exceeded:
+
+    python -m benchmarks.cold_start --runs 5 --latency-ms 150
+    python -m benchmarks.cold_start --max-import-ms 500 --max-ready-ms 1500
+"""
+import os
+import re
+import sys
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from aiohttp import ClientSession
+from benchmarks.fakes import BOT_TOKEN, FakeBotApi, FakeTelegraph
+
+REPO_ROOT = Path(__file__).parent.parent
+
+# Startup phases in the order they run, the metrics endpoint sorts them by name
+PHASES = ('imports', 'build', 'initialize', 'post_init')
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+def import_profile(module: str) -> list:
+    """
+    Import a module in a fresh interpreter under -X importtime
+
+    Returns:
+        List of (self_us, cumulative_us, depth, name), the module itself last
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            entries.append((int(own), int(cumulative), len(indent) // 2, name))
+    return entries
+
+def report_imports(module: str, runs: int, top: int) -> float:
+    """Print the import profile of the fastest run, returns its total in milliseconds"""
+    profiles = [import_profile(module) for _ in range(runs)]
+    fastest = min(profiles, key=lambda entries: entries[-1][1])
+    totals = sorted(entries[-1][1] / 1000 for entries in profiles)
+    print(f"import {module}: {totals[0]:.0f}ms fastest, {statistics.median(totals):.0f}ms median of {runs}")
+
+    print(f"\n  slowest direct imports of {module}")
+    direct = sorted((entry for entry in fastest if entry[2] == 1), key=lambda entry: -entry[1])
+    for own, cumulative, _, name in direct[:top]:
+        print(f"    {cumulative / 1000:7.1f}ms  {name}")
+
+    print("\n  slowest modules by own time")
+    for own, cumulative, _, name in sorted(fastest, key=lambda entry: -entry[0])[:top]:
+        print(f"    {own / 1000:7.1f}ms  {name}")
+    print()
+    return totals[0]
+
+def start_bot_process(args, scratch: str, warm_up: bool) -> subprocess.Popen:
+    """Run start_bot in a child process wired to the fakes"""
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=BOT_TOKEN,
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+        TELEGRAPH_UPLOAD_URL=f"http://127.0.0.1:{args.telegraph_port}/upload",
+        TELEGRAPH_API_URL=f"http://127.0.0.1:{args.telegraph_port}",
+        TELEGRAPH_ACCESS_TOKEN='benchmark',
+        TELEGRAPH_TOKENS_PATH='',
+        DEDUP_CACHE_PATH=os.path.join(scratch, 'dedup.sqlite3'),
+        DEAD_LETTER_PATH=os.path.join(scratch, 'dead_letters.jsonl'),
+        JOB_JOURNAL_PATH=os.path.join(scratch, 'jobs.sqlite3'),
+        METRICS_PORT=str(args.metrics_port),
+        STARTUP_WARMUP='true' if warm_up else 'false'
+    )
+    code = "from bot import start_bot; start_bot('polling')"
+    return subprocess.Popen([sys.executable, '-c', code], cwd=REPO_ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def read_phases(url: str) -> dict:
+    """Read m2t_startup_seconds from the bot's metrics endpoint"""
+    async with ClientSession() as session:
+        async with session.get(url) as response:
+            text = await response.text()
+    return {phase: float(value) for phase, value in re.findall(r'^m2t_startup_seconds\{phase="([^"]+)"\} (\S+)',
+                                                               text, re.MULTILINE)}
+
+async def time_to_ready(args, warm_up: bool) -> dict:
+    """Start the bot once, returns the seconds until it polled and its phases"""
+    api = FakeBotApi(port=args.api_port, latency=args.latency_ms / 1000)
+    telegraph = FakeTelegraph(port=args.telegraph_port, latency=args.latency_ms / 1000)
+    await api.start()
+    await telegraph.start()
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            started = time.perf_counter()
+            process = start_bot_process(args, scratch, warm_up)
+            try:
+                while not api.calls.get('getUpdates'):
+                    if process.poll() is not None or time.perf_counter() - started > 60:
+                        raise RuntimeError("The bot did not start")
+                    await asyncio.sleep(0.002)
+                ready = time.perf_counter() - started
+                phases = await read_phases(f"http://127.0.0.1:{args.metrics_port}/metrics")
+            finally:
+                process.send_signal(signal.SIGINT)
+                try:
+                    # Waited for in a thread so the fakes can answer the bot's shutdown calls
+                    await asyncio.to_thread(process.wait, 30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+    finally:
+        await api.stop()
+        await telegraph.stop()
+    return {'ready': ready, 'phases': phases}
+
+async def report_ready(args) -> float:
+    """Print time to ready with and without warm-up, returns the warm-up median in milliseconds"""
+    print(f"time to first getUpdates, {args.latency_ms:g}ms per Bot API request")
+    medians = {}
+    for warm_up in (False, True):
+        runs = [await time_to_ready(args, warm_up) for _ in range(args.runs)]
+        median = statistics.median(run['ready'] for run in runs)
+        medians[warm_up] = median
+        names = sorted(runs[0]['phases'], key=lambda phase: PHASES.index(phase) if phase in PHASES else len(PHASES))
+        phases = {phase: statistics.median(run['phases'].get(phase, 0) for run in runs) for phase in names}
+        breakdown = ', '.join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in phases.items())
+        print(f"  warm-up {'on ' if warm_up else 'off'}  {median * 1000:6.0f}ms median of {args.runs}  ({breakdown})")
+    print()
+    return medians[True] * 1000
+
+async def main(args) -> int:
+    failed = False
+    import_ms = report_imports(args.module, args.runs, args.top)
+    if args.max_import_ms and import_ms > args.max_import_ms:
+        print(f"FAIL: import took {import_ms:.0f}ms, budget {args.max_import_ms:g}ms")
+        failed = True
+
+    if not args.skip_ready:
+        ready_ms = await report_ready(args)
+        if args.max_ready_ms and ready_ms > args.max_ready_ms:
+            print(f"FAIL: ready after {ready_ms:.0f}ms, budget {args.max_ready_ms:g}ms")
+            failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--module', default='bot', help="Module whose import is profiled")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="Modules listed per ranking")
+    parser.add_argument('--latency-ms', type=float, default=150, help="Latency of every fake Bot API request")
+    parser.add_argument('--max-import-ms', type=float, default=0, help="Import time budget, 0 for none")
+    parser.add_argument('--max-ready-ms', type=float, default=0, help="Time to ready budget with warm-up, 0 for none")
+    parser.add_argument('--skip-ready', action='store_true', help="Only profile the imports")
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--telegraph-port', type=int, default=8082)
+    parser.add_argument('--metrics-port', type=int, default=9191)
+    sys.exit(asyncio.run(main(parser.parse_args())))
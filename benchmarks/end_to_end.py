@@ -0,0 +1,322 @@
+"""
+End-to-end load test of the bot against local Bot API and Telegraph fakes
+
+The bot runs in a child process through main.py, exactly as in
+production, polling the fake Bot API. A synthetic stream of photos, videos
+and documents of mixed sizes is delivered to it, and each update is timed
+from delivery until its final status message. The child's RSS and open file
+descriptors are sampled throughout. Results are saved as JSON and can be
+compared with an earlier run.
+
+Run from the repository root:
+
+    python -m benchmarks.end_to_end --updates 200 --concurrency 20 --label baseline
+    python -m benchmarks.end_to_end --updates 200 --concurrency 20 --compare benchmarks/results/baseline.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+from aiohttp import ClientSession
+from benchmarks.fakes import BOT_TOKEN, FakeBotApi, FakeTelegraph
+
+REPO_ROOT = Path(__file__).parent.parent
+RESULTS_DIR = REPO_ROOT / 'benchmarks' / 'results'
+
+# Leading bytes that make the content sniffer recognise each kind of file
+HEADERS = {
+    'jpeg': b'\xff\xd8\xff\xe0\x00\x10JFIF\x00',
+    'png': b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR',
+    'mp4': b'\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom',
+    'pdf': b'%PDF-1.7\n'
+}
+
+# Default size ranges in bytes per kind of update
+SIZES = {
+    'photo': (30 * 1024, 1536 * 1024),
+    'video': (512 * 1024, 12 * 1024 * 1024),
+    'document': (10 * 1024, 3 * 1024 * 1024)
+}
+
+# Reply prefixes that end an update, and the outcome they stand for
+FINAL_REPLIES = (('✅', 'success'), ('❌', 'error'), ('⚠️', 'deferred'), ('⏳ The bot is busy', 'busy'))
+
+def parse_size(text: str) -> int:
+    """Parse sizes like 512K or 2.5M"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper()
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def parse_mix(text: str) -> dict:
+    """Parse a mix like photo=6,video=2,document=2 into weights"""
+    mix = {}
+    for part in text.split(','):
+        kind, weight = part.split('=')
+        if kind not in SIZES:
+            raise argparse.ArgumentTypeError(f"Unknown update kind {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+def make_update(api: FakeBotApi, rng: random.Random, index: int, kind: str, scale: float) -> tuple:
+    """Register a synthetic file with the fake and build the update carrying it"""
+    low, high = SIZES[kind]
+    size = int(rng.uniform(low, high) * scale)
+    chat_id = 100000 + index
+    file_id = f"file{index:06d}"
+
+    if kind == 'photo':
+        header = HEADERS['jpeg']
+    elif kind == 'video':
+        header = HEADERS['mp4']
+    else:
+        header = HEADERS['png'] if rng.random() < 0.5 else HEADERS['pdf']
+    data = header + rng.randbytes(max(size - len(header), 0))
+    api.files[file_id] = data
+
+    file_fields = {'file_id': file_id, 'file_unique_id': f"u{file_id}", 'file_size': len(data)}
+    if kind == 'photo':
+        fields = {'photo': [dict(file_fields, width=1280, height=960)]}
+    elif kind == 'video':
+        fields = {'video': dict(file_fields, width=1280, height=720, duration=10,
+                                mime_type='video/mp4', file_name=f"{file_id}.mp4")}
+    else:
+        extension, mime_type = ('png', 'image/png') if header == HEADERS['png'] else ('pdf', 'application/pdf')
+        fields = {'document': dict(file_fields, file_name=f"{file_id}.{extension}", mime_type=mime_type)}
+    return chat_id, len(data), api.message_update(chat_id, **fields)
+
+def final_outcome(replies: list):
+    """Return (time, outcome) of the reply that ended an update, or None"""
+    for timestamp, text in replies:
+        for prefix, outcome in FINAL_REPLIES:
+            if text.startswith(prefix):
+                return timestamp, outcome
+    return None
+
+def read_process(pid: int) -> tuple:
+    """Current RSS in bytes and open file descriptors of a process and its children"""
+    rss = fds = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children:
+            pids += [int(child) for child in children.read().split()]
+    except OSError:
+        pass
+    for process in pids:
+        try:
+            with open(f"/proc/{process}/status") as status:
+                match = re.search(r'^VmRSS:\s+(\d+) kB', status.read(), re.MULTILINE)
+            rss += int(match.group(1)) * 1024 if match else 0
+            fds += len(os.listdir(f"/proc/{process}/fd"))
+        except (OSError, AttributeError):
+            pass
+    return rss, fds
+
+async def sample_process(pid: int, peaks: dict, interval: float = 0.05) -> None:
+    """Track the peak RSS and file descriptor count of the bot"""
+    while True:
+        rss, fds = read_process(pid)
+        peaks['rss'] = max(peaks['rss'], rss)
+        peaks['fds'] = max(peaks['fds'], fds)
+        await asyncio.sleep(interval)
+
+def percentiles(values: list) -> dict:
+    """Latency percentiles in milliseconds"""
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)
+    return {'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99), 'max': round(values[-1] * 1000, 2)}
+
+async def scrape_stages(metrics_url: str) -> dict:
+    """Mean latency per pipeline stage from the bot's metrics endpoint"""
+    try:
+        async with ClientSession() as session:
+            async with session.get(metrics_url) as response:
+                text = await response.text()
+    except Exception:
+        return {}
+    totals = {'sum': {}, 'count': {}}
+    pattern = r'^m2t_stage_latency_seconds_(sum|count)\{[^}]*stage="([^"]+)"[^}]*\} (\S+)'
+    for kind, stage, value in re.findall(pattern, text, re.MULTILINE):
+        totals[kind][stage] = totals[kind].get(stage, 0) + float(value)
+    sums, counts = totals['sum'], totals['count']
+    return {stage: round(sums[stage] / counts[stage] * 1000, 2) for stage in sums if counts.get(stage)}
+
+def start_bot_process(args, scratch: str, log_file) -> subprocess.Popen:
+    """Run main.py in a child process wired to the fakes"""
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=BOT_TOKEN,
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+        TELEGRAM_LOCAL_MODE='true' if args.local else 'false',
+        TELEGRAPH_UPLOAD_URL=f"http://127.0.0.1:{args.telegraph_port}/upload",
+        TELEGRAPH_API_URL=f"http://127.0.0.1:{args.telegraph_port}",
+        TELEGRAPH_ACCESS_TOKEN='benchmark',
+        TELEGRAPH_TOKENS_PATH='',
+        DEDUP_CACHE_PATH=os.path.join(scratch, 'dedup.sqlite3'),
+        DEAD_LETTER_PATH=os.path.join(scratch, 'dead_letters.jsonl'),
+        JOB_JOURNAL_PATH=os.path.join(scratch, 'jobs.sqlite3'),
+        METRICS_PORT=str(args.metrics_port),
+        PYTHONUNBUFFERED='1'
+    )
+    command = [sys.executable, 'main.py', '--mode', 'polling', '--transfer-workers', str(args.transfer_workers)]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env,
+                            stdout=log_file, stderr=subprocess.STDOUT)
+
+async def run(args) -> dict:
+    """Run the load test and collect the results"""
+    api = FakeBotApi(port=args.api_port, latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate)
+    telegraph = FakeTelegraph(port=args.telegraph_port, latency=args.latency, bandwidth=args.bandwidth,
+                              error_rate=args.error_rate)
+    await api.start()
+    await telegraph.start()
+
+    with tempfile.TemporaryDirectory() as scratch, open(os.path.join(scratch, 'bot.log'), 'w+') as log_file:
+        if args.local:
+            api.local_dir = os.path.join(scratch, 'telegram-bot-api')
+        process = start_bot_process(args, scratch, log_file)
+        peaks = {'rss': 0, 'fds': 0}
+        sampler = asyncio.create_task(sample_process(process.pid, peaks))
+        try:
+            # Wait until the bot polls for updates
+            started_waiting = time.monotonic()
+            while not api.calls.get('getUpdates'):
+                if process.poll() is not None or time.monotonic() - started_waiting > 60:
+                    log_file.seek(0)
+                    raise RuntimeError(f"The bot did not start:\n{log_file.read()[-3000:]}")
+                await asyncio.sleep(0.05)
+            idle = read_process(process.pid)
+
+            rng = random.Random(args.seed)
+            kinds = list(args.mix)
+            weights = [args.mix[kind] for kind in kinds]
+            slots = asyncio.Semaphore(args.concurrency)
+            results = []
+
+            async def one(index):
+                kind = rng.choices(kinds, weights)[0]
+                chat_id, size, update = make_update(api, rng, index, kind, args.size_scale)
+                async with slots:
+                    delivered = time.perf_counter()
+                    await api.deliver(update)
+                    final = None
+                    while final is None and time.perf_counter() - delivered < args.timeout:
+                        await asyncio.sleep(0.005)
+                        final = final_outcome(api.replies.get(chat_id, []))
+                if final is None:
+                    results.append({'kind': kind, 'size': size, 'outcome': 'timeout', 'latency': None})
+                else:
+                    results.append({'kind': kind, 'size': size, 'outcome': final[1], 'latency': final[0] - delivered})
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(index) for index in range(args.updates)))
+            elapsed = time.perf_counter() - started
+            stages = await scrape_stages(f"http://127.0.0.1:{args.metrics_port}/metrics") if args.metrics_port else {}
+        finally:
+            sampler.cancel()
+            process.send_signal(signal.SIGINT)
+            try:
+                # Waited for in a thread so the fakes can answer the bot's shutdown calls
+                await asyncio.to_thread(process.wait, 30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            await api.stop()
+            await telegraph.stop()
+
+    outcomes = {}
+    for result in results:
+        outcomes[result['outcome']] = outcomes.get(result['outcome'], 0) + 1
+    done = [result for result in results if result['outcome'] == 'success']
+    return {
+        'updates': len(results),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_updates_s': round(len(done) / elapsed, 2),
+        'throughput_mb_s': round(sum(result['size'] for result in done) / elapsed / 1024 ** 2, 2),
+        'outcomes': outcomes,
+        'latency_ms': percentiles([result['latency'] for result in done]),
+        'latency_ms_by_kind': {
+            kind: percentiles([result['latency'] for result in done if result['kind'] == kind]) for kind in args.mix
+        },
+        'idle_rss_mb': round(idle[0] / 1024 ** 2, 1),
+        'peak_rss_mb': round(peaks['rss'] / 1024 ** 2, 1),
+        'idle_fds': idle[1],
+        'peak_fds': peaks['fds'],
+        'stage_mean_ms': stages,
+        'injected_errors': api.errors + telegraph.errors
+    }
+
+def git_revision() -> str:
+    """Commit the benchmark ran on, if known"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(current: dict, previous: dict) -> None:
+    """Print the change of the headline numbers against an earlier run"""
+    print(f"\nCompared with {previous.get('label')} ({previous.get('revision')}, {previous.get('time')}):")
+    rows = [
+        (name, current['results'][name], previous['results'][name])
+        for name in ('throughput_updates_s', 'throughput_mb_s', 'peak_rss_mb', 'peak_fds')
+    ]
+    for name in ('p50', 'p90', 'p99'):
+        rows.append((f"latency_{name}_ms", current['results']['latency_ms'].get(name),
+                     previous['results']['latency_ms'].get(name)))
+    for name, now, before in rows:
+        if now is None or not before:
+            continue
+        print(f"  {name:22} {before:10.2f} -> {now:10.2f} ({100 * (now - before) / before:+6.1f}%)")
+
+def main(args) -> None:
+    results = asyncio.run(run(args))
+    report = {
+        'label': args.label,
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('compare', 'output')},
+        'results': results
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{args.label}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"\nSaved to {output}")
+
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20, help="Updates in flight at once")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('photo=6,video=2,document=2'),
+                        help="Relative weights of update kinds (default: photo=6,video=2,document=2)")
+    parser.add_argument('--size-scale', type=float, default=1.0, help="Multiply the default file sizes")
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds per fake API request")
+    parser.add_argument('--bandwidth', type=parse_size, default=0, help="Bytes per second per transfer, e.g. 10M")
+    parser.add_argument('--error-rate', type=float, default=0, help="Fraction of fake requests that fail")
+    parser.add_argument('--transfer-workers', type=int, default=0)
+    parser.add_argument('--local', action='store_true',
+                        help="Hand out files like a local telegram-bot-api server, by path instead of over HTTP")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds to wait for each update")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--telegraph-port', type=int, default=8082)
+    parser.add_argument('--metrics-port', type=int, default=9191, help="Bot metrics port, 0 to skip stage timings")
+    parser.add_argument('--label', default=datetime.now().strftime('%Y%m%d-%H%M%S'))
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/<label>.json)")
+    parser.add_argument('--compare', help="Earlier result file to compare with")
+    main(parser.parse_args())
@@ -0,0 +1,326 @@
+"""
+Local stand-ins for the Telegram Bot API and Telegraph used by the benchmarks
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import itertools
+from aiohttp import web, ClientSession
+
+BOT_TOKEN = '123456:BENCHMARK'
+
+# Size of the pieces throttled bodies are sent and received in
+THROTTLE_CHUNK_SIZE = 64 * 1024
+
+async def _send_throttled(request, data: bytes, bandwidth: float, headers: dict = None,
+                          status: int = 200) -> web.StreamResponse:
+    """Send a body no faster than bandwidth bytes per second (0 for no limit)"""
+    response = web.StreamResponse(status=status, headers=headers)
+    response.content_length = len(data)
+    await response.prepare(request)
+    for start in range(0, len(data), THROTTLE_CHUNK_SIZE):
+        chunk = data[start:start + THROTTLE_CHUNK_SIZE]
+        await response.write(chunk)
+        if bandwidth:
+            await asyncio.sleep(len(chunk) / bandwidth)
+    await response.write_eof()
+    return response
+
+async def _read_params(request) -> dict:
+    """Read Bot API parameters sent as JSON, form or query data"""
+    if request.content_type == 'application/json':
+        params = await request.json()
+    else:
+        params = dict(await request.post())
+        params.update(request.query)
+    for key, value in params.items():
+        if isinstance(value, str):
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                pass
+    return params
+
+class FakeBotApi:
+    """
+    Minimal Bot API server supporting polling and webhook delivery
+
+    Every outgoing sendMessage/editMessageText is timestamped so the
+    benchmarks can measure end-to-end latency per chat. Latency applies to
+    every method but getUpdates; failures are only injected into getFile
+    and file downloads. The bot retries both with backoff behind the
+    telegram circuit breaker and dead-letters jobs that still fail.
+
+    With local_dir set it behaves like telegram-bot-api started with
+    --local: getFile stores the file in that directory and returns its
+    absolute path, and files are not served over HTTP.
+
+    File downloads honor Range requests unless ranges is False. Bandwidth
+    is a per-connection limit, like the window-bound throughput of one TCP
+    stream over a long round trip.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind
+        latency: Seconds each request takes
+        bandwidth: File download speed in bytes per second, 0 for no limit
+        error_rate: Fraction of getFile calls and downloads answered with HTTP 500
+        local_dir: Directory files are stored in for local mode, None to serve them
+        ranges: Answer Range requests with 206 Partial Content
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081, latency: float = 0,
+                 bandwidth: float = 0, error_rate: float = 0, local_dir: str = None, ranges: bool = True):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.local_dir = os.path.abspath(local_dir) if local_dir else None
+        self.ranges = ranges
+        self.errors = 0
+        self._random = random.Random(1)
+        self.updates = asyncio.Queue()
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.replies = {}
+        self.calls = {}
+        self.files = {}
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._runner = None
+        self._client = None
+
+    @property
+    def base_url(self) -> str:
+        """Value for ApplicationBuilder.base_url"""
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        """Value for ApplicationBuilder.base_file_url"""
+        return f"http://{self.host}:{self.port}/file/bot"
+
+    def _message(self, chat_id: int, **fields) -> dict:
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User', 'username': f"user{chat_id}"}
+        }
+        message.update(fields)
+        return message
+
+    def _fail(self) -> bool:
+        """Decide whether to inject a failure"""
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    async def _handle_method(self, request):
+        method = request.match_info['method']
+        params = await _read_params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method != 'getUpdates' and self.latency:
+            await asyncio.sleep(self.latency)
+        if method == 'getFile' and self._fail():
+            return web.json_response({'ok': False, 'error_code': 500, 'description': 'Internal Server Error'},
+                                     status=500)
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif method == 'getUpdates':
+            result = await self._get_updates(float(params.get('timeout', 0)))
+        elif method == 'setWebhook':
+            self.webhook_url = params.get('url') or None
+            self.webhook_secret = params.get('secret_token')
+            result = True
+        elif method in ('deleteWebhook', 'setMyCommands'):
+            self.webhook_url = None
+            result = True
+        elif method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params['chat_id'])
+            self.replies.setdefault(chat_id, []).append((time.perf_counter(), params.get('text', '')))
+            result = self._message(chat_id, text=params.get('text', ''))
+        elif method == 'getFile':
+            file_id = params['file_id']
+            result = {
+                'file_id': file_id,
+                'file_unique_id': file_id,
+                'file_size': len(self.files.get(file_id, b'')),
+                'file_path': self._store_local(file_id) if self.local_dir else f"files/{file_id}"
+            }
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    def _store_local(self, file_id: str) -> str:
+        """Write a file to the local directory like a --local server does, returning its path"""
+        path = os.path.join(self.local_dir, 'documents', file_id)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(self.files.get(file_id, b''))
+        return path
+
+    async def _get_updates(self, timeout: float) -> list:
+        try:
+            first = await asyncio.wait_for(self.updates.get(), timeout or 0.01)
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        while not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return batch
+
+    async def _handle_file(self, request):
+        file_id = request.match_info['path'].rsplit('/', 1)[-1]
+        data = self.files.get(file_id)
+        if data is None or self.local_dir:
+            return web.Response(status=404)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._fail():
+            return web.Response(status=500)
+        if not self.ranges or 'Range' not in request.headers:
+            headers = {'Accept-Ranges': 'bytes'} if self.ranges else None
+            return await _send_throttled(request, data, self.bandwidth, headers)
+
+        try:
+            start, stop, _ = request.http_range.indices(len(data))
+        except ValueError:
+            return web.Response(status=416)
+        if start >= stop:
+            return web.Response(status=416, headers={'Content-Range': f"bytes */{len(data)}"})
+        headers = {'Accept-Ranges': 'bytes', 'Content-Range': f"bytes {start}-{stop - 1}/{len(data)}"}
+        return await _send_throttled(request, memoryview(data)[start:stop], self.bandwidth, headers, status=206)
+
+    def message_update(self, chat_id: int, **fields) -> dict:
+        """
+        Build an update carrying a new message
+
+        Args:
+            chat_id: Chat (and user) ID of the sender
+            **fields: Extra message fields such as text, photo or document
+
+        Returns:
+            The update as a dict
+        """
+        return {'update_id': next(self._update_ids), 'message': self._message(chat_id, **fields)}
+
+    async def deliver(self, update: dict) -> None:
+        """
+        Hand an update to the bot through the active delivery mode
+
+        Args:
+            update: Update dict
+        """
+        if self.webhook_url is None:
+            await self.updates.put(update)
+            return
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret or ''}
+        async with self._client.post(self.webhook_url, json=update, headers=headers) as response:
+            response.raise_for_status()
+
+    async def start(self) -> None:
+        """Start serving"""
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_route('*', '/bot{token}/{method}', self._handle_method)
+        app.router.add_get('/file/bot{token}/{path:.*}', self._handle_file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._client = ClientSession()
+
+    async def stop(self) -> None:
+        """Stop serving"""
+        await self._client.close()
+        await self._runner.cleanup()
+
+class FakeTelegraph:
+    """
+    Minimal Telegraph server: the upload endpoint and createPage
+
+    Args:
+        host: Interface to bind
+        port: Port to bind
+        latency: Seconds each request takes
+        bandwidth: Upload speed in bytes per second, 0 for no limit
+        error_rate: Fraction of requests answered with HTTP 500
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8082, latency: float = 0,
+                 bandwidth: float = 0, error_rate: float = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.errors = 0
+        self._random = random.Random(2)
+        self.uploads = []
+        self.pages = []
+        self._file_ids = itertools.count(1)
+        self._runner = None
+
+    @property
+    def upload_url(self) -> str:
+        """Value for TELEGRAPH_UPLOAD_URL"""
+        return f"http://{self.host}:{self.port}/upload"
+
+    @property
+    def api_url(self) -> str:
+        """Value for TELEGRAPH_API_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    def _fail(self) -> bool:
+        """Decide whether to inject a failure"""
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    async def _handle_upload(self, request):
+        await asyncio.sleep(self.latency)
+        reader = await request.multipart()
+        part = await reader.next()
+        size = 0
+        while True:
+            chunk = await part.read_chunk(THROTTLE_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if self.bandwidth:
+                await asyncio.sleep(len(chunk) / self.bandwidth)
+        if self._fail():
+            return web.Response(status=500)
+
+        file_name = part.filename or 'file'
+        self.uploads.append((file_name, part.headers.get('Content-Type'), size))
+        extension = file_name.rsplit('.', 1)[-1] if '.' in file_name else 'bin'
+        return web.json_response([{'src': f"/file/{next(self._file_ids):08x}.{extension}"}])
+
+    async def _handle_create_page(self, request):
+        await asyncio.sleep(self.latency)
+        if self._fail():
+            return web.Response(status=500)
+        params = await _read_params(request)
+        path = f"page-{len(self.pages) + 1}"
+        self.pages.append({'path': path, 'title': params.get('title'), 'content': params.get('content')})
+        return web.json_response({'ok': True, 'result': {'path': path, 'url': f"https://telegra.ph/{path}"}})
+
+    async def start(self) -> None:
+        """Start serving"""
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post('/upload', self._handle_upload)
+        app.router.add_post('/createPage', self._handle_create_page)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        """Stop serving"""
+        await self._runner.cleanup()
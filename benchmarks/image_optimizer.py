@@ -0,0 +1,92 @@
+"""
+Measure the image optimizer over a corpus of sample images
+
+Point --corpus at a directory of images, or leave it out to generate a
+synthetic corpus of photos and screenshots in several formats. Requires
+Pillow.
+
+Run from the repository root:
+
+    python -m benchmarks.image_optimizer --corpus ~/Pictures --workers 4
+"""
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from PIL import Image, ImageDraw, ImageFilter
+from utils.image_optimizer import (
+    IMAGE_JPEG_QUALITY, IMAGE_MAX_DIMENSION, detect_image_format, optimize_image_bytes
+)
+
+def generate_corpus(directory: Path, count: int) -> None:
+    """Write synthetic photo-like and screenshot-like images"""
+    rng = random.Random(42)
+    formats = [('JPEG', '.jpg'), ('PNG', '.png'), ('BMP', '.bmp'), ('WEBP', '.webp'), ('TIFF', '.tiff')]
+    for index in range(count):
+        width, height = rng.choice([(1280, 960), (3000, 2000), (4032, 3024), (1920, 1080)])
+        image = Image.effect_noise((width // 4, height // 4), rng.randint(20, 80)).resize((width, height))
+        image = Image.merge('RGB', (image, image.filter(ImageFilter.GaussianBlur(3)), image.transpose(Image.FLIP_LEFT_RIGHT)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(30):
+            x, y = rng.randrange(width), rng.randrange(height)
+            draw.rectangle((x, y, x + rng.randrange(400), y + rng.randrange(300)),
+                           fill=tuple(rng.randrange(256) for _ in range(3)))
+        image_format, extension = formats[index % len(formats)]
+        options = {'quality': 95} if image_format in ('JPEG', 'WEBP') else {}
+        image.save(directory / f"sample_{index}{extension}", image_format, **options)
+
+def optimize_file(path: Path) -> tuple:
+    """Optimize one file and time it, returns (name, format, before, after, seconds)"""
+    data = path.read_bytes()
+    start = time.perf_counter()
+    optimized, image_format = optimize_image_bytes(data, IMAGE_MAX_DIMENSION, IMAGE_JPEG_QUALITY)
+    elapsed = time.perf_counter() - start
+    return path.name, image_format, len(data), len(optimized or data), elapsed
+
+async def run(paths: list, workers: int) -> tuple:
+    """Optimize every file in a process pool, returns (results, wall time)"""
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        # Warm the pool up so process start-up is not measured
+        await asyncio.gather(*(loop.run_in_executor(pool, time.sleep, 0) for _ in range(workers)))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(loop.run_in_executor(pool, optimize_file, path) for path in paths))
+        return results, time.perf_counter() - started
+
+async def main(args) -> None:
+    with tempfile.TemporaryDirectory() as scratch:
+        corpus = Path(args.corpus) if args.corpus else Path(scratch)
+        if not args.corpus:
+            print(f"Generating {args.count} sample images...")
+            generate_corpus(corpus, args.count)
+
+        paths = sorted(
+            path for path in corpus.iterdir()
+            if path.is_file() and detect_image_format(path.read_bytes()[:16])
+        )
+        results, wall = await run(paths, args.workers)
+
+    for name, image_format, before, after, elapsed in results:
+        print(f"{name:32} {image_format:5} {before / 1024:9.0f}KB -> {after / 1024:9.0f}KB "
+              f"({100 * (before - after) / before:5.1f}% saved) {elapsed * 1000:7.0f}ms")
+
+    before = sum(result[2] for result in results)
+    after = sum(result[3] for result in results)
+    times = sorted(result[4] for result in results)
+    print(
+        f"\n{len(results)} images, {before / 1024 ** 2:.1f}MB -> {after / 1024 ** 2:.1f}MB "
+        f"({100 * (before - after) / before:.1f}% saved), "
+        f"median {times[len(times) // 2] * 1000:.0f}ms/image, max {times[-1] * 1000:.0f}ms/image, "
+        f"{len(results) / wall:.1f} images/s with {args.workers} workers"
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', help="Directory of sample images (default: generate a synthetic corpus)")
+    parser.add_argument('--count', type=int, default=20, help="Number of synthetic images to generate")
+    parser.add_argument('--workers', type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
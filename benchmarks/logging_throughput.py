@@ -0,0 +1,119 @@
+"""
+Measure what logging costs the caller, with and without the queue pipeline
+
+Logs the same stream of records through the console, error and combined
+handlers, once called directly and once behind the queue handler with its
+background writer. Disk stalls can be simulated by sleeping in the file
+handlers every so often.
+
+Run from the repository root:
+
+    python -m benchmarks.logging_throughput --records 20000 --stall-ms 20 --stall-every 500
+"""
+import os
+import sys
+import time
+import queue
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from utils.logger import (
+    LOG_QUEUE_SIZE, BackgroundListener, DroppingQueueHandler, SamplingFilter, create_handlers
+)
+
+class StallingHandler(logging.Handler):
+    """Wrap a handler, sleeping every N records like a disk that stalls"""
+
+    def __init__(self, handler: logging.Handler, stall: float, every: int):
+        super().__init__(handler.level)
+        self.handler = handler
+        self.stall = stall
+        self.every = every
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+        if self.stall and self.count % self.every == 0:
+            time.sleep(self.stall)
+        self.handler.handle(record)
+
+def build_handlers(directory: Path, args) -> list:
+    """The bot's handlers with the console sent to /dev/null"""
+    formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        handlers = create_handlers(formatter, directory)
+    finally:
+        sys.stdout = stdout
+    return [StallingHandler(handler, args.stall_ms / 1000, args.stall_every) for handler in handlers]
+
+def run(mode: str, args) -> dict:
+    """Log the records in one mode, returns timings"""
+    with tempfile.TemporaryDirectory() as directory:
+        logger = logging.getLogger(f"benchmark.{mode}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handlers = build_handlers(Path(directory), args)
+        listener = queue_handler = None
+
+        if mode == 'queue':
+            queue_handler = DroppingQueueHandler(queue.Queue(args.queue_size))
+            queue_handler.addFilter(SamplingFilter(args.sample_every))
+            logger.addHandler(queue_handler)
+            listener = BackgroundListener(queue_handler.queue, *handlers, respect_handler_level=True)
+            listener.start()
+        else:
+            sampler = SamplingFilter(args.sample_every)
+            for handler in handlers:
+                handler.addFilter(sampler)
+                logger.addHandler(handler)
+
+        latencies = []
+        started = time.perf_counter()
+        for index in range(args.records):
+            call_started = time.perf_counter()
+            if index % 100 == 99:
+                logger.warning("Status update failed for chat %s: %s", index, 'timed out')
+            else:
+                logger.info("Media uploaded to Telegraph: %s", f"https://telegra.ph/file/{index:032x}.jpg")
+            latencies.append(time.perf_counter() - call_started)
+        caller = time.perf_counter() - started
+
+        if listener:
+            listener.stop()
+        total = time.perf_counter() - started
+        for handler in handlers:
+            handler.handler.close()
+
+    latencies.sort()
+    return {
+        'caller': caller,
+        'total': total,
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[int(len(latencies) * 0.99)],
+        'max': latencies[-1],
+        'dropped': queue_handler.dropped if queue_handler else 0
+    }
+
+def main(args) -> None:
+    print(f"{args.records} records, stall {args.stall_ms}ms every {args.stall_every} writes per handler, "
+          f"info sampling 1/{args.sample_every}\n")
+    for mode in ('direct', 'queue'):
+        result = run(mode, args)
+        print(
+            f"{mode:7} caller {args.records / result['caller']:9.0f} records/s, "
+            f"p50 {result['p50'] * 1e6:6.1f}us, p99 {result['p99'] * 1e6:8.1f}us, "
+            f"max {result['max'] * 1000:6.1f}ms, all written after {result['total']:.2f}s, "
+            f"{result['dropped']} dropped"
+        )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--stall-ms', type=float, default=0, help="Simulated disk stall in milliseconds")
+    parser.add_argument('--stall-every', type=int, default=500, help="Stall once every this many writes")
+    parser.add_argument('--sample-every', type=int, default=1, help="Keep one in N info records per message")
+    parser.add_argument('--queue-size', type=int, default=LOG_QUEUE_SIZE)
+    main(parser.parse_args())
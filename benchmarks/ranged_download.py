@@ -0,0 +1,91 @@
+"""
+Compare single-stream and ranged downloads from a throttled file server
+
+Files of random bytes are served by the fake Bot API with a bandwidth
+limit per connection and a latency per request, like a long-distance link
+where one TCP stream cannot fill the pipe. Each file is downloaded with the
+sequential download_to_fileobj, with download_ranged, and with
+download_ranged against a server that ignores Range, which has to fall
+back to a single stream. Every download is checked against the original.
+
+Run from the repository root:
+
+    python -m benchmarks.ranged_download --sizes 4,16,64 --bandwidth-mb 4 --latency-ms 80
+"""
+import os
+import time
+import asyncio
+import hashlib
+import argparse
+import tempfile
+from benchmarks.fakes import BOT_TOKEN, FakeBotApi
+from utils.file_handler import download_to_fileobj, hash_file
+from utils.http_client import close_http_session
+from utils.ranged_download import (
+    RANGED_DOWNLOAD_MAX_CHUNK, RANGED_DOWNLOAD_MAX_PARALLEL, RANGED_DOWNLOAD_MIN_CHUNK,
+    RANGED_DOWNLOAD_SEGMENT_SECONDS, download_ranged
+)
+
+async def download(mode: str, url: str, path: str, args) -> dict:
+    """Download url to path in one mode, returns the transfer stats"""
+    if mode == 'single':
+        with open(path, 'wb') as f:
+            await download_to_fileobj(url, f)
+        return {'mode': 'single', 'connections': 1, 'segments': 1, 'chunk_size': 0}
+    return await download_ranged(
+        url, path, max_parallel=args.max_parallel, min_chunk=args.min_chunk, max_chunk=args.max_chunk,
+        segment_seconds=args.segment_seconds
+    )
+
+async def main(args) -> None:
+    servers = {
+        'ranges': FakeBotApi(port=args.port, latency=args.latency_ms / 1000,
+                             bandwidth=args.bandwidth_mb * 1024 * 1024),
+        'no ranges': FakeBotApi(port=args.port + 1, latency=args.latency_ms / 1000,
+                                bandwidth=args.bandwidth_mb * 1024 * 1024, ranges=False)
+    }
+    runs = (('single', 'ranges'), ('ranged', 'ranges'), ('ranged', 'no ranges'))
+
+    print(f"{args.bandwidth_mb} MB/s per connection, {args.latency_ms}ms per request, "
+          f"up to {args.max_parallel} connections\n")
+    for server in servers.values():
+        await server.start()
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            for size_mb in args.sizes:
+                data = os.urandom(int(size_mb * 1024 * 1024))
+                expected = hashlib.sha256(data).hexdigest()
+                for server in servers.values():
+                    server.files['bench'] = data
+
+                for mode, server_name in runs:
+                    url = f"{servers[server_name].base_file_url}{BOT_TOKEN}/documents/bench"
+                    path = os.path.join(scratch, 'download')
+                    started = time.perf_counter()
+                    stats = await download(mode, url, path, args)
+                    elapsed = time.perf_counter() - started
+                    ok = hash_file(path, hashlib.sha256()).hexdigest() == expected
+                    print(
+                        f"{size_mb:6g} MB  {mode:6} / {server_name:9}  {elapsed:7.2f}s  "
+                        f"{size_mb / elapsed:7.2f} MB/s  {stats['mode']:6}  "
+                        f"{stats['connections']} conn  {stats['segments']:3} segments  "
+                        f"last segment {stats['chunk_size'] / 1024 / 1024:5.1f} MB  {'ok' if ok else 'CORRUPT'}"
+                    )
+                print()
+    finally:
+        await close_http_session()
+        for server in servers.values():
+            await server.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=lambda text: [float(size) for size in text.split(',')], default=[4, 16, 64],
+                        help="Comma separated file sizes in MB")
+    parser.add_argument('--bandwidth-mb', type=float, default=4, help="Bandwidth per connection in MB/s")
+    parser.add_argument('--latency-ms', type=float, default=80, help="Latency added to every request")
+    parser.add_argument('--max-parallel', type=int, default=RANGED_DOWNLOAD_MAX_PARALLEL)
+    parser.add_argument('--min-chunk', type=int, default=RANGED_DOWNLOAD_MIN_CHUNK)
+    parser.add_argument('--max-chunk', type=int, default=RANGED_DOWNLOAD_MAX_CHUNK)
+    parser.add_argument('--segment-seconds', type=float, default=RANGED_DOWNLOAD_SEGMENT_SECONDS)
+    parser.add_argument('--port', type=int, default=8091, help="Port of the fake server, the next one is used too")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,119 @@
+"""
+Compare end-to-end update latency of polling and webhook delivery
+
+Run from the repository root:
+
+    python -m benchmarks.webhook_vs_polling --updates 500 --concurrency 20
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+
+# The webhook settings are read at import time
+os.environ.setdefault('WEBHOOK_URL', 'http://127.0.0.1:8444')
+os.environ.setdefault('WEBHOOK_PORT', '8444')
+os.environ.setdefault('WEBHOOK_SECRET', 'benchmark-secret')
+
+from telegram.ext import Application, CommandHandler
+from bot import start_command
+from benchmarks.fakes import BOT_TOKEN, FakeBotApi
+from utils.webhook import ALLOWED_UPDATES, WEBHOOK_PORT, WEBHOOK_SECRET, serve_webhook
+
+def build_application(api: FakeBotApi) -> Application:
+    """Create an Application talking to the fake Bot API"""
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(api.base_url)
+        .base_file_url(api.base_file_url)
+        .concurrent_updates(True)
+        .build()
+    )
+    application.add_handler(CommandHandler("start", start_command))
+    return application
+
+async def drive(api: FakeBotApi, updates: int, concurrency: int) -> list:
+    """
+    Send /start updates and wait for every reply
+
+    Args:
+        api: The fake Bot API
+        updates: Number of updates to send
+        concurrency: Number of updates in flight at once
+
+    Returns:
+        List of latencies in seconds
+    """
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(chat_id):
+        async with slots:
+            started = time.perf_counter()
+            await api.deliver(api.message_update(
+                chat_id, text='/start', entities=[{'type': 'bot_command', 'offset': 0, 'length': 6}]
+            ))
+            while chat_id not in api.replies:
+                await asyncio.sleep(0.001)
+            latencies.append(api.replies[chat_id][0][0] - started)
+
+    await asyncio.gather(*(one(1000 + i) for i in range(updates)))
+    return latencies
+
+async def run_polling(api: FakeBotApi, updates: int, concurrency: int) -> list:
+    """Measure latencies with long polling"""
+    application = build_application(api)
+    await application.initialize()
+    await application.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=ALLOWED_UPDATES)
+    await application.start()
+    try:
+        return await drive(api, updates, concurrency)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+async def run_webhook(api: FakeBotApi, updates: int, concurrency: int) -> list:
+    """Measure latencies with the webhook server"""
+    application = build_application(api)
+    stop = asyncio.Event()
+    server = asyncio.create_task(serve_webhook(application, WEBHOOK_PORT, WEBHOOK_SECRET, stop_event=stop))
+    while not application.running or api.webhook_url is None:
+        await asyncio.sleep(0.01)
+    try:
+        return await drive(api, updates, concurrency)
+    finally:
+        stop.set()
+        await server
+        api.webhook_url = None
+
+def report(name: str, latencies: list, elapsed: float) -> None:
+    """Print latency percentiles"""
+    latencies = sorted(latencies)
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(
+        f"{name:8} n={len(latencies)} throughput={len(latencies) / elapsed:8.1f}/s "
+        f"p50={pick(0.50):7.2f}ms p90={pick(0.90):7.2f}ms p99={pick(0.99):7.2f}ms "
+        f"mean={statistics.mean(latencies) * 1000:7.2f}ms"
+    )
+
+async def main(args) -> None:
+    api = FakeBotApi(port=args.api_port)
+    await api.start()
+    try:
+        for name, runner in (('polling', run_polling), ('webhook', run_webhook)):
+            api.replies.clear()
+            started = time.perf_counter()
+            latencies = await runner(api, args.updates, args.concurrency)
+            report(name, latencies, time.perf_counter() - started)
+    finally:
+        await api.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--updates', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--api-port', type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
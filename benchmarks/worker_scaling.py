@@ -0,0 +1,103 @@
+"""
+Measure job throughput against the number of transfer worker processes
+
+Every job does some CPU work (JSON encoding and decoding, standing in for
+update parsing and image processing) followed by simulated network I/O.
+
+Run from the repository root:
+
+    python -m benchmarks.worker_scaling --jobs 400 --workers 0 1 2 4
+"""
+import json
+import time
+import asyncio
+import argparse
+from utils.scheduler import JobScheduler
+from utils.workers import WorkerPool
+
+# A payload roughly the size of a large update
+PAYLOAD = {'items': [{'id': i, 'name': f"file_{i}.jpg", 'size': i * 1024} for i in range(200)]}
+
+def cpu_work(rounds: int) -> None:
+    """Burn CPU the way parsing and encoding do"""
+    for _ in range(rounds):
+        json.loads(json.dumps(PAYLOAD))
+
+async def setup(index: int) -> dict:
+    """Worker state: the last sequence number seen per chat"""
+    return {}
+
+async def handle(state: dict, job: dict) -> None:
+    """Run one synthetic job and check per-chat ordering"""
+    chat_id = job['chat_id']
+    if job['seq'] < state.get(chat_id, -1):
+        print(f"out of order job for chat {chat_id}")
+    state[chat_id] = job['seq']
+    cpu_work(job['cpu_rounds'])
+    await asyncio.sleep(job['io_seconds'])
+
+async def teardown(state: dict) -> None:
+    pass
+
+def make_jobs(args) -> list:
+    """Spread the jobs over the chats, numbered per chat"""
+    return [
+        {'chat_id': 1000 + i % args.chats, 'seq': i // args.chats,
+         'cpu_rounds': args.cpu_rounds, 'io_seconds': args.io_ms / 1000}
+        for i in range(args.jobs)
+    ]
+
+async def run_in_process(jobs: list) -> float:
+    """Run the jobs on the in-process scheduler"""
+    scheduler = JobScheduler(max_queue=len(jobs))
+    state = await setup(0)
+    started = time.perf_counter()
+    await scheduler.start()
+    for job in jobs:
+        scheduler.submit(job['chat_id'], lambda job=job: handle(state, job))
+    while scheduler.completed + scheduler.failed < len(jobs):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await scheduler.stop()
+    return elapsed
+
+async def run_pool(jobs: list, workers: int) -> float:
+    """Run the jobs on a pool of worker processes"""
+    pool = WorkerPool(workers, setup, handle, teardown, queue_size=len(jobs))
+    await pool.start()
+    # Give the workers time to import so start-up is not measured
+    while not all(state['alive'] for state in pool.health()):
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(1)
+
+    started = time.perf_counter()
+    for job in jobs:
+        pool.submit(job)
+    while pool.completed < len(jobs):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await pool.stop()
+    return elapsed
+
+async def main(args) -> None:
+    jobs = make_jobs(args)
+    baseline = None
+    for workers in args.workers:
+        if workers:
+            elapsed = await run_pool(jobs, workers)
+        else:
+            elapsed = await run_in_process(jobs)
+        rate = len(jobs) / elapsed
+        baseline = baseline or rate
+        label = f"{workers} workers" if workers else "in-process"
+        print(f"{label:12} jobs={len(jobs)} elapsed={elapsed:7.2f}s "
+              f"throughput={rate:8.1f}/s speedup={rate / baseline:5.2f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--jobs', type=int, default=400)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--cpu-rounds', type=int, default=40)
+    parser.add_argument('--io-ms', type=float, default=20)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    asyncio.run(main(parser.parse_args()))
@@ -2,19 +2,96 @@
 Telegram bot implementation for the Telegram to Telegraph Media Converter
 """
 import os
+import time
+import asyncio
 import tempfile
-from telegram import Update
+import functools
+import uuid
+from datetime import datetime, timezone
+from telegram import Bot, Chat, Message, Update
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, 
     filters, ContextTypes
 )
-from telegraph_client import upload_to_telegraph
-from utils.logger import get_logger
-from utils.file_handler import download_file
+from telegraph_client import (
+    upload_to_telegraph, stream_to_telegraph, stream_media, create_gallery_page, create_file_page,
+    open_media, convert_telegram_archive
+)
+from utils.logger import dropped_log_records, get_logger
+from utils.file_handler import (
+    TELEGRAM_API_URL, TELEGRAM_LOCAL_MODE, download_file, get_telegram_file, local_path, temp_dir, temp_prefix
+)
+from utils.http_client import init_http_session, close_http_session
+from utils.dedup_cache import get_dedup_cache
+from utils.content_type import UnsupportedContentError
+from utils.archive import ArchiveError, is_archive
+from utils.admission import BOT_API_DOWNLOAD_LIMIT, check_admission, select_photo
+from utils.upload_limits import is_uploadable, max_upload_size
+from utils.scheduler import get_scheduler, QueueFullError
+from utils.status import get_status_coalescer
+from utils.media_group import get_media_group_collector
+from utils.retry import get_breaker, is_transient
+from utils.dead_letter import get_dead_letter_queue
+from utils.job_journal import (
+    JOB_JOURNAL_MAX_AGE, JOB_JOURNAL_MAX_RECOVERIES, JOB_JOURNAL_RECOVERY_INTERVAL, close_job_journal,
+    current_job_id, get_job_journal, jobs_recovered, mark_stage, sweep_temp_files
+)
+from utils.webhook import ALLOWED_UPDATES, BOT_MODE, WEBHOOK_WORKERS, run_webhook
+from utils.image_optimizer import close_image_pool
+from utils.workers import TRANSFER_WORKERS, WorkerPool, get_worker_pool, set_worker_pool
+from utils.startup import WarmStartApplication, mark_phase, report_startup, warm_up
+from utils.metrics import (
+    METRICS_PORT, current_media_type, gauge, jobs_total, stage_timer, start_metrics_server, throughput
+)
 
 # Get logger
 logger = get_logger(__name__)
 
+# Pipe Telegram downloads straight into Telegraph uploads instead of temp files
+STREAM_TRANSFERS = os.getenv('STREAM_TRANSFERS', 'true').lower() == 'true'
+
+# Convert the media inside ZIP and TAR documents instead of linking the archive
+ARCHIVE_CONVERSION = os.getenv('ARCHIVE_CONVERSION', 'true').lower() == 'true'
+
+# Skipped files listed in an archive summary before the rest is summed up
+ARCHIVE_SUMMARY_LINES = 20
+
+# Dead-letter replay settings
+DEAD_LETTER_REPLAY_INTERVAL = float(os.getenv('DEAD_LETTER_REPLAY_INTERVAL', 60))
+DEAD_LETTER_MAX_REPLAYS = int(os.getenv('DEAD_LETTER_MAX_REPLAYS', 5))
+
+# Replies to files refused by admission control
+REJECTION_MESSAGES = {
+    'too_large': f"❌ Sorry, this file is too large. Bots can only download files up to "
+                 f"{BOT_API_DOWNLOAD_LIMIT // (1024 * 1024)} MB."
+}
+
+def _cache_stat(name: str):
+    """Read a dedup cache counter, or 0 when the cache is disabled"""
+    cache = get_dedup_cache()
+    return cache.stats()[name] if cache else 0
+
+# Runtime gauges read on every scrape
+gauge('m2t_jobs_in_flight', 'Jobs currently running', function=lambda: get_scheduler().in_flight)
+gauge('m2t_queue_depth', 'Jobs waiting in the scheduler queue', function=lambda: get_scheduler().queue_depth)
+gauge('m2t_queue_wait_seconds_max', 'Longest time a job waited in the queue',
+      function=lambda: get_scheduler().max_wait)
+gauge('m2t_dedup_cache_hits', 'Dedup cache hits', function=lambda: _cache_stat('hits'))
+gauge('m2t_dedup_cache_misses', 'Dedup cache misses', function=lambda: _cache_stat('misses'))
+gauge('m2t_dedup_cache_hit_ratio', 'Dedup cache hit ratio', function=lambda: _cache_stat('hit_rate'))
+gauge('m2t_status_calls_saved', 'Status edits skipped by the coalescer',
+      function=lambda: get_status_coalescer().calls_saved)
+gauge('m2t_worker_jobs_completed', 'Jobs finished by the transfer worker processes',
+      function=lambda: get_worker_pool().completed if get_worker_pool() else 0)
+gauge('m2t_worker_restarts', 'Transfer worker processes restarted by the health check',
+      function=lambda: get_worker_pool().restarts if get_worker_pool() else 0)
+gauge('m2t_jobs_journaled', 'Unfinished jobs in the job journal',
+      function=lambda: get_job_journal().pending() if get_job_journal() else 0)
+gauge('m2t_log_records_dropped', 'Log records dropped because the log queue was full',
+      function=dropped_log_records)
+gauge('m2t_breaker_open', 'Whether an endpoint circuit breaker is open', ('endpoint',),
+      function=lambda: {(name,): int(get_breaker(name).state != 'closed') for name in ('telegram', 'telegraph')})
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /start command"""
     user = update.effective_user
@@ -28,7 +105,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     )
     
     await update.message.reply_text(welcome_message)
-    logger.info(f"User {username} started the bot")
+    logger.info("User %s started the bot", username)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /help command"""
@@ -37,6 +114,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "1. Simply send any photo, video, or document to the bot\n"
         "2. The bot will upload it to Telegraph and send you the link\n"
         "3. You can share this link with anyone\n\n"
+        "To convert many files at once, send them as a ZIP or TAR archive. "
+        "All images and videos inside end up on gallery pages.\n\n"
         "Available commands:\n"
         "/start - Start the bot\n"
         "/help - Show this help message\n"
@@ -83,59 +162,369 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE, media
     
     # Get file information based on media type
     if media_type == 'photo':
-        # Get the largest photo (last in array)
-        photo = update.message.photo[-1]
+        # Get the largest photo variant worth transferring
+        photo = select_photo(update.message.photo)
         file_id = photo.file_id
+        file_unique_id = photo.file_unique_id
+        file_size = photo.file_size
         file_name = f"photo_{file_id}.jpg"
+        mime_type = None
     elif media_type == 'video':
         video = update.message.video
         file_id = video.file_id
+        file_unique_id = video.file_unique_id
+        file_size = video.file_size
         file_name = video.file_name or f"video_{file_id}.mp4"
+        mime_type = video.mime_type
     elif media_type == 'document':
         document = update.message.document
         file_id = document.file_id
+        file_unique_id = document.file_unique_id
+        file_size = document.file_size
         file_name = document.file_name or f"document_{file_id}"
+        mime_type = document.mime_type
     else:
         await update.message.reply_text("Sorry, I don't support this media type.")
         return
     
-    # Send processing message
-    processing_msg = await update.message.reply_text("⏳ Processing your media file...")
+    # Decide from the metadata alone whether the file is worth downloading
+    admission = check_admission(media_type, file_size)
     
-    try:
-        logger.info(f"Processing {media_type} from user {username}")
-        
-        # Update status message
-        await processing_msg.edit_text("⏳ Downloading your file...")
+    # Archives are unpacked and their media put on gallery pages
+    if (media_type == 'document' and ARCHIVE_CONVERSION and admission.decision != 'reject'
+            and is_archive(file_name, mime_type)):
+        job = {
+            'kind': 'archive',
+            'username': username,
+            'file_id': file_id,
+            'file_name': file_name,
+            'file_size': file_size
+        }
+        await enqueue_job(update, f"⏳ Unpacking {file_name}...", job)
+        return
+    
+    # Collect album items so the whole album becomes one page
+    media_group_id = update.message.media_group_id
+    if media_group_id:
+        item = {
+            'media_type': media_type,
+            'file_id': file_id,
+            'file_unique_id': file_unique_id,
+            'file_name': file_name,
+            'file_size': file_size,
+            'embed': admission.decision == 'accept'
+        }
         
-        # Get file from Telegram
-        file = await context.bot.get_file(file_id)
+        async def on_complete(items):
+            await handle_media_group(update, context, items)
         
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_name)[1]) as temp_file:
-            temp_path = temp_file.name
+        get_media_group_collector().add((chat_id, media_group_id), item, on_complete)
+        return
+    
+    if admission.decision == 'reject':
+        await update.message.reply_text(REJECTION_MESSAGES[admission.reason])
+        jobs_total.inc(media_type=media_type, outcome='rejected')
+        return
+    
+    # Answer straight from the dedup cache when this file was seen before
+    cache = get_dedup_cache()
+    cached = await cache.get_by_unique_id(file_unique_id) if cache else None
+    if cached:
+        await update.message.reply_text(
+            f"✅ Your media has been uploaded to Telegraph!\n\n{cached['page_url']}",
+            disable_web_page_preview=False
+        )
+        jobs_total.inc(media_type=media_type, outcome='cached')
+        logger.info("Served %s for user %s from dedup cache", media_type, username)
+        return
+    
+    job = {
+        'kind': 'media',
+        'media_type': media_type,
+        'username': username,
+        'file_id': file_id,
+        'file_unique_id': file_unique_id,
+        'file_name': file_name,
+        'file_size': file_size,
+        'embed': admission.decision == 'accept'
+    }
+    
+    await enqueue_job(update, "⏳ Processing your media file...", job)
+
+async def handle_media_group(update: Update, context: ContextTypes.DEFAULT_TYPE, items: list) -> None:
+    """
+    Handle a complete album and upload it as a single Telegraph page
+    
+    Args:
+        update: The update of the first album item
+        context: The context object
+        items: File information of every album item
+    """
+    user = update.effective_user
+    username = user.username or user.id
+    
+    job = {'kind': 'album', 'username': username, 'items': items}
+    
+    await enqueue_job(update, f"⏳ Processing your album of {len(items)} files...", job)
+
+async def enqueue_job(update: Update, processing_text: str, job: dict) -> None:
+    """
+    Queue a transfer job and send the status message it will update
+    
+    Args:
+        update: The update object
+        processing_text: Status text shown when the job starts right away
+        job: Job description, see run_job
+    """
+    user = update.effective_user
+    username = user.username or user.id
+    chat_id = update.effective_chat.id
+    
+    # Jobs go to the worker processes when they are running
+    pool = get_worker_pool()
+    scheduler = get_scheduler()
+    if not pool and scheduler.is_full():
+        await update.message.reply_text("⏳ The bot is busy right now. Please try again in a few minutes.")
+        logger.warning("Rejected job from user %s: queue is full", username)
+        return
+    
+    # Send processing message, telling the user where they are in line
+    position = (pool or scheduler).position_for(chat_id)
+    if position:
+        processing_msg = await update.message.reply_text(f"⏳ You are #{position} in queue...")
+    else:
+        processing_msg = await update.message.reply_text(processing_text)
+    
+    job.update(chat_id=processing_msg.chat_id, message_id=processing_msg.message_id)
+    try:
+        submit_job(update.get_bot(), job, processing_msg)
+    except QueueFullError:
+        await processing_msg.edit_text("⏳ The bot is busy right now. Please try again in a few minutes.")
+        logger.warning("Rejected job from user %s: queue is full", username)
+
+def submit_job(bot: Bot, job: dict, processing_msg: Message = None) -> None:
+    """
+    Hand a job to the worker processes, or to the local scheduler
+    
+    Args:
+        bot: The bot used to run the job locally
+        job: Job description, see run_job
+        processing_msg: Status message of the job, if at hand
+    """
+    journal = get_job_journal()
+    if journal:
+        job.setdefault('journal_id', uuid.uuid4().hex)
+    
+    pool = get_worker_pool()
+    if pool:
+        pool.submit(job)
+    else:
+        get_scheduler().submit(job['chat_id'], lambda: run_job(bot, job, processing_msg))
+    
+    # Journal the job only once it was accepted
+    if journal:
+        journal.record(job)
+
+def status_message(bot: Bot, chat_id: int, message_id: int) -> Message:
+    """
+    Rebuild a status message so a job can keep editing it
+    
+    Args:
+        bot: The bot the message belongs to
+        chat_id: Chat ID of the message
+        message_id: Message ID
         
-        # Download the file
-        await download_file(file.file_path, temp_path)
+    Returns:
+        The message object
+    """
+    message = Message(
+        message_id=message_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=chat_id, type=Chat.PRIVATE)
+    )
+    message.set_bot(bot)
+    return message
+
+async def run_job(bot: Bot, job: dict, processing_msg: Message = None) -> None:
+    """
+    Run a queued job
+    
+    Jobs are plain dicts so they can be stored in the dead-letter queue and
+    sent to worker processes. Every job has a kind ('media', 'album' or
+    'archive'), a username and the chat_id/message_id of its status message;
+    the other keys are the arguments of process_media, process_media_group
+    or process_archive. A journal_id key ties the job to its row in the job
+    journal, which is finished once the job reached a final status; a job
+    cancelled by a shutdown stays in the journal and is resumed on startup.
+    
+    Args:
+        bot: The bot used to fetch files and edit the status message
+        job: Job description
+        processing_msg: Status message of the job, rebuilt from the IDs if missing
+    """
+    if processing_msg is None:
+        processing_msg = status_message(bot, job['chat_id'], job['message_id'])
+    
+    journal = get_job_journal()
+    journal_id = job.get('journal_id')
+    current_job_id.set(journal_id)
+    if journal and journal_id:
+        journal.mark('running')
+    
+    # Entries dead-lettered before jobs had a kind are media jobs
+    kind = job.get('kind', 'media')
+    try:
+        if kind == 'album':
+            await process_media_group(bot, processing_msg, job['username'], job['items'], job.get('replays', 0))
+        elif kind == 'archive':
+            await process_archive(
+                bot, processing_msg, job['username'], job['file_id'], job['file_name'],
+                job.get('file_size'), job.get('replays', 0)
+            )
+        else:
+            await process_media(
+                bot, processing_msg, job['media_type'], job['username'], job['file_id'],
+                job['file_unique_id'], job['file_name'], job.get('file_size'), job.get('replays', 0),
+                job.get('embed', True)
+            )
+    except Exception:
+        if journal and journal_id:
+            journal.finish(journal_id)
+        raise
+    if journal and journal_id:
+        journal.finish(journal_id)
+
+async def defer_job(job: dict) -> None:
+    """
+    Park a job in the dead-letter queue until the failing endpoint recovers
+    
+    The queue syncs the file and may wait for another process's lock, so
+    this runs in a thread rather than on the event loop.
+    
+    Args:
+        job: Job description, see run_job
+    """
+    await asyncio.to_thread(get_dead_letter_queue().push, job)
+
+async def process_media(bot: Bot, processing_msg, media_type: str, username,
+                        file_id: str, file_unique_id: str, file_name: str, file_size: int = None,
+                        replays: int = 0, embed: bool = True) -> None:
+    """
+    Transfer a queued media file to Telegraph
+    
+    Args:
+        bot: The bot used to fetch the file
+        processing_msg: Status message to update
+        media_type: The type of media (photo, video, document)
+        username: Username or ID of the sender, for logging
+        file_id: Telegram file ID
+        file_unique_id: Telegram file_unique_id
+        file_name: Name of the file
+        file_size: Size of the file in bytes, if known
+        replays: Number of times the job was replayed from the dead-letter queue
+        embed: Upload the content, or only create the text page without downloading it
+    """
+    scheduler = get_scheduler()
+    status = get_status_coalescer()
+    quiet = status.is_quiet(file_size)
+    current_media_type.set(media_type)
+    started_at = time.perf_counter()
+    
+    try:
+        logger.info("Processing %s from user %s", media_type, username)
         
         # Update status message
-        await processing_msg.edit_text("⏳ Uploading to Telegraph...")
+        mark_stage('downloading')
+        await status.update(processing_msg, "⏳ Downloading your file...", quiet)
         
-        # Upload to Telegraph
-        telegraph_url = await upload_to_telegraph(temp_path, file_name)
+        if not embed:
+            # Admission control ruled the content out, so the text page
+            # is created without downloading anything
+            telegraph_url = await create_file_page(file_name, file_unique_id)
+        elif STREAM_TRANSFERS:
+            # Streaming holds both stages for the whole transfer
+            async with scheduler.stage('download'), scheduler.stage('upload'):
+                # Get file from Telegram
+                async with stage_timer('get_file'):
+                    file = await get_telegram_file(bot, file_id)
+                
+                # Update status message
+                mark_stage('uploading')
+                await status.update(processing_msg, "⏳ Uploading to Telegraph...", quiet)
+                
+                # Stream the file from Telegram to Telegraph
+                telegraph_url = await stream_to_telegraph(file.file_path, file_name, file_unique_id, file_size)
+        else:
+            async with scheduler.stage('download'):
+                # Get file from Telegram
+                async with stage_timer('get_file'):
+                    file = await get_telegram_file(bot, file_id)
+                
+                # A local Bot API server already stored the file on this machine
+                source_path = local_path(file.file_path)
+                if not source_path:
+                    # Create a temporary file
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_name)[1],
+                                                     dir=temp_dir, prefix=temp_prefix()) as temp_file:
+                        temp_path = source_path = temp_file.name
+                    
+                    # Download the file
+                    await download_file(file.file_path, temp_path)
+            
+            # Update status message
+            mark_stage('uploading')
+            await status.update(processing_msg, "⏳ Uploading to Telegraph...", quiet)
+            
+            async with scheduler.stage('upload'):
+                # Upload to Telegraph
+                telegraph_url = await upload_to_telegraph(source_path, file_name, file_unique_id)
         
         # Send success message with the link
-        await processing_msg.edit_text(
+        await status.final(
+            processing_msg,
             f"✅ Your media has been uploaded to Telegraph!\n\n{telegraph_url}",
             disable_web_page_preview=False
         )
         
-        logger.info(f"Successfully processed {media_type} for user {username}")
+        jobs_total.inc(media_type=media_type, outcome='success')
+        if file_size:
+            throughput.observe(file_size / (time.perf_counter() - started_at), media_type=media_type)
+        logger.info("Successfully processed %s for user %s", media_type, username)
+    except UnsupportedContentError as e:
+        jobs_total.inc(media_type=media_type, outcome='rejected')
+        logger.info("Rejected %s from user %s: %s", media_type, username, e)
+        await status.final(processing_msg, f"❌ Sorry, this type of file is not supported.\n\n{str(e)}")
     except Exception as e:
-        logger.error(f"Error processing media: {str(e)}", exc_info=True)
+        if is_transient(e) and replays < DEAD_LETTER_MAX_REPLAYS:
+            # Park the job until the failing endpoint recovers
+            logger.warning("Deferring %s for user %s: %s", media_type, username, e)
+            await defer_job({
+                'kind': 'media',
+                'chat_id': processing_msg.chat_id,
+                'message_id': processing_msg.message_id,
+                'media_type': media_type,
+                'username': username,
+                'file_id': file_id,
+                'file_unique_id': file_unique_id,
+                'file_name': file_name,
+                'file_size': file_size,
+                'replays': replays + 1,
+                'embed': embed
+            })
+            jobs_total.inc(media_type=media_type, outcome='deferred')
+            await status.final(
+                processing_msg,
+                "⚠️ Telegraph is temporarily unavailable. Your file has been queued "
+                "and will be uploaded automatically."
+            )
+            return
+        
+        jobs_total.inc(media_type=media_type, outcome='error')
+        logger.error("Error processing media: %s", e, exc_info=True)
         
         # Send error message
-        await processing_msg.edit_text(
+        await status.final(
+            processing_msg,
             f"❌ Sorry, an error occurred while processing your media.\n\nError: {str(e)}"
         )
     finally:
@@ -144,12 +533,430 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE, media
             if 'temp_path' in locals() and os.path.exists(temp_path):
                 os.unlink(temp_path)
         except Exception as e:
-            logger.error(f"Error deleting temporary file: {str(e)}")
+            logger.error("Error deleting temporary file: %s", e)
+
+async def process_media_group(bot: Bot, processing_msg, username, items: list, replays: int = 0) -> None:
+    """
+    Upload all album items in parallel and create one Telegraph page
+    
+    Args:
+        bot: The bot used to fetch the files
+        processing_msg: Status message to update
+        username: Username or ID of the sender, for logging
+        items: File information of every album item
+        replays: Number of times the job was replayed from the dead-letter queue
+    """
+    scheduler = get_scheduler()
+    status = get_status_coalescer()
+    cache = get_dedup_cache()
+    
+    async def upload_item(item):
+        # Reuse media that was already uploaded for an earlier message
+        cached = await cache.get_by_unique_id(item['file_unique_id']) if cache else None
+        if cached and cached['media_url']:
+            return cached['media_url']
+        
+        # Files refused by admission control are not worth a download
+        if not item.get('embed', True):
+            return None
+        
+        async with scheduler.stage('download'), scheduler.stage('upload'):
+            async with stage_timer('get_file'):
+                file = await get_telegram_file(bot, item['file_id'])
+            
+            # Files that cannot be embedded are listed as notes instead
+            try:
+                content_type, stream = await open_media(file.file_path, item['file_name'])
+            except UnsupportedContentError:
+                return None
+            if not is_uploadable(content_type) or (item['file_size'] or 0) > max_upload_size(content_type):
+                await stream.aclose()
+                return None
+            
+            try:
+                media_url, _ = await stream_media(
+                    file.file_path, item['file_name'], stream, content_type, item['file_size']
+                )
+            except UnsupportedContentError:
+                # E.g. a video still over the size limit after transcoding
+                return None
+        return media_url
+    
+    current_media_type.set('album')
+    
+    try:
+        logger.info("Processing album of %s files from user %s", len(items), username)
+        
+        mark_stage('uploading')
+        await status.update(processing_msg, f"⏳ Uploading {len(items)} files to Telegraph...")
+        media_urls = await asyncio.gather(*(upload_item(item) for item in items))
+        
+        image_urls = [url for url in media_urls if url]
+        notes = [
+            f"This file ({item['file_name']}) cannot be directly embedded."
+            for item, url in zip(items, media_urls) if not url
+        ]
+        telegraph_url = await create_gallery_page(image_urls, notes)
+        
+        # Send success message with the link
+        await status.final(
+            processing_msg,
+            f"✅ Your album has been uploaded to Telegraph!\n\n{telegraph_url}",
+            disable_web_page_preview=False
+        )
+        
+        jobs_total.inc(media_type='album', outcome='success')
+        logger.info("Successfully processed album for user %s", username)
+    except Exception as e:
+        if is_transient(e) and replays < DEAD_LETTER_MAX_REPLAYS:
+            logger.warning("Deferring album of %s files for user %s: %s", len(items), username, e)
+            await defer_job({
+                'kind': 'album',
+                'chat_id': processing_msg.chat_id,
+                'message_id': processing_msg.message_id,
+                'username': username,
+                'items': items,
+                'replays': replays + 1
+            })
+            jobs_total.inc(media_type='album', outcome='deferred')
+            await status.final(
+                processing_msg,
+                "⚠️ Telegraph is temporarily unavailable. Your album has been queued "
+                "and will be uploaded automatically."
+            )
+            return
+        
+        jobs_total.inc(media_type='album', outcome='error')
+        logger.error("Error processing album: %s", e, exc_info=True)
+        
+        # Send error message
+        await status.final(
+            processing_msg,
+            f"❌ Sorry, an error occurred while processing your album.\n\nError: {str(e)}"
+        )
+
+def archive_summary(file_name: str, result: dict) -> str:
+    """
+    Build the reply listing the pages and per-file results of an archive
+    
+    Args:
+        file_name: Name of the archive
+        result: Result of convert_archive
+        
+    Returns:
+        The summary text
+    """
+    files = result['files']
+    converted = [entry for entry in files if entry.get('media_url')]
+    left_out = [entry for entry in files if not entry.get('media_url')]
+    elapsed = result['elapsed']
+    
+    lines = [
+        f"✅ Converted {len(converted)} of {len(files)} files from {file_name} in {elapsed:.1f}s "
+        f"({result['bytes'] / max(elapsed, 0.001) / (1024 * 1024):.1f} MB/s)",
+        "",
+        "📄 Gallery pages:" if len(result['pages']) > 1 else "📄 Gallery page:",
+        *result['pages']
+    ]
+    if left_out:
+        lines += ["", f"Not embedded ({len(left_out)}):"]
+        lines += [f"• {entry['name']}: {entry['reason']}" for entry in left_out[:ARCHIVE_SUMMARY_LINES]]
+        if len(left_out) > ARCHIVE_SUMMARY_LINES:
+            lines.append(f"• ... and {len(left_out) - ARCHIVE_SUMMARY_LINES} more")
+    
+    # Stay within Telegram's message length limit
+    return "\n".join(lines)[:4096]
+
+async def process_archive(bot: Bot, processing_msg, username, file_id: str, file_name: str,
+                          file_size: int = None, replays: int = 0) -> None:
+    """
+    Convert the media in a ZIP or TAR archive to Telegraph gallery pages
+    
+    Args:
+        bot: The bot used to fetch the archive
+        processing_msg: Status message to update
+        username: Username or ID of the sender, for logging
+        file_id: Telegram file ID of the archive
+        file_name: Name of the archive
+        file_size: Size of the archive in bytes, if known
+        replays: Number of times the job was replayed from the dead-letter queue
+    """
+    scheduler = get_scheduler()
+    status = get_status_coalescer()
+    current_media_type.set('archive')
+    
+    async def progress(done):
+        await status.update(processing_msg, f"⏳ Uploaded {done} files from {file_name}...")
+    
+    try:
+        logger.info("Processing archive %s from user %s", file_name, username)
+        mark_stage('downloading')
+        
+        # The archive's uploads are bounded by ARCHIVE_UPLOAD_CONCURRENCY
+        # and count as one transfer for the scheduler
+        async with scheduler.stage('download'), scheduler.stage('upload'):
+            async with stage_timer('get_file'):
+                file = await get_telegram_file(bot, file_id)
+            result = await convert_telegram_archive(file.file_path, file_name, progress)
+        
+        await status.final(processing_msg, archive_summary(file_name, result), disable_web_page_preview=False)
+        
+        jobs_total.inc(media_type='archive', outcome='success')
+        throughput.observe(result['bytes'] / result['elapsed'], media_type='archive')
+        logger.info(
+            "Converted %s of %s files from archive %s for user %s in %.1fs",
+            sum(1 for entry in result['files'] if entry.get('media_url')), len(result['files']),
+            file_name, username, result['elapsed']
+        )
+    except (ArchiveError, UnsupportedContentError) as e:
+        jobs_total.inc(media_type='archive', outcome='rejected')
+        logger.info("Rejected archive %s from user %s: %s", file_name, username, e)
+        await status.final(processing_msg, f"❌ Sorry, this archive could not be converted.\n\n{str(e)}")
+    except Exception as e:
+        if is_transient(e) and replays < DEAD_LETTER_MAX_REPLAYS:
+            logger.warning("Deferring archive %s for user %s: %s", file_name, username, e)
+            await defer_job({
+                'kind': 'archive',
+                'chat_id': processing_msg.chat_id,
+                'message_id': processing_msg.message_id,
+                'username': username,
+                'file_id': file_id,
+                'file_name': file_name,
+                'file_size': file_size,
+                'replays': replays + 1
+            })
+            jobs_total.inc(media_type='archive', outcome='deferred')
+            await status.final(
+                processing_msg,
+                "⚠️ Telegraph is temporarily unavailable. Your archive has been queued "
+                "and will be converted automatically."
+            )
+            return
+        
+        jobs_total.inc(media_type='archive', outcome='error')
+        logger.error("Error processing archive: %s", e, exc_info=True)
+        await status.final(
+            processing_msg,
+            f"❌ Sorry, an error occurred while processing your archive.\n\nError: {str(e)}"
+        )
+
+async def replay_dead_letters(application: Application) -> None:
+    """
+    Resubmit jobs from the dead-letter queue
+    
+    Args:
+        application: The telegram Application
+    """
+    dead_letters = get_dead_letter_queue()
+    entries = await asyncio.to_thread(dead_letters.drain)
+    if entries:
+        logger.info("Replaying %s jobs from the dead-letter queue", len(entries))
+    
+    for entry in entries:
+        try:
+            submit_job(application.bot, entry)
+        except QueueFullError:
+            await defer_job(entry)
+
+async def dead_letter_loop(application: Application) -> None:
+    """
+    Replay dead letters whenever a circuit breaker closes
+    
+    Args:
+        application: The telegram Application
+    """
+    breakers = [get_breaker('telegram'), get_breaker('telegraph')]
+    recovered = asyncio.Event()
+    for breaker in breakers:
+        breaker.on_close(recovered.set)
+    
+    while True:
+        try:
+            await asyncio.wait_for(recovered.wait(), DEAD_LETTER_REPLAY_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        recovered.clear()
+        
+        # An open breaker would reject the jobs right away; a half-open
+        # one lets the first replayed job act as its trial call
+        if all(breaker.state != 'open' for breaker in breakers):
+            try:
+                await replay_dead_letters(application)
+            except Exception as e:
+                logger.error("Error replaying dead letters: %s", e, exc_info=True)
+
+async def recover_jobs(application: Application) -> None:
+    """
+    Resume or fail the jobs left unfinished by processes that stopped
+    
+    This covers a bot process that crashed or was restarted as well as a
+    transfer worker killed by the health check. Jobs are resumed from the
+    start with the same status message. Jobs that are too old or already
+    survived JOB_JOURNAL_MAX_RECOVERIES restarts are failed instead, telling
+    the user to send the file again.
+    
+    Args:
+        application: The telegram Application
+    """
+    journal = get_job_journal()
+    if not journal:
+        return
+    
+    orphans = await asyncio.to_thread(journal.claim_orphans)
+    if orphans:
+        logger.warning("Found %s unfinished jobs of processes that stopped", len(orphans))
+    
+    status = get_status_coalescer()
+    for job, stage, created_at in orphans:
+        processing_msg = status_message(application.bot, job['chat_id'], job['message_id'])
+        age = time.time() - (created_at or 0)
+        try:
+            if job['recoveries'] > JOB_JOURNAL_MAX_RECOVERIES or age > JOB_JOURNAL_MAX_AGE:
+                logger.warning(
+                    "Giving up on %s job %s interrupted while %s (%s restarts, %.0fs old)",
+                    job.get('kind', 'media'), job['journal_id'], stage, job['recoveries'] - 1, age
+                )
+                journal.finish(job['journal_id'])
+                jobs_recovered.inc(result='failed')
+                await status.final(
+                    processing_msg,
+                    "❌ Sorry, the bot restarted while processing your file. Please send it again."
+                )
+                continue
+            
+            logger.info("Resuming %s job %s interrupted while %s", job.get('kind', 'media'), job['journal_id'], stage)
+            try:
+                submit_job(application.bot, job)
+            except QueueFullError:
+                # Park the job until the queue has room again
+                await defer_job({key: value for key, value in job.items() if key != 'journal_id'})
+                journal.finish(job['journal_id'])
+                jobs_recovered.inc(result='deferred')
+                continue
+            jobs_recovered.inc(result='resumed')
+            await status.update(processing_msg, "⏳ The bot restarted, resuming your file...")
+        except Exception as e:
+            logger.error("Error recovering job %s: %s", job['journal_id'], e, exc_info=True)
+
+async def recovery_loop(application: Application) -> None:
+    """
+    Recover orphaned jobs on startup and then periodically
+    
+    Transfer workers of a crashed bot process can outlive it for a moment,
+    and a worker may be killed while the bot keeps running, so their jobs
+    only become orphans later.
+    
+    Args:
+        application: The telegram Application
+    """
+    while True:
+        try:
+            await recover_jobs(application)
+        except Exception as e:
+            logger.error("Error recovering jobs: %s", e, exc_info=True)
+        await asyncio.sleep(JOB_JOURNAL_RECOVERY_INTERVAL)
+
+async def worker_setup(index: int) -> Bot:
+    """
+    Open the resources of a transfer worker process
+    
+    Args:
+        index: Worker index
+        
+    Returns:
+        The bot the worker uses to fetch files and edit status messages
+    """
+    mark_phase('imports')
+    bot = Bot(
+        os.getenv('TELEGRAM_BOT_TOKEN'),
+        base_url=f"{TELEGRAM_API_URL}/bot",
+        base_file_url=f"{TELEGRAM_API_URL}/file/bot",
+        local_mode=TELEGRAM_LOCAL_MODE
+    )
+    await asyncio.gather(bot.initialize(), warm_up())
+    await init_http_session()
+    mark_phase('initialize')
+    report_startup(f"Transfer worker {index}")
+    return bot
+
+async def worker_handle(bot: Bot, job: dict) -> None:
+    """Run a job inside a transfer worker process"""
+    await run_job(bot, job)
 
-def start_bot():
-    """Start the Telegram bot"""
+async def worker_teardown(bot: Bot) -> None:
+    """Release the resources of a transfer worker process"""
+    await bot.shutdown()
+    close_image_pool()
+    await asyncio.to_thread(close_job_journal)
+    await close_http_session()
+
+async def post_init(application: Application) -> None:
+    """Open shared resources once the application is initialized"""
+    await init_http_session(application)
+    await get_scheduler().start()
+    transfer_workers = application.bot_data.get('transfer_workers', 0)
+    if transfer_workers:
+        pool = WorkerPool(transfer_workers, worker_setup, worker_handle, worker_teardown)
+        await pool.start()
+        set_worker_pool(pool)
+    # Each webhook worker process exposes metrics on its own port
+    worker_index = application.bot_data.get('worker_index', 0)
+    application.bot_data['metrics_runner'] = await start_metrics_server(
+        port=METRICS_PORT + worker_index if METRICS_PORT else 0
+    )
+    # Clean up after a previous process that crashed or was killed
+    await asyncio.to_thread(sweep_temp_files)
+    application.bot_data['recovery_task'] = asyncio.create_task(recovery_loop(application))
+    application.bot_data['dead_letter_task'] = asyncio.create_task(dead_letter_loop(application))
+    mark_phase('post_init')
+    report_startup()
+
+async def post_stop(application: Application) -> None:
+    """Hand over the albums still being collected while the bot can reply"""
+    await get_media_group_collector().close()
+
+async def post_shutdown(application: Application) -> None:
+    """Release shared resources when the application shuts down"""
+    application.bot_data['dead_letter_task'].cancel()
+    application.bot_data['recovery_task'].cancel()
+    if application.bot_data.get('metrics_runner'):
+        await application.bot_data['metrics_runner'].cleanup()
+    pool = get_worker_pool()
+    if pool:
+        # Let the workers finish the jobs they already accepted
+        set_worker_pool(None)
+        await pool.stop()
+    await get_scheduler().stop()
+    # Jobs cancelled by the shutdown stay in the journal for the next start
+    await asyncio.to_thread(close_job_journal)
+    close_image_pool()
+    await close_http_session(application)
+
+def build_application(transfer_workers: int = TRANSFER_WORKERS) -> Application:
+    """
+    Create the Application with all handlers registered
+    
+    Args:
+        transfer_workers: Number of transfer worker processes, 0 runs
+            transfers in the bot process
+    
+    Returns:
+        The configured Application
+    """
     # Create the Application
-    application = Application.builder().token(os.getenv('TELEGRAM_BOT_TOKEN')).build()
+    application = (
+        Application.builder()
+        .application_class(WarmStartApplication)
+        .token(os.getenv('TELEGRAM_BOT_TOKEN'))
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .local_mode(TELEGRAM_LOCAL_MODE)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.bot_data['transfer_workers'] = transfer_workers
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -161,7 +968,26 @@ def start_bot():
     application.add_handler(MessageHandler(filters.VIDEO, handle_video))
     application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
     
+    return application
+
+def start_bot(mode: str = BOT_MODE, workers: int = WEBHOOK_WORKERS, transfer_workers: int = TRANSFER_WORKERS):
+    """
+    Start the Telegram bot
+    
+    Args:
+        mode: 'polling' or 'webhook'
+        workers: Number of webhook worker processes
+        transfer_workers: Number of transfer worker processes
+    """
+    mark_phase('imports')
+    if mode == 'webhook':
+        run_webhook(functools.partial(build_application, transfer_workers), workers)
+        return None
+    
+    application = build_application(transfer_workers)
+    mark_phase('build')
+    
     # Start the Bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application.run_polling(allowed_updates=ALLOWED_UPDATES)
     
-    return application
\ No newline at end of file
+    return application
@@ -1,23 +1,58 @@
 #!/usr/bin/env python3
+import time
+import argparse
 from telegraph import Telegraph
+from telegraph.exceptions import RetryAfterError
+from utils.token_pool import TELEGRAPH_TOKENS_PATH, save_accounts
 
 def create_telegraph_token():
     # Create a new Telegraph account
     telegraph = Telegraph()
-    
+
     # Create account and get access token
     account = telegraph.create_account(
         short_name='TelegraphBot',  # Display name
         author_name='Media Converter Bot',  # Author name for articles
         author_url='https://t.me/your_bot_username'  # Replace with your bot's username
     )
-    
+
     # Print the access token
     print("\nTelegraph Access Token created successfully!")
     print("-" * 50)
     print(f"Access Token: {account['access_token']}")
     print("-" * 50)
     print("\nAdd this token to your .env file as TELEGRAPH_ACCESS_TOKEN")
+    return account
+
+def create_telegraph_tokens(count, output):
+    # Create several accounts for the token pool, waiting out flood limits
+    accounts = []
+    while len(accounts) < count:
+        try:
+            accounts.append(Telegraph().create_account(
+                short_name=f'TelegraphBot{len(accounts) + 1}',
+                author_name='Media Converter Bot',
+                author_url='https://t.me/your_bot_username'  # Replace with your bot's username
+            ))
+            print(f"Created account {len(accounts)}/{count}")
+        except RetryAfterError as e:
+            print(f"Flood limit hit, waiting {e.retry_after}s...")
+            time.sleep(e.retry_after)
+
+    # Persist the tokens so the bot's token pool picks them up
+    stored = save_accounts(accounts, output)
+    print(f"\nSaved {len(accounts)} new token(s) to {output} ({stored} in total)")
+    print("The bot loads this file on start, set TELEGRAPH_TOKENS_PATH if you moved it")
 
 if __name__ == "__main__":
-    create_telegraph_token()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create Telegraph access tokens")
+    parser.add_argument('--count', type=int, default=1,
+                        help="Number of accounts to create for the token pool (default: 1, printed only)")
+    parser.add_argument('--output', default=TELEGRAPH_TOKENS_PATH,
+                        help="Tokens file to append to when creating several accounts")
+    args = parser.parse_args()
+
+    if args.count > 1:
+        create_telegraph_tokens(args.count, args.output)
+    else:
+        create_telegraph_token()
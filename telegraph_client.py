@@ -2,119 +2,663 @@
 Telegraph API client for uploading files and creating pages
 """
 import os
+import io
+import time
+import asyncio
+import hashlib
 import mimetypes
+import tempfile
 from pathlib import Path
-import aiohttp
-from telegraph import Telegraph
+from utils.http_client import get_http_session
 from utils.logger import get_logger
+from utils.retry import CircuitOpenError, TransferError, get_breaker, is_transient, retry_async
+from utils.metrics import bytes_transferred, counter, timed_stage
+from utils.token_pool import get_token_pool
+from utils.dedup_cache import get_dedup_cache
+from utils.image_optimizer import optimize_image, optimizer_enabled
+from utils.transcoder import transcode_to_mp4
+from utils.upload_limits import (
+    TELEGRAPH_MAX_UPLOAD_SIZE, is_uploadable, max_upload_size, needs_transcode
+)
+from utils.archive import ArchiveError, aiter_entries
+from utils.content_type import (
+    CONTENT_SNIFF_BYTES, UnsupportedContentError, check_content_type, peek_stream, sniff_content_type
+)
+from utils.file_handler import (
+    iter_file, download_file, download_to_fileobj, hash_chunks, hash_file, local_path, map_local_file, temp_dir,
+    temp_prefix, STREAM_CHUNK_SIZE
+)
 
 # Get logger
 logger = get_logger(__name__)
 
-# Initialize Telegraph client
-telegraph = Telegraph(access_token=os.getenv('TELEGRAPH_ACCESS_TOKEN'))
+# Telegraph upload endpoint
+TELEGRAPH_UPLOAD_URL = os.getenv('TELEGRAPH_UPLOAD_URL', 'https://telegra.ph/upload')
 
-async def upload_to_telegraph(file_path: str, file_name: str) -> str:
+# Bulk conversion of archives
+ARCHIVE_UPLOAD_CONCURRENCY = int(os.getenv('ARCHIVE_UPLOAD_CONCURRENCY', 4))
+ARCHIVE_PAGE_SIZE = int(os.getenv('ARCHIVE_PAGE_SIZE', 50))
+ARCHIVE_SPOOL_SIZE = int(os.getenv('ARCHIVE_SPOOL_SIZE', 32 * 1024 * 1024))
+
+# Notes listed on a gallery page before the rest is summed up
+MAX_PAGE_NOTES = 200
+
+# Content classification results
+content_sniffed = counter('m2t_content_sniffed_total', 'Files classified by their magic bytes', ('category',))
+archive_entries = counter('m2t_archive_entries_total', 'Files taken from archives', ('result',))
+
+def classify_content(head: bytes, file_name: str):
+    """
+    Sniff the content type of a file and refuse rejected content
+
+    Args:
+        head: Leading bytes of the file
+        file_name: Name of the file
+
+    Returns:
+        ContentType, or None when the content is not recognised
+    """
+    content_type = sniff_content_type(head)
+    content_sniffed.inc(category=content_type.category if content_type else 'unknown')
+    if content_type and Path(file_name).suffix.lower() not in ('', content_type.extension):
+        logger.info("%s is actually %s", file_name, content_type.mime_type)
+    check_content_type(content_type, file_name)
+    return content_type
+
+async def open_media(telegram_file_path: str, file_name: str) -> tuple:
+    """
+    Start downloading a file from Telegram and classify it from its first bytes
+
+    Args:
+        telegram_file_path: Telegram file path returned by get_file
+        file_name: Name of the file
+
+    Returns:
+        Tuple of the ContentType (or None) and the stream of the whole file,
+        which the caller must consume or close
+    """
+    head, stream = await retry_async(
+        lambda: peek_stream(iter_file(telegram_file_path)),
+        get_breaker('telegram'),
+        description=f"Download of {telegram_file_path}"
+    )
+    try:
+        content_type = classify_content(head, file_name)
+    except UnsupportedContentError:
+        await stream.aclose()
+        raise
+    return content_type, stream
+
+async def create_file_page(file_name: str, file_unique_id: str = None) -> str:
+    """
+    Create the text page for a file whose content is not embedded
+
+    Args:
+        file_name: Name of the file
+        file_unique_id: Telegram file_unique_id used as the dedup key
+
+    Returns:
+        Telegraph URL
+    """
+    # The text page does not use the file content
+    page_url = await create_telegraph_page(None, file_name)
+    cache = get_dedup_cache()
+    if cache:
+        await cache.put(page_url, file_unique_id=file_unique_id)
+    return page_url
+
+async def upload_to_telegraph(file_path: str, file_name: str, file_unique_id: str = None) -> str:
     """
     Upload a file to Telegraph
-    
+
     Args:
         file_path: Path to the file
         file_name: Name of the file
-        
+        file_unique_id: Telegram file_unique_id used as the dedup key
+
     Returns:
         Telegraph URL
     """
     try:
-        # Determine file type
-        file_ext = Path(file_name).suffix.lower()
-        mime_type = mimetypes.guess_type(file_name)[0]
-        
-        # Check if it's an image
-        is_image = False
-        if mime_type and mime_type.startswith('image/'):
-            is_image = True
-        elif file_ext in ['.jpg', '.jpeg', '.png', '.gif']:
-            is_image = True
-        
-        if is_image:
-            # Use direct upload for images
-            return await upload_image(file_path)
-        else:
-            # For videos and other files, create a Telegraph page
-            return await create_telegraph_page(file_path, file_name)
+        cache = get_dedup_cache()
+
+        with open(file_path, 'rb') as f:
+            content_type = classify_content(f.read(CONTENT_SNIFF_BYTES), file_name)
+        file_size = os.path.getsize(file_path)
+
+        if not is_uploadable(content_type) or file_size > max_upload_size(content_type):
+            # For other files, create a Telegraph page
+            return await create_file_page(file_name, file_unique_id)
+
+        # Look the content up before spending an upload on it
+        sha256 = None
+        if cache:
+            digest = await asyncio.to_thread(hash_file, file_path, hashlib.sha256())
+            sha256 = digest.hexdigest()
+            cached = await cache.get_by_hash(sha256)
+            if cached:
+                logger.info("Dedup hit by content hash for %s", file_name)
+                await cache.put(cached['page_url'], cached['media_url'], file_unique_id)
+                return cached['page_url']
+
+        # Use direct upload for images and videos
+        image_url = await upload_local_media(file_path, file_name, content_type)
+        page_url = await create_image_page(image_url)
+
+        if cache:
+            await cache.put(page_url, image_url, file_unique_id, sha256)
+        return page_url
+    except UnsupportedContentError:
+        raise
     except Exception as e:
-        logger.error(f"Error uploading to Telegraph: {str(e)}", exc_info=True)
+        logger.error("Error uploading to Telegraph: %s", e, exc_info=True)
         raise Exception(f"Failed to upload to Telegraph: {str(e)}")
 
+async def stream_to_telegraph(telegram_file_path: str, file_name: str, file_unique_id: str = None,
+                              file_size: int = None) -> str:
+    """
+    Stream a file from Telegram straight into Telegraph without a temp file
+
+    Args:
+        telegram_file_path: Telegram file path returned by get_file
+        file_name: Name of the file
+        file_unique_id: Telegram file_unique_id used as the dedup key
+        file_size: Size of the file in bytes, if known
+
+    Returns:
+        Telegraph URL
+    """
+    try:
+        cache = get_dedup_cache()
+        content_type, stream = await open_media(telegram_file_path, file_name)
+
+        if not is_uploadable(content_type) or (file_size or 0) > max_upload_size(content_type):
+            # The page for other files does not embed the content,
+            # so the download stops after the first chunk
+            await stream.aclose()
+            return await create_file_page(file_name, file_unique_id)
+
+        image_url, sha256 = await stream_media(telegram_file_path, file_name, stream, content_type, file_size)
+
+        # The hash is only known once the stream is done, but a match
+        # still saves creating another page for the same content
+        cached = await cache.get_by_hash(sha256) if cache else None
+        page_url = cached['page_url'] if cached else await create_image_page(image_url)
+
+        if cache:
+            await cache.put(page_url, image_url, file_unique_id, sha256)
+        return page_url
+    except UnsupportedContentError:
+        raise
+    except Exception as e:
+        logger.error("Error uploading to Telegraph: %s", e, exc_info=True)
+        raise Exception(f"Failed to upload to Telegraph: {str(e)}")
+
+@timed_stage('stream')
+async def stream_media(telegram_file_path: str, file_name: str, stream, content_type, file_size: int = None) -> tuple:
+    """
+    Stream a file from Telegram to the Telegraph upload endpoint
+
+    Args:
+        telegram_file_path: Telegram file path returned by get_file
+        file_name: Name of the file
+        stream: Download stream returned by open_media
+        content_type: ContentType returned by open_media
+        file_size: Size of the file in bytes, if known
+
+    Returns:
+        Tuple of the uploaded media URL and the SHA-256 of the content
+    """
+    digest = hashlib.sha256()
+
+    path = local_path(telegram_file_path)
+    if path:
+        # A local Bot API server left the file on this machine, so there is
+        # nothing to download or copy
+        await stream.aclose()
+        await asyncio.to_thread(hash_file, path, digest)
+        media_url = await upload_local_media(path, file_name, content_type)
+        return media_url, digest.hexdigest()
+
+    if needs_transcode(content_type, file_size):
+        # ffmpeg needs the whole file on disk
+        await stream.aclose()
+        with tempfile.TemporaryDirectory(dir=temp_dir, prefix=temp_prefix()) as scratch:
+            source_path = os.path.join(scratch, 'source' + content_type.extension)
+            await download_file(telegram_file_path, source_path)
+            await asyncio.to_thread(hash_file, source_path, digest)
+            media_url = await upload_transcoded(source_path, file_name)
+        return media_url, digest.hexdigest()
+
+    if optimizer_enabled() and content_type.category == 'image':
+        # The optimizer needs the whole image, so there is nothing to stream;
+        # the hash stays that of the original content for dedup
+        buffer = io.BytesIO()
+        await stream.aclose()
+        await download_to_fileobj(telegram_file_path, buffer, digest)
+        media_url = await upload_optimized(buffer.getvalue(), file_name, content_type)
+        return media_url, digest.hexdigest()
+
+    try:
+        chunks = hash_chunks(stream, digest)
+        media_url = await upload_media(chunks, file_name, content_type.mime_type)
+    except Exception as e:
+        if not can_retry_spooled(e):
+            await stream.aclose()
+            raise
+        # The streamed body is gone, so spool a fresh copy for the retry
+        logger.warning("Streaming upload failed, retrying from spooled file: %s", e)
+        await stream.aclose()
+        digest = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(max_size=STREAM_CHUNK_SIZE) as spool:
+            await download_to_fileobj(telegram_file_path, spool, digest)
+            spool.seek(0)
+            media_url = await upload_media(spool, file_name, content_type.mime_type)
+
+    return media_url, digest.hexdigest()
+
+def can_retry_spooled(error: Exception) -> bool:
+    """
+    Check whether a failed streaming upload is worth downloading again
+
+    Args:
+        error: Error the streaming upload failed with
+
+    Returns:
+        True for transient failures while both endpoints' breakers are closed
+    """
+    if isinstance(error, CircuitOpenError) or not is_transient(error):
+        return False
+    return get_breaker('telegram').state == 'closed' and get_breaker('telegraph').state == 'closed'
+
+async def upload_local_media(file_path: str, file_name: str, content_type) -> str:
+    """
+    Upload a local image or video, converting it first when needed
+
+    Args:
+        file_path: Path to the file
+        file_name: Name of the file
+        content_type: ContentType of the file
+
+    Returns:
+        URL of the uploaded media
+    """
+    if needs_transcode(content_type, os.path.getsize(file_path)):
+        return await upload_transcoded(file_path, file_name)
+    if optimizer_enabled() and content_type.category == 'image':
+        data = await asyncio.to_thread(Path(file_path).read_bytes)
+        return await upload_optimized(data, file_name, content_type)
+    with map_local_file(file_path) as content:
+        return await upload_media(content, file_name, content_type.mime_type)
+
+async def upload_transcoded(file_path: str, file_name: str) -> str:
+    """
+    Convert a video or animation to MP4 and upload the result
+
+    Args:
+        file_path: Path to the source file
+        file_name: Name of the file
+
+    Returns:
+        URL of the uploaded video
+    """
+    with tempfile.TemporaryDirectory(dir=temp_dir, prefix=temp_prefix()) as scratch:
+        output_path = os.path.join(scratch, 'video.mp4')
+        await transcode_to_mp4(file_path, output_path, TELEGRAPH_MAX_UPLOAD_SIZE)
+        with open(output_path, 'rb') as f:
+            return await upload_media(f, str(Path(file_name).with_suffix('.mp4')), 'video/mp4')
+
+async def upload_optimized(data: bytes, file_name: str, content_type) -> str:
+    """
+    Run an image through the optimizer and upload the result
+
+    Args:
+        data: Image content
+        file_name: Name of the file
+        content_type: ContentType of the original content
+
+    Returns:
+        URL of the uploaded media
+    """
+    optimized, upload_name = await optimize_image(data, file_name)
+    if upload_name != file_name:
+        mime_type = mimetypes.guess_type(upload_name)[0]
+    else:
+        mime_type = content_type.mime_type
+    return await upload_media(io.BytesIO(optimized), upload_name, mime_type)
+
+@timed_stage('upload')
+async def upload_media(data, file_name: str, mime_type: str = None) -> str:
+    """
+    Upload raw media to the Telegraph upload endpoint
+
+    Bytes, memoryviews and seekable file objects are retried with backoff;
+    streamed bodies get a single attempt since they cannot be replayed.
+
+    Args:
+        data: Bytes-like object, file object or async iterable of byte chunks
+        file_name: Name of the file
+        mime_type: Content type sent with the upload, guessed from the name if missing
+
+    Returns:
+        URL of the uploaded media
+    """
+    breaker = get_breaker('telegraph')
+    description = f"Upload of {file_name}"
+
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        media_url = await retry_async(lambda: _post_media(data, file_name, mime_type), breaker, description=description)
+        bytes_transferred.inc(len(data), direction='upload')
+        return media_url
+
+    if not hasattr(data, 'seek'):
+        sent = 0
+
+        async def count_chunks():
+            nonlocal sent
+            async for chunk in data:
+                sent += len(chunk)
+                yield chunk
+
+        media_url = await retry_async(lambda: _post_media(count_chunks(), file_name, mime_type), breaker, 1, description)
+        bytes_transferred.inc(sent, direction='upload')
+        return media_url
+
+    start = data.tell()
+    size = data.seek(0, os.SEEK_END) - start
+
+    async def attempt():
+        data.seek(start)
+        return await _post_media(data, file_name, mime_type)
+
+    media_url = await retry_async(attempt, breaker, description=description)
+    bytes_transferred.inc(size, direction='upload')
+    return media_url
+
+async def _post_media(data, file_name: str, mime_type: str = None) -> str:
+    """Send one upload request to Telegraph"""
+    import aiohttp
+
+    session = get_http_session()
+    form = aiohttp.FormData()
+    form.add_field(
+        'file', data,
+        filename=file_name,
+        content_type=mime_type or mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    )
+
+    async with session.post(TELEGRAPH_UPLOAD_URL, data=form) as response:
+        if response.status == 200:
+            result = await response.json()
+            if result and result[0] and 'src' in result[0]:
+                media_url = 'https://telegra.ph' + result[0]['src']
+                logger.info("Media uploaded to Telegraph: %s", media_url)
+                return media_url
+            else:
+                raise Exception("Invalid response from Telegraph API")
+        else:
+            raise TransferError(f"Telegraph API returned status code {response.status}", response.status)
+
+def _media_node(media_url: str) -> dict:
+    """Build the figure node embedding an uploaded image or video"""
+    tag = 'video' if media_url.lower().endswith('.mp4') else 'img'
+    return {
+        'tag': 'figure',
+        'children': [
+            {
+                'tag': tag,
+                'attrs': {'src': media_url}
+            }
+        ]
+    }
+
+async def create_image_page(image_url: str) -> str:
+    """
+    Create a Telegraph page embedding an uploaded image or video
+
+    Args:
+        image_url: URL of the uploaded media
+
+    Returns:
+        Telegraph URL
+    """
+    return await create_gallery_page([image_url])
+
+@timed_stage('create_page')
+async def create_gallery_page(image_urls: list, notes: list = None, title: str = 'Shared Media',
+                              next_url: str = None) -> str:
+    """
+    Create a Telegraph page embedding several uploaded images and videos
+
+    Args:
+        image_urls: URLs of the uploaded media
+        notes: Extra lines of text shown below the images
+        title: Page title
+        next_url: Page linked at the bottom as the next one
+
+    Returns:
+        Telegraph URL
+    """
+    author_name = 'Telegraph Bot'
+    content = [_media_node(image_url) for image_url in image_urls]
+    content += [{'tag': 'p', 'children': [note]} for note in notes or []]
+    if next_url:
+        content.append({
+            'tag': 'p',
+            'children': [{'tag': 'a', 'attrs': {'href': next_url}, 'children': ['Next page →']}]
+        })
+
+    page = await get_token_pool().create_page(
+        title=title,
+        content=content,
+        author_name=author_name
+    )
+
+    logger.info("Telegraph page created with %s media files: %s", len(image_urls), page['url'])
+    return page['url']
+
+async def create_gallery_pages(image_urls: list, notes: list = None, title: str = 'Shared Media',
+                               page_size: int = ARCHIVE_PAGE_SIZE) -> list:
+    """
+    Spread media over as many gallery pages as needed
+
+    The pages are created last to first so each one can link to the next.
+    The notes go on the last page.
+
+    Args:
+        image_urls: URLs of the uploaded media
+        notes: Extra lines of text shown below the images of the last page
+        title: Page title, numbered when there are several pages
+        page_size: Media embedded per page
+
+    Returns:
+        Telegraph URLs of the pages, in order
+    """
+    chunks = [image_urls[i:i + page_size] for i in range(0, len(image_urls), page_size)] or [[]]
+    if notes and len(notes) > MAX_PAGE_NOTES:
+        notes = notes[:MAX_PAGE_NOTES] + [f"... and {len(notes) - MAX_PAGE_NOTES} more files."]
+
+    page_urls = []
+    for number in range(len(chunks), 0, -1):
+        page_title = f"{title} ({number}/{len(chunks)})" if len(chunks) > 1 else title
+        page_notes = notes if number == len(chunks) else None
+        next_url = page_urls[-1] if page_urls else None
+        page_urls.append(await create_gallery_page(chunks[number - 1], page_notes, page_title, next_url))
+    return page_urls[::-1]
+
+async def upload_archive_entry(data: bytes, file_name: str):
+    """
+    Upload one file taken from an archive
+
+    Args:
+        data: File content
+        file_name: Name of the file inside the archive
+
+    Returns:
+        URL of the uploaded media, or None when the content cannot be embedded
+    """
+    content_type = classify_content(data[:CONTENT_SNIFF_BYTES], file_name)
+    if not is_uploadable(content_type) or len(data) > max_upload_size(content_type):
+        return None
+
+    upload_name = Path(file_name).name
+    if needs_transcode(content_type, len(data)):
+        with tempfile.TemporaryDirectory(dir=temp_dir, prefix=temp_prefix()) as scratch:
+            source_path = os.path.join(scratch, 'source' + content_type.extension)
+            await asyncio.to_thread(Path(source_path).write_bytes, data)
+            return await upload_transcoded(source_path, upload_name)
+    if optimizer_enabled() and content_type.category == 'image':
+        return await upload_optimized(data, upload_name, content_type)
+    return await upload_media(io.BytesIO(data), upload_name, content_type.mime_type)
+
+async def convert_archive(fileobj, file_name: str, progress=None,
+                          concurrency: int = ARCHIVE_UPLOAD_CONCURRENCY) -> dict:
+    """
+    Upload the media in an archive and create gallery pages for it
+
+    Members are read one at a time and at most `concurrency` of them are
+    held in memory and uploaded at once.
+
+    Args:
+        fileobj: Archive content, positioned at the start
+        file_name: Name of the archive
+        progress: Optional coroutine function called with the number of
+            files done after each upload
+        concurrency: Number of files uploaded at once
+
+    Returns:
+        Dict with the page URLs ('pages'), one result dict per file
+        ('files', with name, size, status and media_url or reason), the
+        bytes uploaded ('bytes') and the time taken ('elapsed')
+    """
+    started = time.perf_counter()
+    cache = get_dedup_cache()
+    slots = asyncio.Semaphore(concurrency)
+    files = []
+    tasks = []
+    done = 0
+
+    async def convert(result: dict, data: bytes):
+        nonlocal done
+        try:
+            sha256 = (await asyncio.to_thread(hashlib.sha256, data)).hexdigest()
+            cached = await cache.get_by_hash(sha256) if cache else None
+            if cached and cached['media_url']:
+                result.update(status='cached', media_url=cached['media_url'])
+            else:
+                media_url = await upload_archive_entry(data, result['name'])
+                if media_url:
+                    result.update(status='uploaded', media_url=media_url)
+                else:
+                    result.update(status='not_embeddable', reason='cannot be embedded')
+        except UnsupportedContentError:
+            result.update(status='unsupported', reason='unsupported content')
+        except Exception as e:
+            result.update(status='failed', reason=str(e), error=e)
+        finally:
+            slots.release()
+        archive_entries.inc(result=result['status'])
+        done += 1
+        if progress:
+            await progress(done)
+
+    try:
+        async for entry in aiter_entries(fileobj):
+            result = {'name': entry.name, 'size': entry.size}
+            files.append(result)
+            if entry.data is None:
+                result.update(status='skipped', reason=entry.skipped)
+                archive_entries.inc(result='skipped')
+                continue
+            await slots.acquire()
+            tasks.append(asyncio.create_task(convert(result, entry.data)))
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    if not files:
+        raise ArchiveError("The archive contains no files")
+
+    media_urls = [result['media_url'] for result in files if result.get('media_url')]
+    failures = [result['error'] for result in files if result['status'] == 'failed']
+    if failures and not media_urls:
+        # Nothing made it, most likely Telegraph is down; let the caller retry
+        raise failures[0]
+
+    notes = [f"{result['name']}: {result['reason']}" for result in files if not result.get('media_url')]
+    title = 'Shared Media: ' + Path(file_name).name
+    page_urls = await create_gallery_pages(media_urls, notes, title)
+
+    return {
+        'pages': page_urls,
+        'files': files,
+        'bytes': sum(result['size'] for result in files if result['status'] == 'uploaded'),
+        'elapsed': time.perf_counter() - started
+    }
+
+async def convert_telegram_archive(telegram_file_path: str, file_name: str, progress=None) -> dict:
+    """
+    Download an archive from Telegram and convert the media in it
+
+    The archive is kept in memory up to ARCHIVE_SPOOL_SIZE and spills to a
+    temporary file beyond that; its members are never written to disk. An
+    archive a local Bot API server stored on this machine is read in place.
+
+    Args:
+        telegram_file_path: Telegram file path returned by get_file
+        file_name: Name of the archive
+        progress: See convert_archive
+
+    Returns:
+        See convert_archive
+    """
+    path = local_path(telegram_file_path)
+    if path:
+        with open(path, 'rb') as archive:
+            return await convert_archive(archive, file_name, progress)
+
+    with tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE) as spool:
+        await download_to_fileobj(telegram_file_path, spool)
+        spool.seek(0)
+        return await convert_archive(spool, file_name, progress)
+
 async def upload_image(file_path: str) -> str:
     """
     Upload an image to Telegraph
-    
+
     Args:
         file_path: Path to the image file
-        
+
     Returns:
         Telegraph URL
     """
-    async with aiohttp.ClientSession() as session:
-        form = aiohttp.FormData()
-        form.add_field('file', open(file_path, 'rb'))
-        
-        async with session.post('https://telegra.ph/upload', data=form) as response:
-            if response.status == 200:
-                result = await response.json()
-                if result and result[0] and 'src' in result[0]:
-                    image_url = 'https://telegra.ph' + result[0]['src']
-                    logger.info(f"Image uploaded to Telegraph: {image_url}")
-                    
-                    # Create a Telegraph page with the image
-                    page_title = 'Shared Media'
-                    author_name = 'Telegraph Bot'
-                    content = [
-                        {
-                            'tag': 'figure',
-                            'children': [
-                                {
-                                    'tag': 'img',
-                                    'attrs': {'src': image_url}
-                                }
-                            ]
-                        }
-                    ]
-                    
-                    page = telegraph.create_page(
-                        title=page_title,
-                        html_content='',
-                        content=content,
-                        author_name=author_name
-                    )
-                    
-                    logger.info(f"Telegraph page created: {page['url']}")
-                    return page['url']
-                else:
-                    raise Exception("Invalid response from Telegraph API")
-            else:
-                raise Exception(f"Telegraph API returned status code {response.status}")
+    with open(file_path, 'rb') as f:
+        image_url = await upload_media(f, Path(file_path).name)
+
+    return await create_image_page(image_url)
 
+@timed_stage('create_page')
 async def create_telegraph_page(file_path: str, file_name: str) -> str:
     """
     Create a Telegraph page with embedded content
-    
+
     Args:
         file_path: Path to the file
         file_name: Name of the file
-        
+
     Returns:
         Telegraph URL
     """
     # For now, we'll create a simple page with text
     # In a real implementation, you might want to upload the file to a service
     # that supports the file type and then embed it in the Telegraph page
-    
+
     page_title = 'Shared Media: ' + file_name
     author_name = 'Telegraph Bot'
-    
+
     content = [
         {
             'tag': 'p',
@@ -123,13 +667,12 @@ async def create_telegraph_page(file_path: str, file_name: str) -> str:
             ]
         }
     ]
-    
-    page = telegraph.create_page(
+
+    page = await get_token_pool().create_page(
         title=page_title,
-        html_content='',
         content=content,
         author_name=author_name
     )
-    
-    logger.info(f"Telegraph page created for non-image file: {page['url']}")
-    return page['url']
\ No newline at end of file
+
+    logger.info("Telegraph page created for non-image file: %s", page['url'])
+    return page['url']
@@ -0,0 +1,62 @@
+"""
+Pre-flight admission control
+"""
+from collections import namedtuple
+import pytest
+from utils import admission, upload_limits
+
+MB = 1024 * 1024
+
+PhotoSize = namedtuple('PhotoSize', ['file_size', 'width', 'height'])
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Fix the limits and start from empty counters"""
+    monkeypatch.setattr(admission, 'BOT_API_DOWNLOAD_LIMIT', 20 * MB)
+    monkeypatch.setattr(upload_limits, 'TELEGRAPH_MAX_UPLOAD_SIZE', 5 * MB)
+    monkeypatch.setattr(upload_limits, 'VIDEO_MAX_SIZE', 10 * MB)
+    monkeypatch.setattr(upload_limits, 'transcoder_enabled', lambda: False)
+    monkeypatch.setattr(upload_limits, 'optimizer_enabled', lambda: False)
+    admission.admission_decisions.take()
+    yield monkeypatch
+    admission.admission_decisions.take()
+
+@pytest.mark.parametrize('media_type, file_size, decision, reason', [
+    ('document', 1 * MB, 'accept', 'ok'),
+    ('document', None, 'accept', 'unknown_size'),
+    ('document', 6 * MB, 'page', 'too_large_to_embed'),
+    ('video', 6 * MB, 'page', 'too_large_to_embed'),
+    ('photo', 6 * MB, 'page', 'too_large_to_embed'),
+    ('document', 21 * MB, 'reject', 'too_large'),
+    ('video', 21 * MB, 'reject', 'too_large'),
+])
+def test_decision_depends_on_size(limits, media_type, file_size, decision, reason):
+    assert admission.check_admission(media_type, file_size) == (decision, reason)
+    assert admission.admission_decisions.take() == {(decision, reason): 1}
+
+def test_converters_raise_the_embed_limit(limits):
+    limits.setattr(upload_limits, 'transcoder_enabled', lambda: True)
+    assert admission.check_admission('video', 6 * MB).decision == 'accept'
+    assert admission.check_admission('document', 11 * MB).decision == 'page'
+    # Telegram photos are JPEG, which only the optimizer can shrink
+    assert admission.check_admission('photo', 6 * MB).decision == 'page'
+
+def test_counters_add_up(limits):
+    for file_size in (1 * MB, 2 * MB, 6 * MB, 30 * MB):
+        admission.check_admission('document', file_size)
+    assert admission.admission_decisions.take() == {
+        ('accept', 'ok'): 2,
+        ('page', 'too_large_to_embed'): 1,
+        ('reject', 'too_large'): 1,
+    }
+
+def test_largest_photo_variant_that_fits_is_selected(limits):
+    photos = [
+        PhotoSize(100 * 1024, 320, 240),
+        PhotoSize(2 * MB, 1280, 960),
+        PhotoSize(8 * MB, 5120, 3840),
+    ]
+    assert admission.select_photo(photos) is photos[1]
+    assert admission.admission_decisions.take() == {('downscale', 'smaller_variant'): 1}
+    assert admission.select_photo(photos[:2]) is photos[1]
+    assert admission.admission_decisions.take() == {}
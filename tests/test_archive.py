@@ -0,0 +1,58 @@
+"""
+Reading archive members
+"""
+import io
+import zipfile
+import pytest
+from utils.archive import ArchiveError, iter_entries
+
+def make_zip(files: dict) -> io.BytesIO:
+    """Build a ZIP archive in memory"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+def track_members(monkeypatch) -> list:
+    """Record every ZIP member opened while reading"""
+    opened = []
+    original = zipfile.ZipFile.open
+
+    def open_member(self, *args, **kwargs):
+        member = original(self, *args, **kwargs)
+        opened.append(member)
+        return member
+
+    monkeypatch.setattr(zipfile.ZipFile, 'open', open_member)
+    return opened
+
+def test_zip_members_are_read_and_closed(monkeypatch):
+    archive = make_zip({'a.jpg': b'a' * 10, 'b.png': b'b' * 20, '__MACOSX/._a.jpg': b'x'})
+    opened = track_members(monkeypatch)
+
+    entries = list(iter_entries(archive))
+
+    assert [(entry.name, entry.data) for entry in entries] == [('a.jpg', b'a' * 10), ('b.png', b'b' * 20)]
+    assert len(opened) == 2
+    assert all(member.closed for member in opened)
+
+def test_zip_member_is_closed_when_reading_fails(monkeypatch):
+    archive = make_zip({'a.jpg': b'a' * 1000})
+    opened = track_members(monkeypatch)
+
+    def fail(self, *args):
+        raise zipfile.BadZipFile("Bad CRC-32")
+
+    monkeypatch.setattr(zipfile.ZipExtFile, 'read', fail)
+    with pytest.raises(ArchiveError):
+        list(iter_entries(archive))
+    assert len(opened) == 1 and opened[0].closed
+
+def test_oversized_members_are_skipped():
+    archive = make_zip({'small.jpg': b's' * 10, 'big.jpg': b'b' * 100})
+
+    entries = list(iter_entries(archive, max_entry_size=50))
+
+    assert [(entry.name, entry.skipped) for entry in entries] == [('small.jpg', None), ('big.jpg', 'too large')]
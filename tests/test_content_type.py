@@ -0,0 +1,68 @@
+"""
+Content classification from magic bytes
+"""
+import pytest
+from utils.content_type import UnsupportedContentError, check_content_type, sniff_content_type
+
+def iso_media(brand: bytes) -> bytes:
+    """Start of an ISO base media file with the given major brand"""
+    return b'\x00\x00\x00\x18ftyp' + brand + b'\x00\x00\x02\x00' + brand + b'isom'
+
+def riff(form: bytes) -> bytes:
+    """Start of a RIFF container of the given form type"""
+    return b'RIFF\x24\x00\x00\x00' + form
+
+@pytest.mark.parametrize('head, mime_type, category', [
+    (b'\xff\xd8\xff\xe0\x00\x10JFIF', 'image/jpeg', 'image'),
+    (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR', 'image/png', 'image'),
+    (b'GIF89a\x01\x00\x01\x00', 'image/gif', 'image'),
+    (riff(b'WEBPVP8 '), 'image/webp', 'image'),
+    (riff(b'WAVEfmt '), 'audio/wav', 'audio'),
+    (riff(b'AVI LIST'), 'video/x-msvideo', 'video'),
+    (iso_media(b'heic'), 'image/heic', 'image'),
+    (iso_media(b'avif'), 'image/avif', 'image'),
+    (iso_media(b'heis'), 'image/heic-sequence', 'image'),
+    (iso_media(b'hevc'), 'image/heic-sequence', 'image'),
+    (iso_media(b'msf1'), 'image/heif-sequence', 'image'),
+    (iso_media(b'crx '), 'image/x-canon-cr3', 'image'),
+    (iso_media(b'M4A '), 'audio/mp4', 'audio'),
+    (iso_media(b'M4B '), 'audio/mp4', 'audio'),
+    (iso_media(b'qt  '), 'video/quicktime', 'video'),
+    (iso_media(b'3gp4'), 'video/3gpp', 'video'),
+    (iso_media(b'isom'), 'video/mp4', 'video'),
+    (iso_media(b'iso2'), 'video/mp4', 'video'),
+    (iso_media(b'mp41'), 'video/mp4', 'video'),
+    (iso_media(b'mp42'), 'video/mp4', 'video'),
+    (iso_media(b'avc1'), 'video/mp4', 'video'),
+    (iso_media(b'dash'), 'video/mp4', 'video'),
+    (iso_media(b'M4V '), 'video/mp4', 'video'),
+    (b'\x1aE\xdf\xa3\x9fB\x86\x81\x01', 'video/webm', 'video'),
+    (b'ID3\x04\x00\x00\x00\x00\x00\x00', 'audio/mpeg', 'audio'),
+    (b'OggS\x00\x02\x00\x00', 'audio/ogg', 'audio'),
+    (b'%PDF-1.7\n', 'application/pdf', 'document'),
+    (b'PK\x03\x04\x14\x00\x00\x00', 'application/zip', 'archive'),
+    (b'\x1f\x8b\x08\x00\x00\x00\x00\x00', 'application/gzip', 'archive'),
+    (b'\x00' * 257 + b'ustar\x0000', 'application/x-tar', 'archive'),
+    (b'MZ\x90\x00\x03\x00\x00\x00', 'application/x-msdownload', 'executable'),
+    (b'\x7fELF\x02\x01\x01\x00', 'application/x-executable', 'executable'),
+])
+def test_sniffs_known_signatures(head, mime_type, category):
+    content_type = sniff_content_type(head)
+    assert (content_type.mime_type, content_type.category) == (mime_type, category)
+
+@pytest.mark.parametrize('head', [
+    iso_media(b'abcd'),
+    iso_media(b'hevx'),
+    b'just some text\n',
+    b'',
+    # WEBP at offset 8 outside a RIFF container
+    b'\x00' * 8 + b'WEBP',
+])
+def test_unknown_content_is_not_recognised(head):
+    assert sniff_content_type(head) is None
+
+def test_rejected_category_raises():
+    with pytest.raises(UnsupportedContentError):
+        check_content_type(sniff_content_type(b'MZ\x90\x00'), 'setup.jpg')
+    check_content_type(sniff_content_type(b'\xff\xd8\xff\xe0'), 'photo.jpg')
+    check_content_type(None, 'notes.txt')
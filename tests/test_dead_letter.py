@@ -0,0 +1,98 @@
+"""
+Dead-letter queue shared between processes
+"""
+import asyncio
+import threading
+import multiprocessing
+import bot
+from utils import job_journal
+from utils.dead_letter import DeadLetterQueue
+from utils.retry import TransferError
+from utils.status import StatusCoalescer
+
+# Processes pushing at once, and entries each of them pushes
+WRITERS = 4
+ENTRIES = 200
+
+def push_entries(path: str, writer: int) -> None:
+    """Push ENTRIES jobs from a separate process"""
+    queue = DeadLetterQueue(path)
+    for index in range(ENTRIES):
+        queue.push({'writer': writer, 'index': index})
+
+def test_drain_keeps_entries_pushed_by_other_processes(tmp_path):
+    path = str(tmp_path / 'dead_letter.jsonl')
+    queue = DeadLetterQueue(path)
+    context = multiprocessing.get_context('spawn')
+    writers = [context.Process(target=push_entries, args=(path, writer)) for writer in range(WRITERS)]
+    for process in writers:
+        process.start()
+
+    # Drain over and over while the writers append
+    drained = []
+    while any(process.is_alive() for process in writers):
+        drained.extend(queue.drain())
+    for process in writers:
+        process.join()
+    drained.extend(queue.drain())
+
+    assert sorted((entry['writer'], entry['index']) for entry in drained) == [
+        (writer, index) for writer in range(WRITERS) for index in range(ENTRIES)
+    ]
+    assert len(queue) == 0
+
+def test_push_and_drain(tmp_path):
+    queue = DeadLetterQueue(str(tmp_path / 'dead_letter.jsonl'))
+    assert queue.drain() == []
+    queue.push({'file_name': 'a.jpg'})
+    queue.push({'file_name': 'b.jpg'})
+    assert len(queue) == 2
+    assert [entry['file_name'] for entry in queue.drain()] == ['a.jpg', 'b.jpg']
+    assert len(queue) == 0
+
+class FakeMessage:
+    """Status message that records the texts it was edited to"""
+
+    def __init__(self):
+        self.chat_id = 1
+        self.message_id = 2
+        self.sent = []
+
+    async def edit_text(self, text: str, **kwargs) -> None:
+        self.sent.append(text)
+
+class RecordingQueue:
+    """Dead-letter queue that notes the thread every push ran on"""
+
+    def __init__(self):
+        self.entries = []
+        self.threads = []
+
+    def push(self, entry: dict) -> None:
+        self.threads.append(threading.get_ident())
+        self.entries.append(entry)
+
+def test_album_with_transient_failure_is_deferred(monkeypatch):
+    queue = RecordingQueue()
+    monkeypatch.setattr(bot, 'get_dead_letter_queue', lambda: queue)
+    monkeypatch.setattr(bot, 'get_dedup_cache', lambda: None)
+    monkeypatch.setattr(job_journal, 'JOB_JOURNAL_ENABLED', False)
+    monkeypatch.setattr(bot, 'get_status_coalescer', lambda: StatusCoalescer(min_interval=0.0))
+
+    async def create_gallery_page(image_urls, notes):
+        raise TransferError("Telegraph API returned status code 502", 502)
+
+    monkeypatch.setattr(bot, 'create_gallery_page', create_gallery_page)
+    items = [{'file_id': 'a', 'file_unique_id': 'ua', 'file_name': 'a.jpg', 'file_size': 10, 'embed': False}]
+    job = {'kind': 'album', 'username': 'user', 'items': items, 'chat_id': 1, 'message_id': 2}
+    message = FakeMessage()
+
+    async def run():
+        await bot.run_job(None, job, message)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert queue.entries == [{**job, 'replays': 1}]
+    # The push syncs a file, so it must not run on the event loop
+    assert queue.threads[0] != loop_thread
+    assert message.sent[-1].startswith("⚠️")
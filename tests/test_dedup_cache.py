@@ -0,0 +1,107 @@
+"""
+Two-tier dedup cache
+"""
+import asyncio
+from types import SimpleNamespace
+import pytest
+from utils import dedup_cache
+from utils.dedup_cache import DedupCache
+
+class Clock:
+    """Stands in for time.time so entries can be aged"""
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup_cache, 'time', SimpleNamespace(time=clock.time))
+    return clock
+
+@pytest.fixture
+def open_cache(tmp_path):
+    caches = []
+
+    def open_cache(**kwargs) -> DedupCache:
+        cache = DedupCache(str(tmp_path / 'dedup.sqlite3'), **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield open_cache
+    for cache in caches:
+        cache.close()
+
+def put(cache: DedupCache, name: str) -> None:
+    asyncio.run(cache.put(f"https://telegra.ph/{name}", file_unique_id=name))
+
+def get(cache: DedupCache, name: str):
+    entry = asyncio.run(cache.get_by_unique_id(name))
+    return entry and entry['page_url']
+
+def rows(cache: DedupCache) -> list:
+    return sorted(key for key, in cache._conn.execute("SELECT key FROM entries"))
+
+def test_memory_lru_sits_in_front_of_sqlite(clock, open_cache):
+    cache = open_cache(memory_size=2)
+    for name in ('a', 'b', 'c'):
+        put(cache, name)
+    assert list(cache._memory) == ['uid:b', 'uid:c']
+
+    assert get(cache, 'c') == 'https://telegra.ph/c'
+    assert cache.memory_hits == 1
+    # Evicted from memory but still on disk, and brought back into the LRU
+    assert get(cache, 'a') == 'https://telegra.ph/a'
+    assert cache.memory_hits == 1
+    assert list(cache._memory) == ['uid:c', 'uid:a']
+
+def test_entries_survive_a_restart(clock, open_cache):
+    put(open_cache(), 'a')
+    assert get(open_cache(), 'a') == 'https://telegra.ph/a'
+
+def test_expired_entries_miss(clock, open_cache):
+    cache = open_cache(ttl=60)
+    asyncio.run(cache.put('https://telegra.ph/a', file_unique_id='a', sha256='ab12'))
+    clock.now += 59
+    assert asyncio.run(cache.get_by_hash('ab12'))['page_url'] == 'https://telegra.ph/a'
+    clock.now += 1
+    assert get(cache, 'a') is None
+    assert asyncio.run(cache.get_by_hash('ab12')) is None
+    assert 'uid:a' not in cache._memory
+
+def test_eviction_drops_expired_and_least_recently_used_rows(clock, open_cache, monkeypatch):
+    monkeypatch.setattr(dedup_cache, '_EVICT_EVERY', 1)
+    cache = open_cache(max_entries=3, ttl=100)
+    put(cache, 'old')
+    clock.now += 50
+    put(cache, 'a')
+    put(cache, 'b')
+    assert rows(cache) == ['uid:a', 'uid:b', 'uid:old']
+
+    # Reading 'a' makes 'b' the least recently used row
+    clock.now += 10
+    cache._memory.clear()
+    assert get(cache, 'a')
+    clock.now += 50
+    put(cache, 'c')
+    assert rows(cache) == ['uid:a', 'uid:b', 'uid:c']
+    put(cache, 'd')
+    assert rows(cache) == ['uid:a', 'uid:c', 'uid:d']
+
+def test_counters(clock, open_cache):
+    cache = open_cache(memory_size=1)
+    put(cache, 'a')
+    put(cache, 'b')
+    get(cache, 'b')
+    get(cache, 'a')
+    get(cache, 'missing')
+    assert cache.stats() == {
+        'hits': 2,
+        'misses': 1,
+        'memory_hits': 1,
+        'hit_rate': 2 / 3,
+        'memory_entries': 1
+    }
@@ -0,0 +1,37 @@
+"""
+Files stored by a local Bot API server
+"""
+import pytest
+from utils.file_handler import local_path, map_local_file
+
+@pytest.mark.parametrize('file_path, expected', [
+    ('/var/lib/telegram-bot-api/123:abc/photos/file_0.jpg', '/var/lib/telegram-bot-api/123:abc/photos/file_0.jpg'),
+    ('photos/file_0.jpg', None),
+    ('https://api.telegram.org/file/bot123:abc/photos/file_0.jpg', None),
+    ('', None),
+    (None, None),
+])
+def test_local_path_only_takes_absolute_paths(file_path, expected):
+    assert local_path(file_path) == expected
+
+def test_map_local_file_exposes_the_content(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'\x00\x00\x00\x18ftypisom' + bytes(range(256)) * 64)
+    with map_local_file(str(path)) as view:
+        assert isinstance(view, memoryview)
+        assert view.readonly
+        assert view.tobytes() == path.read_bytes()
+
+def test_map_local_file_handles_empty_files(tmp_path):
+    path = tmp_path / 'empty'
+    path.write_bytes(b'')
+    with map_local_file(str(path)) as view:
+        assert len(view) == 0
+
+def test_map_local_file_survives_a_held_slice(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(b'\xff\xd8\xff' + b'\x00' * 1000)
+    with map_local_file(str(path)) as view:
+        # A failed upload can leave a slice of the mapping behind
+        held = view[:10]
+    assert held.tobytes() == b'\xff\xd8\xff' + b'\x00' * 7
@@ -0,0 +1,61 @@
+"""
+Image optimization: target size and format
+"""
+import io
+import pytest
+from utils import image_optimizer
+from utils.image_optimizer import optimize_image_bytes, should_optimize
+
+Image = pytest.importorskip('PIL.Image')
+
+def encode(image_format: str, size: tuple, mode: str = 'RGB', **options) -> bytes:
+    """Encode a noisy test image so recompression has something to do"""
+    image = Image.effect_noise(size, 64).convert(mode)
+    if 'A' in mode:
+        image.putalpha(Image.linear_gradient('L').resize(size))
+    output = io.BytesIO()
+    image.save(output, image_format, **options)
+    return output.getvalue()
+
+def decode(data: bytes):
+    return Image.open(io.BytesIO(data))
+
+def test_large_image_is_downscaled():
+    data = encode('JPEG', (3000, 1500), quality=95)
+    optimized, image_format = optimize_image_bytes(data, max_dimension=1000)
+    assert image_format == 'JPEG'
+    assert decode(optimized).size == (1000, 500)
+    assert len(optimized) < len(data)
+
+@pytest.mark.parametrize('mode, target_format', [
+    ('RGB', 'JPEG'),
+    ('RGBA', 'PNG'),
+])
+def test_unsupported_format_is_converted(mode, target_format):
+    data = encode('WEBP', (200, 100), mode)
+    optimized, image_format = optimize_image_bytes(data, max_dimension=1000)
+    assert image_format == target_format
+    assert decode(optimized).format == target_format
+    assert decode(optimized).size == (200, 100)
+
+def test_png_keeps_its_format():
+    data = encode('PNG', (2000, 500), 'RGBA')
+    optimized, image_format = optimize_image_bytes(data, max_dimension=1000)
+    assert image_format == 'PNG'
+    assert decode(optimized).mode == 'RGBA'
+
+@pytest.mark.parametrize('image_format', ['JPEG', 'PNG', 'GIF'])
+def test_small_supported_image_is_left_alone(image_format):
+    data = encode(image_format, (64, 64), optimize=True)
+    assert optimize_image_bytes(data, max_dimension=1000) == (None, image_format)
+
+def test_only_large_or_unsupported_images_are_optimized(monkeypatch):
+    monkeypatch.setattr(image_optimizer, 'IMAGE_OPTIMIZE', True)
+    monkeypatch.setattr(image_optimizer, 'IMAGE_OPTIMIZE_MIN_SIZE', 10000)
+    assert should_optimize(encode('WEBP', (16, 16)))
+    assert should_optimize(encode('PNG', (200, 200)))
+    assert not should_optimize(encode('PNG', (16, 16)))
+    assert not should_optimize(b'%PDF-1.7\n' + b'\x00' * 20000)
+
+    monkeypatch.setattr(image_optimizer, 'IMAGE_OPTIMIZE', False)
+    assert not should_optimize(encode('WEBP', (16, 16)))
@@ -0,0 +1,76 @@
+"""
+Job journal recovery and the temp file sweeper
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+import pytest
+from utils import job_journal
+from utils.file_handler import TEMP_PREFIX, process_start_time
+from utils.job_journal import JobJournal, process_identity, sweep_temp_files
+
+@pytest.fixture
+def other_process():
+    """A running process other than this one"""
+    process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    yield process.pid
+    process.kill()
+    process.wait()
+
+def record_as(journal, monkeypatch, journal_id: str, identity: tuple) -> None:
+    """Journal a job as if it was queued by the process with that identity"""
+    with monkeypatch.context() as patch:
+        patch.setattr(job_journal, 'process_identity', lambda: identity)
+        journal.record({'journal_id': journal_id})
+
+def test_claims_jobs_of_a_reused_pid(tmp_path, monkeypatch, other_process):
+    journal = JobJournal(str(tmp_path / 'jobs.sqlite3'), flush_interval=0)
+    started = process_start_time(other_process)
+    record_as(journal, monkeypatch, 'running', (other_process, started))
+    # The PID now belongs to a process that started later
+    record_as(journal, monkeypatch, 'reused', (other_process, started - 1))
+    record_as(journal, monkeypatch, 'own', process_identity())
+    claimed = journal.claim_orphans()
+    journal.close()
+
+    assert [job['journal_id'] for job, _, _ in claimed] == ['reused']
+
+def test_claimed_rows_belong_to_this_process(tmp_path, monkeypatch, other_process):
+    path = str(tmp_path / 'jobs.sqlite3')
+    journal = JobJournal(path, flush_interval=0)
+    record_as(journal, monkeypatch, 'reused', (other_process, process_start_time(other_process) - 1))
+    journal.claim_orphans()
+    journal.close()
+
+    row = sqlite3.connect(path).execute("SELECT pid, started FROM jobs WHERE id = 'reused'").fetchone()
+    assert row == process_identity()
+
+def test_old_journal_gets_start_time_column(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, job TEXT, stage TEXT NOT NULL, pid INTEGER, "
+            "created_at REAL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO jobs VALUES ('old', '{\"journal_id\": \"old\"}', 'running', ?, 0, 0)",
+                     (os.getpid(),))
+    conn.close()
+
+    journal = JobJournal(path, flush_interval=0)
+    journal.record({'journal_id': 'new'})
+    # Rows without a start time fall back to checking the PID alone
+    assert journal.claim_orphans() == []
+    assert journal.pending() == 2
+    journal.close()
+
+def test_sweeps_temp_files_of_a_reused_pid(tmp_path, other_process):
+    started = process_start_time(other_process)
+    live = tmp_path / f"{TEMP_PREFIX}{other_process}.{started}-live"
+    reused = tmp_path / f"{TEMP_PREFIX}{other_process}.{started - 1}-reused"
+    legacy = tmp_path / f"{TEMP_PREFIX}{other_process}-legacy"
+    for entry in (live, reused, legacy):
+        entry.mkdir()
+
+    assert sweep_temp_files(tmp_path) == 1
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == sorted([live.name, legacy.name])
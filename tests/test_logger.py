@@ -0,0 +1,48 @@
+"""
+Log records queued for the background writer and sent from worker processes
+"""
+import queue
+import logging
+import multiprocessing
+from utils.logger import DroppingQueueHandler, setup_worker_logger
+
+def log_from_worker(log_queue) -> None:
+    """Log a message and an exception the way a transfer worker does"""
+    setup_worker_logger(log_queue)
+    logger = logging.getLogger('worker')
+    logger.info("Processing %s from user %s", 'photo', 42)
+    try:
+        raise ValueError("broken upload")
+    except ValueError:
+        logger.error("Error processing media: %s", 'upload', exc_info=True)
+
+def test_prepare_formats_message_and_traceback():
+    handler = DroppingQueueHandler(queue.Queue())
+    logger = logging.getLogger('test_prepare')
+    logger.addHandler(handler)
+    logger.propagate = False
+    arguments = ['first']
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        logger.error("Failed with %s", arguments, exc_info=True)
+    arguments.append('changed later')
+    logger.removeHandler(handler)
+
+    queued = handler.queue.get_nowait()
+    assert queued.getMessage().startswith("Failed with ['first']\n")
+    assert 'RuntimeError: boom' in queued.getMessage()
+    assert queued.args is None and queued.exc_info is None
+
+def test_worker_records_reach_the_parent_queue():
+    context = multiprocessing.get_context('spawn')
+    log_queue = context.Queue()
+    process = context.Process(target=log_from_worker, args=(log_queue,))
+    process.start()
+    records = [log_queue.get(timeout=30), log_queue.get(timeout=30)]
+    process.join(30)
+
+    assert records[0].getMessage() == "Processing photo from user 42"
+    assert records[1].levelno == logging.ERROR
+    assert 'Error processing media: upload' in records[1].getMessage()
+    assert 'ValueError: broken upload' in records[1].getMessage()
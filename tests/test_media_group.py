@@ -0,0 +1,54 @@
+"""
+Aggregation of album messages
+"""
+import asyncio
+from utils.media_group import MediaGroupCollector
+
+WINDOW = 0.05
+
+def collect(schedule: list) -> list:
+    """
+    Add items to one group at the given delays and return the batches
+
+    Args:
+        schedule: (seconds to wait, item) pairs
+    """
+    async def test():
+        collector = MediaGroupCollector(window=WINDOW)
+        batches = []
+
+        async def on_complete(items):
+            batches.append(items)
+
+        for delay, item in schedule:
+            await asyncio.sleep(delay)
+            collector.add(('chat', 'album'), item, on_complete)
+        await asyncio.sleep(WINDOW * 3)
+        await collector.close()
+        return batches
+
+    return asyncio.run(test())
+
+def test_items_within_the_window_make_one_job():
+    assert collect([(0, 1), (WINDOW / 5, 2), (WINDOW / 5, 3)]) == [[1, 2, 3]]
+
+def test_late_item_starts_a_new_job():
+    assert collect([(0, 1), (0, 2), (WINDOW * 3, 3)]) == [[1, 2], [3]]
+
+def test_close_hands_over_open_groups_and_waits():
+    async def test():
+        collector = MediaGroupCollector(window=60)
+        batches = []
+
+        async def on_complete(items):
+            await asyncio.sleep(0.01)
+            batches.append(items)
+
+        collector.add('album', 1, on_complete)
+        collector.add('album', 2, on_complete)
+        await collector.close()
+        return batches, collector._tasks
+
+    batches, tasks = asyncio.run(test())
+    assert batches == [[1, 2]]
+    assert not tasks
@@ -0,0 +1,59 @@
+"""
+Metrics endpoint
+"""
+import socket
+import asyncio
+from aiohttp import ClientSession
+from utils.metrics import collect_metrics, counter, histogram, merge_metrics, render_metrics, start_metrics_server
+
+def test_metrics_are_served():
+    requests = counter('m2t_test_requests_total', 'Requests seen by the test', ('kind',))
+    requests.inc(kind='photo')
+
+    async def test():
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        runner = await start_metrics_server(port=port)
+        try:
+            async with ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    return await response.text()
+        finally:
+            await runner.cleanup()
+
+    assert 'm2t_test_requests_total{kind="photo"} 1' in asyncio.run(test())
+
+def test_taken_port_does_not_stop_startup():
+    async def test():
+        with socket.socket() as taken:
+            taken.bind(('127.0.0.1', 0))
+            taken.listen()
+            return await start_metrics_server(port=taken.getsockname()[1])
+
+    assert asyncio.run(test()) is None
+
+def test_disabled_without_port():
+    assert asyncio.run(start_metrics_server(port=0)) is None
+
+def test_metrics_collected_in_a_worker_are_merged():
+    jobs = counter('m2t_test_jobs_total', 'Jobs seen by the test', ('outcome',))
+    latency = histogram('m2t_test_latency_seconds', 'Latency seen by the test', buckets=(0.1, 1))
+
+    # What a worker records and sends to the bot process
+    jobs.inc(outcome='success')
+    jobs.inc(outcome='success')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    collected = collect_metrics()
+    assert 'm2t_test_jobs_total' in collected
+    assert render_metrics().count('m2t_test_jobs_total{') == 0
+
+    # Merged twice, as if two workers sent the same values
+    merge_metrics(collected)
+    merge_metrics(collected)
+    text = render_metrics()
+    assert 'm2t_test_jobs_total{outcome="success"} 4' in text
+    assert 'm2t_test_latency_seconds_bucket{le="0.1"} 2' in text
+    assert 'm2t_test_latency_seconds_count 4' in text
+    assert 'm2t_test_latency_seconds_sum 1.1' in text
@@ -0,0 +1,113 @@
+"""
+Ranged downloads against a local file server with a slow disk
+"""
+import os
+import asyncio
+import threading
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from utils.http_client import close_http_session
+from utils.ranged_download import RangedDownload, download_ranged
+
+# Size of the served file
+SIZE = 4 * 1024 * 1024
+
+# Longest a fake disk call waits for the test
+WAIT_TIME = 5.0
+
+BODY = os.urandom(SIZE)
+
+async def serve_file(request) -> web.Response:
+    """Answer with the file, honoring a single Range header"""
+    if 'Range' not in request.headers:
+        return web.Response(body=BODY)
+    first, _, last = request.headers['Range'].removeprefix('bytes=').partition('-')
+    first, last = int(first), min(int(last or SIZE - 1), SIZE - 1)
+    return web.Response(status=206, body=BODY[first:last + 1],
+                        headers={'Content-Range': f"bytes {first}-{last}/{SIZE}"})
+
+class BlockingDisk:
+    """
+    pwrite stand-in that holds every write until it is released
+
+    Each write also asks the event loop to run a callback and waits for it,
+    so a write made on the event loop thread is caught instead of hanging.
+    """
+
+    def __init__(self, monkeypatch, loop=None):
+        self.loop = loop
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.in_flight = 0
+        self.blocked_loop = False
+        self._lock = threading.Lock()
+        self._pwrite = os.pwrite
+        monkeypatch.setattr(os, 'pwrite', self.pwrite)
+
+    def pwrite(self, fd, data, offset):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            self.started.set()
+            if self.loop and not self.blocked_loop:
+                ticked = threading.Event()
+                self.loop.call_soon_threadsafe(ticked.set)
+                if not ticked.wait(WAIT_TIME):
+                    self.blocked_loop = True
+            self.release.wait(WAIT_TIME)
+            return self._pwrite(fd, data, offset)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+def run(test):
+    """Run a test coroutine with the file server up, passing it the file URL"""
+    async def main():
+        app = web.Application()
+        app.router.add_get('/file', serve_file)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            return await test(str(server.make_url('/file')))
+        finally:
+            await close_http_session()
+            await server.close()
+    return asyncio.run(main())
+
+def test_disk_writes_run_off_the_event_loop(tmp_path, monkeypatch):
+    output = tmp_path / 'file'
+
+    async def test(url):
+        disk = BlockingDisk(monkeypatch, asyncio.get_running_loop())
+        disk.release.set()
+        stats = await download_ranged(url, str(output), min_chunk=512 * 1024)
+        return stats, disk
+
+    stats, disk = run(test)
+    assert stats['mode'] == 'ranged'
+    assert output.read_bytes() == BODY
+    # A write on the event loop thread keeps the loop from answering it
+    assert not disk.blocked_loop
+
+def test_close_waits_for_writes_of_cancelled_segments(tmp_path, monkeypatch):
+    fd = os.open(tmp_path / 'file', os.O_WRONLY | os.O_CREAT)
+
+    async def test(url):
+        disk = BlockingDisk(monkeypatch)
+        download = RangedDownload(url, fd, min_chunk=512 * 1024)
+        task = asyncio.create_task(download.run())
+        assert await asyncio.to_thread(disk.started.wait, WAIT_TIME)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        closing = asyncio.create_task(download.close())
+        await asyncio.sleep(0.01)
+        # The held write keeps close from returning
+        assert not closing.done()
+        disk.release.set()
+        await closing
+        return disk.in_flight
+
+    in_flight = run(test)
+    os.close(fd)
+    assert in_flight == 0
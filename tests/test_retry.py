@@ -0,0 +1,65 @@
+"""
+Retry classification and getFile retries
+"""
+import asyncio
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from utils.file_handler import get_telegram_file
+from utils.retry import TransferError, get_breaker, is_retryable, is_transient
+
+@pytest.mark.parametrize('error', [
+    TimedOut(),
+    NetworkError("Internal Server Error (500)"),
+    RetryAfter(1),
+    TransferError("Bad Gateway", 502),
+    TransferError("Too Many Requests", 429),
+    asyncio.TimeoutError()
+])
+def test_transient_errors_are_retried(error):
+    assert is_retryable(error)
+
+@pytest.mark.parametrize('error', [
+    BadRequest("Wrong file_id or the file is temporarily unavailable"),
+    Forbidden("Forbidden: bot was blocked by the user"),
+    TransferError("Not Found", 404),
+    ValueError("bad")
+])
+def test_permanent_errors_are_not_retried(error):
+    assert not is_retryable(error)
+
+def test_wrapped_network_error_is_transient():
+    try:
+        try:
+            raise TimedOut()
+        except TimedOut as e:
+            raise Exception("Failed to download file") from e
+    except Exception as e:
+        assert is_transient(e)
+
+class FlakyBot:
+    """Bot whose getFile fails a number of times before it answers"""
+
+    def __init__(self, failures: list):
+        self.failures = list(failures)
+        self.calls = 0
+
+    async def get_file(self, file_id: str):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return {'file_id': file_id, 'file_path': f"documents/{file_id}"}
+
+def test_get_file_retries_network_errors(monkeypatch):
+    monkeypatch.setattr('utils.retry.backoff_delay', lambda attempt: 0)
+    bot = FlakyBot([NetworkError("Internal Server Error (500)"), TimedOut()])
+    file = asyncio.run(get_telegram_file(bot, 'abc'))
+    assert file['file_path'] == 'documents/abc'
+    assert bot.calls == 3
+    assert get_breaker('telegram').state == 'closed'
+
+def test_get_file_does_not_retry_bad_request(monkeypatch):
+    monkeypatch.setattr('utils.retry.backoff_delay', lambda attempt: 0)
+    bot = FlakyBot([BadRequest("Invalid file_id")])
+    with pytest.raises(BadRequest):
+        asyncio.run(get_telegram_file(bot, 'abc'))
+    assert bot.calls == 1
@@ -0,0 +1,93 @@
+"""
+Fair job scheduler
+"""
+import asyncio
+import pytest
+from utils.scheduler import JobScheduler, QueueFullError
+
+def test_wait_for_room_wakes_when_a_job_is_taken():
+    async def test():
+        scheduler = JobScheduler(max_jobs=1, max_queue=1)
+        release = asyncio.Event()
+        scheduler.submit(1, release.wait)
+        waiting = asyncio.create_task(scheduler.wait_for_room())
+        await asyncio.sleep(0.01)
+        full = not waiting.done()
+
+        # The job starts, which makes room in the queue
+        await scheduler.start()
+        await asyncio.wait_for(waiting, 1)
+        release.set()
+        await asyncio.wait_for(scheduler.join(), 1)
+        await scheduler.stop()
+        return full, scheduler.stats()
+
+    full, stats = asyncio.run(test())
+    assert full
+    assert stats['completed'] == 1
+
+def run_jobs(scheduler: JobScheduler, jobs: list) -> None:
+    """Submit (chat_id, job) pairs before starting, then run them all"""
+    async def test():
+        for chat_id, job in jobs:
+            scheduler.submit(chat_id, job)
+        await scheduler.start()
+        await asyncio.wait_for(scheduler.join(), 5)
+        await scheduler.stop()
+
+    asyncio.run(test())
+
+def test_busy_chat_does_not_starve_others():
+    order = []
+
+    def job(chat_id):
+        async def run():
+            order.append(chat_id)
+        return run
+
+    scheduler = JobScheduler(max_jobs=1)
+    run_jobs(scheduler, [('busy', job('busy'))] * 5 + [('quiet', job('quiet'))] * 2)
+    assert order == ['busy', 'quiet', 'busy', 'quiet', 'busy', 'busy', 'busy']
+
+def test_stages_have_their_own_caps():
+    running = {'download': 0, 'upload': 0}
+    peak = dict(running)
+
+    def job(name):
+        async def run():
+            async with scheduler.stage(name):
+                running[name] += 1
+                peak[name] = max(peak[name], running[name])
+                await asyncio.sleep(0.01)
+                running[name] -= 1
+        return run
+
+    scheduler = JobScheduler(max_jobs=12, max_downloads=2, max_uploads=3)
+    run_jobs(scheduler, [(number, job(name)) for number in range(6) for name in ('download', 'upload')])
+    assert peak == {'download': 2, 'upload': 3}
+    assert scheduler.stats()['completed'] == 12
+
+def test_submit_beyond_the_queue_size_is_refused():
+    async def job():
+        pass
+
+    scheduler = JobScheduler(max_jobs=1, max_queue=2)
+    scheduler.submit(1, job)
+    scheduler.submit(2, job)
+    with pytest.raises(QueueFullError):
+        scheduler.submit(3, job)
+    assert scheduler.stats()['queue_depth'] == 2
+    assert scheduler.stats()['rejected'] == 1
+
+def test_position_for_counts_round_robin_turns():
+    async def job():
+        pass
+
+    scheduler = JobScheduler(max_jobs=1)
+    assert scheduler.position_for('a') == 0
+    for chat_id in ('a', 'a', 'a', 'b'):
+        scheduler.submit(chat_id, job)
+    # 'b' is served after one job of 'a', then waits for its second turn
+    assert scheduler.position_for('b') == 4
+    assert scheduler.position_for('c') == 3
+    assert scheduler.position_for('a') == 5
@@ -0,0 +1,67 @@
+"""
+Status message coalescing
+"""
+import asyncio
+from utils.status import StatusCoalescer
+
+# Time a fake edit takes, like a Bot API round trip
+EDIT_TIME = 0.05
+
+class FakeMessage:
+    """Status message that records the texts it was edited to"""
+
+    def __init__(self, chat_id: int = 1, message_id: int = 1):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.sent = []
+
+    async def edit_text(self, text: str, **kwargs) -> None:
+        await asyncio.sleep(EDIT_TIME)
+        self.sent.append(text)
+
+def test_update_during_edit_is_sent():
+    async def test():
+        coalescer = StatusCoalescer(min_interval=0.0)
+        message = FakeMessage()
+        await coalescer.update(message, "Downloading")
+        # The next state arrives while the first edit is in flight
+        await asyncio.sleep(EDIT_TIME / 2)
+        await coalescer.update(message, "Uploading")
+        await asyncio.sleep(EDIT_TIME * 4)
+        return coalescer, message
+
+    coalescer, message = asyncio.run(test())
+    assert message.sent == ["Downloading", "Uploading"]
+    assert not coalescer._pending
+    assert not coalescer._tasks
+
+def test_superseded_state_is_dropped():
+    async def test():
+        coalescer = StatusCoalescer(min_interval=EDIT_TIME * 2)
+        message = FakeMessage()
+        await coalescer.update(message, "Downloading")
+        await asyncio.sleep(EDIT_TIME / 2)
+        # Both arrive within the chat's interval, only the latest goes out
+        await coalescer.update(message, "Uploading")
+        await coalescer.update(message, "Uploading 50%")
+        await asyncio.sleep(EDIT_TIME * 6)
+        await coalescer.final(message, "Done")
+        return coalescer, message
+
+    coalescer, message = asyncio.run(test())
+    assert message.sent == ["Downloading", "Uploading 50%", "Done"]
+    assert coalescer.calls_saved == 1
+
+def test_final_replaces_pending_state():
+    async def test():
+        coalescer = StatusCoalescer(min_interval=1.0)
+        message = FakeMessage()
+        await coalescer.update(message, "Downloading")
+        await asyncio.sleep(EDIT_TIME * 2)
+        await coalescer.update(message, "Uploading")
+        await coalescer.final(message, "Done")
+        return coalescer, message
+
+    coalescer, message = asyncio.run(test())
+    assert message.sent == ["Downloading", "Done"]
+    assert not coalescer._tasks
@@ -0,0 +1,74 @@
+"""
+Fallback of a failed streaming upload to a spooled copy
+"""
+import time
+import asyncio
+import pytest
+import telegraph_client
+from utils.content_type import ContentType
+from utils.retry import CircuitBreaker, CircuitOpenError, TransferError
+
+JPEG = ContentType('image/jpeg', 'image', '.jpg')
+
+BODY = b'\xff\xd8\xff' + b'\x00' * 1000
+
+class FakeTransfers:
+    """Stands in for the Telegraph upload and the Telegram download"""
+
+    def __init__(self, monkeypatch, streamed_error: Exception):
+        self.streamed_error = streamed_error
+        self.downloads = 0
+        self.uploads = []
+        self.breakers = {name: CircuitBreaker(name) for name in ('telegram', 'telegraph')}
+        monkeypatch.setattr(telegraph_client, 'upload_media', self.upload_media)
+        monkeypatch.setattr(telegraph_client, 'download_to_fileobj', self.download_to_fileobj)
+        monkeypatch.setattr(telegraph_client, 'get_breaker', self.breakers.__getitem__)
+        monkeypatch.setattr(telegraph_client, 'optimizer_enabled', lambda: False)
+
+    async def upload_media(self, data, file_name, mime_type=None):
+        if hasattr(data, 'read'):
+            self.uploads.append('spooled')
+            return 'https://telegra.ph/file/spooled.jpg'
+        self.uploads.append('streamed')
+        async for _ in data:
+            pass
+        raise self.streamed_error
+
+    async def download_to_fileobj(self, file_path, fileobj, digest=None):
+        self.downloads += 1
+        fileobj.write(BODY)
+        if digest is not None:
+            digest.update(BODY)
+
+async def chunks():
+    yield BODY
+
+def stream_media():
+    return asyncio.run(telegraph_client.stream_media('photos/file.jpg', 'file.jpg', chunks(), JPEG, len(BODY)))
+
+def test_transient_failure_is_retried_from_a_spool(monkeypatch):
+    transfers = FakeTransfers(monkeypatch, TransferError("Bad gateway", 502))
+    media_url, _ = stream_media()
+    assert media_url.endswith('spooled.jpg')
+    assert transfers.uploads == ['streamed', 'spooled']
+    assert transfers.downloads == 1
+
+@pytest.mark.parametrize('error', [
+    TransferError("Telegraph API returned status code 400", 400),
+    Exception("Invalid response from Telegraph API"),
+    CircuitOpenError("telegraph is unavailable, try again later"),
+])
+def test_permanent_failure_is_not_downloaded_again(monkeypatch, error):
+    transfers = FakeTransfers(monkeypatch, error)
+    with pytest.raises(type(error)):
+        stream_media()
+    assert transfers.uploads == ['streamed']
+    assert transfers.downloads == 0
+
+@pytest.mark.parametrize('endpoint', ['telegram', 'telegraph'])
+def test_open_breaker_skips_the_spooled_retry(monkeypatch, endpoint):
+    transfers = FakeTransfers(monkeypatch, TransferError("Bad gateway", 502))
+    transfers.breakers[endpoint].opened_at = time.monotonic()
+    with pytest.raises(TransferError):
+        stream_media()
+    assert transfers.downloads == 0
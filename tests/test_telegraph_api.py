@@ -0,0 +1,197 @@
+"""
+The async Telegraph client against a local fake Telegraph API
+
+Every createPage call takes DELAY seconds on the fake server. Concurrent
+calls have to overlap on the event loop, so N of them finish in about one
+DELAY instead of N.
+"""
+import json
+import time
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from utils import retry
+from utils.http_client import close_http_session
+from utils.retry import TransferError
+from utils.telegraph_api import AsyncTelegraph, FloodWaitError, TelegraphException
+from utils.token_pool import TelegraphTokenPool
+
+# Time the fake server takes to answer createPage
+DELAY = 0.3
+
+# Concurrent calls per test
+CALLS = 10
+
+class FakeTelegraph:
+    """Telegraph API stand-in that counts the createPage calls in flight"""
+
+    def __init__(self, flood_tokens: tuple = (), rejections: tuple = (), lost_answers: tuple = ()):
+        self.flood_tokens = set(flood_tokens)
+        # Statuses answered to the first calls before doing anything
+        self.rejections = list(rejections)
+        # Statuses answered to the first calls after the page was created
+        self.lost_answers = list(lost_answers)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.pages = []
+        self.app = web.Application()
+        self.app.router.add_post('/createPage', self.create_page)
+
+    async def create_page(self, request) -> web.Response:
+        params = dict(await request.post())
+        if params.get('access_token') in self.flood_tokens:
+            return web.json_response({'ok': False, 'error': 'FLOOD_WAIT_7'})
+        if self.rejections:
+            return web.Response(status=self.rejections.pop(0))
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(DELAY)
+        finally:
+            self.in_flight -= 1
+
+        path = f"page-{len(self.pages)}"
+        self.pages.append({'path': path, 'token': params.get('access_token'),
+                           'content': json.loads(params['content'])})
+        if self.lost_answers:
+            return web.Response(status=self.lost_answers.pop(0))
+        return web.json_response({'ok': True, 'result': {'path': path, 'url': f"https://telegra.ph/{path}"}})
+
+def run(test, fake: FakeTelegraph):
+    """Run a test coroutine with the fake server up, passing it the API URL"""
+    async def main():
+        server = TestServer(fake.app)
+        await server.start_server()
+        try:
+            return await test(str(server.make_url('')))
+        finally:
+            await close_http_session()
+            await server.close()
+    return asyncio.run(main())
+
+def test_concurrent_create_page_calls_overlap():
+    fake = FakeTelegraph()
+
+    async def test(api_url):
+        client = AsyncTelegraph(access_token='token', api_url=api_url)
+        started = time.perf_counter()
+        pages = await asyncio.gather(*(
+            client.create_page(f"Page {index}", content=[{'tag': 'p', 'children': [str(index)]}])
+            for index in range(CALLS)
+        ))
+        return pages, time.perf_counter() - started
+
+    pages, elapsed = run(test, fake)
+    assert len({page['path'] for page in pages}) == CALLS
+    assert fake.max_in_flight == CALLS
+    # Serialized calls would take CALLS * DELAY
+    assert elapsed < DELAY * 3
+
+def test_event_loop_keeps_running_during_create_page():
+    fake = FakeTelegraph()
+
+    async def test(api_url):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        await AsyncTelegraph(access_token='token', api_url=api_url).create_page('Page')
+        ticking.cancel()
+        return ticks
+
+    # A blocking call would stall the ticker for the whole DELAY
+    assert run(test, fake) >= DELAY / 0.01 / 2
+
+def test_token_pool_spreads_concurrent_pages():
+    fake = FakeTelegraph()
+    tokens = ['first', 'second', 'third']
+
+    async def test(api_url):
+        pool = TelegraphTokenPool(tokens, api_url=api_url)
+        started = time.perf_counter()
+        await asyncio.gather(*(pool.create_page(f"Page {index}") for index in range(CALLS)))
+        return time.perf_counter() - started
+
+    elapsed = run(test, fake)
+    assert elapsed < DELAY * 3
+    assert {page['token'] for page in fake.pages} == set(tokens)
+
+def test_token_pool_moves_past_flood_wait():
+    fake = FakeTelegraph(flood_tokens=('flooded',))
+
+    async def test(api_url):
+        pool = TelegraphTokenPool(['flooded', 'healthy'], api_url=api_url)
+        pages = await asyncio.gather(*(pool.create_page(f"Page {index}") for index in range(CALLS)))
+        return pool, pages
+
+    pool, pages = run(test, fake)
+    assert len(pages) == CALLS
+    assert {page['token'] for page in fake.pages} == {'healthy'}
+    assert pool.stats()[0]['cooldown'] > 0
+
+def test_flood_wait_is_raised_without_waiting():
+    fake = FakeTelegraph(flood_tokens=('flooded',))
+
+    async def test(api_url):
+        client = AsyncTelegraph(access_token='flooded', api_url=api_url, wait_on_flood=False)
+        with pytest.raises(FloodWaitError) as error:
+            await client.create_page('Page')
+        return error.value
+
+    error = run(test, fake)
+    assert isinstance(error, TelegraphException)
+    assert error.retry_after == 7
+
+@pytest.fixture
+def fresh_breakers(monkeypatch):
+    """Retry without backoff and with breakers no other test has tripped"""
+    monkeypatch.setattr(retry, '_breakers', {})
+    monkeypatch.setattr(retry, 'backoff_delay', lambda attempt: 0.0)
+
+def test_create_page_is_not_repeated_after_a_5xx(fresh_breakers):
+    # The page was created but the answer got lost
+    fake = FakeTelegraph(lost_answers=(502,))
+
+    async def test(api_url):
+        with pytest.raises(TransferError):
+            await AsyncTelegraph(access_token='token', api_url=api_url).create_page('Page')
+
+    run(test, fake)
+    assert len(fake.pages) == 1
+
+def test_create_page_is_retried_after_a_429(fresh_breakers):
+    fake = FakeTelegraph(rejections=(429,))
+
+    async def test(api_url):
+        return await AsyncTelegraph(access_token='token', api_url=api_url).create_page('Page')
+
+    assert run(test, fake)['path'] == 'page-0'
+
+def test_create_page_is_retried_when_the_connection_fails(fresh_breakers):
+    async def test(api_url):
+        client = AsyncTelegraph(access_token='token', api_url=api_url)
+        down = AsyncTelegraph(access_token='token', api_url='http://127.0.0.1:1')
+        attempts = 0
+        post = client._post
+
+        async def flaky_post(url, values):
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                # Nothing listens on port 1, so the request is never sent
+                return await down._post(down.api_url + '/createPage', values)
+            return await post(url, values)
+
+        client._post = flaky_post
+        return await client.create_page('Page'), attempts
+
+    page, attempts = run(test, FakeTelegraph())
+    assert attempts == 2
+    assert page['path'] == 'page-0'
@@ -0,0 +1,66 @@
+"""
+ffmpeg transcoding, run against stand-in ffmpeg scripts
+"""
+import os
+import sys
+import asyncio
+import shutil
+import pytest
+from utils import transcoder
+from utils.content_type import UnsupportedContentError
+
+def fake_command(tmp_path, name: str, code: str) -> str:
+    """Write an executable Python script standing in for ffmpeg or ffprobe"""
+    path = tmp_path / name
+    path.write_text(f"#!{sys.executable}\nimport os, sys, time\n{code}\n")
+    path.chmod(0o755)
+    return str(path)
+
+def test_cancelled_command_is_killed_and_reaped(tmp_path):
+    pid_path = tmp_path / 'pid'
+    command = fake_command(tmp_path, 'ffmpeg', f"open({str(pid_path)!r}, 'w').write(str(os.getpid()))\ntime.sleep(60)")
+
+    async def test():
+        task = asyncio.create_task(transcoder._run(command))
+        while not pid_path.exists() or not pid_path.read_text():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return int(pid_path.read_text())
+
+    pid = asyncio.run(test())
+    # Killed and waited for, so not even a zombie is left
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+def test_output_over_the_limit_is_refused(tmp_path, monkeypatch):
+    ffmpeg = fake_command(tmp_path, 'ffmpeg', "open(sys.argv[-1], 'wb').write(b'\\0' * 2000)")
+    monkeypatch.setattr(transcoder, 'FFMPEG_PATH', ffmpeg)
+    monkeypatch.setattr(transcoder, 'FFPROBE_PATH', str(tmp_path / 'missing-ffprobe'))
+    source = tmp_path / 'source.webm'
+    source.write_bytes(b'\0' * 100)
+
+    async def transcode(max_size):
+        return await transcoder.transcode_to_mp4(str(source), str(tmp_path / 'video.mp4'), max_size)
+
+    with pytest.raises(UnsupportedContentError):
+        asyncio.run(transcode(1000))
+    assert asyncio.run(transcode(5000)) == str(tmp_path / 'video.mp4')
+
+def test_ffmpeg_lookup_is_cached(monkeypatch):
+    calls = []
+
+    def which(command):
+        calls.append(command)
+        return '/usr/bin/' + command
+
+    monkeypatch.setattr(shutil, 'which', which)
+    monkeypatch.setattr(transcoder, 'VIDEO_TRANSCODE', True)
+    monkeypatch.setattr(transcoder, 'FFMPEG_PATH', 'ffmpeg-cached-test')
+    transcoder._installed.cache_clear()
+    try:
+        assert all(transcoder.transcoder_enabled() for _ in range(5))
+    finally:
+        transcoder._installed.cache_clear()
+    assert calls == ['ffmpeg-cached-test']
@@ -0,0 +1,101 @@
+"""
+Webhook secret checks and sticky routing of chats between workers
+"""
+import asyncio
+import pytest
+import aiohttp
+from aiohttp.test_utils import TestServer
+from utils.http_client import close_http_session
+from utils.webhook import SECRET_HEADER, WEBHOOK_PATH, create_webhook_app
+
+SECRET = 'secret-token'
+
+class FakeApplication:
+    """Stand-in for the telegram Application that collects queued updates"""
+
+    def __init__(self):
+        self.bot = None
+        self.running = True
+        self.update_queue = asyncio.Queue()
+
+    def chats(self) -> list:
+        updates = []
+        while not self.update_queue.empty():
+            updates.append(self.update_queue.get_nowait().effective_chat.id)
+        return updates
+
+def message(chat_id: int, update_id: int = 1) -> dict:
+    """A raw text message update"""
+    return {
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'date': 0, 'text': 'hi',
+                    'chat': {'id': chat_id, 'type': 'private'}}
+    }
+
+def run(test, workers: int = 1):
+    """Run a test coroutine against webhook workers, passing it their URLs and applications"""
+    async def main():
+        applications = [FakeApplication() for _ in range(workers)]
+        # Filled in once the servers know their ports
+        urls = []
+        servers = [
+            TestServer(create_webhook_app(application, SECRET, index, urls if workers > 1 else None))
+            for index, application in enumerate(applications)
+        ]
+        for server in servers:
+            await server.start_server()
+            urls.append(str(server.make_url(WEBHOOK_PATH)))
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await test(session, urls, applications)
+        finally:
+            await close_http_session()
+            for server in servers:
+                await server.close()
+    return asyncio.run(main())
+
+@pytest.mark.parametrize('headers', [
+    {},
+    {SECRET_HEADER: 'wrong'},
+    {SECRET_HEADER: ''},
+    {SECRET_HEADER: 'sécret-tökén'},
+])
+def test_rejects_bad_secret(headers):
+    async def test(session, urls, applications):
+        async with session.post(urls[0], json=message(1), headers=headers) as response:
+            return response.status, applications[0].chats()
+
+    assert run(test) == (403, [])
+
+def test_accepts_update_with_secret():
+    async def test(session, urls, applications):
+        async with session.post(urls[0], json=message(42), headers={SECRET_HEADER: SECRET}) as response:
+            return response.status, applications[0].chats()
+
+    assert run(test) == (200, [42])
+
+def test_rejects_body_that_is_not_an_update():
+    async def test(session, urls, applications):
+        statuses = []
+        for body in (b'not json', b'[1, 2]'):
+            async with session.post(urls[0], data=body, headers={SECRET_HEADER: SECRET}) as response:
+                statuses.append(response.status)
+        return statuses
+
+    assert run(test) == [400, 400]
+
+def test_updates_of_a_chat_reach_one_worker():
+    async def test(session, urls, applications):
+        update_id = 0
+        # Round robin over the workers, like a reverse proxy
+        for chat_id in (10, 11, 12, 13):
+            for url in urls:
+                update_id += 1
+                async with session.post(url, json=message(chat_id, update_id),
+                                        headers={SECRET_HEADER: SECRET}) as response:
+                    assert response.status == 200
+        return [application.chats() for application in applications]
+
+    first, second = run(test, workers=2)
+    assert first == [10, 10, 12, 12]
+    assert second == [11, 11, 13, 13]
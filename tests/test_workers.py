@@ -0,0 +1,39 @@
+"""
+Transfer worker pool with spawned worker processes
+"""
+import time
+import asyncio
+from utils.workers import WorkerPool
+
+# Jobs big enough that a few of them fill a pipe buffer
+PAYLOAD = 'x' * 64 * 1024
+
+JOBS = 40
+
+async def setup(index: int) -> dict:
+    return {'index': index}
+
+async def handle(state: dict, job: dict) -> None:
+    await asyncio.sleep(0.01)
+
+async def teardown(state: dict) -> None:
+    pass
+
+def test_submit_does_not_block_on_a_full_pipe():
+    async def test():
+        pool = WorkerPool(1, setup, handle, teardown, queue_size=JOBS)
+        await pool.start()
+        try:
+            longest = 0.0
+            for number in range(JOBS):
+                started = time.perf_counter()
+                pool.submit({'chat_id': number, 'payload': PAYLOAD})
+                longest = max(longest, time.perf_counter() - started)
+        finally:
+            await pool.stop(timeout=30)
+        return pool, longest
+
+    pool, longest = asyncio.run(test())
+    # A send on the event loop waits for the worker to start reading
+    assert longest < 0.1
+    assert pool.completed == JOBS
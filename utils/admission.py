@@ -0,0 +1,90 @@
+"""
+Pre-flight admission control from the metadata Telegram sends with a file
+"""
+import os
+from collections import namedtuple
+from utils.logger import get_logger
+from utils.metrics import counter
+from utils.file_handler import TELEGRAM_LOCAL_MODE
+from utils.content_type import ContentType
+from utils.upload_limits import largest_upload_size, max_upload_size
+
+# Get logger
+logger = get_logger(__name__)
+
+# Largest file a bot can download through the Bot API; a local server has
+# no download limit beyond Telegram's own 2000 MB
+BOT_API_DOWNLOAD_LIMIT = int(os.getenv(
+    'BOT_API_DOWNLOAD_LIMIT', (2000 if TELEGRAM_LOCAL_MODE else 20) * 1024 * 1024
+))
+
+# Largest side of the photo variant picked from a photo message
+PHOTO_MAX_DIMENSION = int(os.getenv('PHOTO_MAX_DIMENSION', 2560))
+
+# Content type of Telegram photo messages, which Telegram re-encodes itself
+PHOTO_CONTENT = ContentType('image/jpeg', 'image', '.jpg')
+
+# Outcome of an admission check: 'accept' transfers the file, 'page' creates
+# the text page without downloading it and 'reject' refuses the file
+Admission = namedtuple('Admission', ['decision', 'reason'])
+
+# Admission decisions by reason
+admission_decisions = counter('m2t_admission_total', 'Pre-flight admission decisions', ('decision', 'reason'))
+
+def select_photo(photos: list):
+    """
+    Pick the photo variant to transfer
+
+    Telegram sends every photo in several sizes. The largest one that fits
+    the upload limit and PHOTO_MAX_DIMENSION is used, so oversized photos
+    are not downloaded only to be shrunk or refused.
+
+    Args:
+        photos: PhotoSize objects of a message, smallest first
+
+    Returns:
+        The chosen PhotoSize
+    """
+    limit = max_upload_size(PHOTO_CONTENT)
+    for photo in reversed(photos):
+        if (photo.file_size or 0) <= limit and max(photo.width, photo.height) <= PHOTO_MAX_DIMENSION:
+            if photo is not photos[-1]:
+                admission_decisions.inc(decision='downscale', reason='smaller_variant')
+            return photo
+    return photos[0]
+
+def check_admission(media_type: str, file_size: int = None) -> Admission:
+    """
+    Decide what to do with a file before any request is made for it
+
+    Only the size decides. The MIME type and file name a client sends are
+    not trusted; the content is classified from its magic bytes once the
+    download starts.
+
+    Args:
+        media_type: The type of media (photo, video, document)
+        file_size: Size of the file in bytes, if known
+
+    Returns:
+        The Admission decision
+    """
+    if media_type == 'photo':
+        embed_limit = max_upload_size(PHOTO_CONTENT)
+    else:
+        embed_limit = largest_upload_size()
+
+    if file_size and file_size > BOT_API_DOWNLOAD_LIMIT:
+        admission = Admission('reject', 'too_large')
+    elif file_size and file_size > embed_limit:
+        admission = Admission('page', 'too_large_to_embed')
+    elif not file_size:
+        admission = Admission('accept', 'unknown_size')
+    else:
+        admission = Admission('accept', 'ok')
+
+    admission_decisions.inc(decision=admission.decision, reason=admission.reason)
+    if admission.decision != 'accept':
+        logger.info(
+            "Admission: %s %s (%s bytes): %s", admission.decision, media_type, file_size, admission.reason
+        )
+    return admission
@@ -0,0 +1,135 @@
+"""
+Sequential reading of ZIP and TAR archives without unpacking them to disk
+"""
+import os
+import asyncio
+import tarfile
+import zipfile
+from collections import namedtuple
+from pathlib import PurePosixPath
+from typing import AsyncIterator, BinaryIO, Iterator
+
+# Bulk conversion limits
+ARCHIVE_MAX_FILES = int(os.getenv('ARCHIVE_MAX_FILES', 500))
+ARCHIVE_MAX_ENTRY_SIZE = int(os.getenv('ARCHIVE_MAX_ENTRY_SIZE', 20 * 1024 * 1024))
+ARCHIVE_MAX_TOTAL_SIZE = int(os.getenv('ARCHIVE_MAX_TOTAL_SIZE', 200 * 1024 * 1024))
+
+# MIME types and file name endings treated as archives; a bare .gz or .xz
+# is usually a single compressed file rather than a tarball
+ARCHIVE_MIME_TYPES = {'application/zip', 'application/x-zip-compressed', 'application/x-tar'}
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# One archive member: data is None when the member was skipped for the given reason
+ArchiveEntry = namedtuple('ArchiveEntry', ['name', 'size', 'data', 'skipped'])
+
+class ArchiveError(Exception):
+    """Raised when an archive cannot be read"""
+
+def is_archive(file_name: str, mime_type: str = None) -> bool:
+    """
+    Check whether a document should be converted as an archive
+
+    Args:
+        file_name: Name of the document
+        mime_type: MIME type reported by Telegram, if any
+
+    Returns:
+        True for ZIP and (compressed) TAR files
+    """
+    return (file_name or '').lower().endswith(ARCHIVE_EXTENSIONS) or mime_type in ARCHIVE_MIME_TYPES
+
+def _skip_member(name: str) -> bool:
+    """Leave out metadata that archivers add next to the real files"""
+    path = PurePosixPath(name)
+    return '__MACOSX' in path.parts or path.name.startswith('.') or path.name in ('Thumbs.db', 'desktop.ini')
+
+def _read_member(member: BinaryIO, limit: int) -> bytes:
+    """Read up to limit bytes of an opened member, closing it even on errors"""
+    with member:
+        return member.read(limit)
+
+def _zip_members(fileobj: BinaryIO) -> Iterator[tuple]:
+    """Yield (name, size, reader) for the files of a ZIP archive"""
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            if info.flag_bits & 0x1:
+                yield info.filename, info.file_size, None
+                continue
+            yield info.filename, info.file_size, lambda limit, info=info: _read_member(archive.open(info), limit)
+
+def _tar_members(fileobj: BinaryIO) -> Iterator[tuple]:
+    """Yield (name, size, reader) for the files of a TAR archive, compressed or not"""
+    # Stream mode reads the members strictly in order without seeking
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            yield member.name, member.size, lambda limit, member=member: _read_member(archive.extractfile(member), limit)
+
+def iter_entries(fileobj: BinaryIO, max_files: int = ARCHIVE_MAX_FILES,
+                 max_entry_size: int = ARCHIVE_MAX_ENTRY_SIZE,
+                 max_total_size: int = ARCHIVE_MAX_TOTAL_SIZE) -> Iterator[ArchiveEntry]:
+    """
+    Read the files of an archive one at a time
+
+    Only one member is held in memory at once. Sizes are checked against
+    what is actually decompressed, not only against the headers, so a
+    forged size cannot blow up memory.
+
+    Args:
+        fileobj: Archive content, positioned at the start
+        max_files: Number of files read before the rest is skipped
+        max_entry_size: Largest member read, bigger ones are skipped
+        max_total_size: Total decompressed bytes read before the rest is skipped
+
+    Yields:
+        ArchiveEntry for every file, including the skipped ones
+    """
+    head = fileobj.read(4)
+    fileobj.seek(0)
+    try:
+        members = _zip_members(fileobj) if head.startswith(b'PK') else _tar_members(fileobj)
+        count = 0
+        total = 0
+        for name, size, read in members:
+            if _skip_member(name):
+                continue
+            if read is None:
+                yield ArchiveEntry(name, size, None, 'encrypted')
+            elif count >= max_files:
+                yield ArchiveEntry(name, size, None, 'file limit reached')
+            elif size > max_entry_size:
+                yield ArchiveEntry(name, size, None, 'too large')
+            elif total + size > max_total_size:
+                yield ArchiveEntry(name, size, None, 'archive size limit reached')
+            else:
+                data = read(max_entry_size + 1)
+                if len(data) > max_entry_size:
+                    yield ArchiveEntry(name, len(data), None, 'too large')
+                    continue
+                count += 1
+                total += len(data)
+                yield ArchiveEntry(name, len(data), data, None)
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+        raise ArchiveError(f"Could not read the archive: {str(e)}")
+
+async def aiter_entries(fileobj: BinaryIO, **limits) -> AsyncIterator[ArchiveEntry]:
+    """
+    Read the files of an archive in a thread, one at a time
+
+    Args:
+        fileobj: Archive content, positioned at the start
+        **limits: Limits passed to iter_entries
+
+    Yields:
+        ArchiveEntry for every file, including the skipped ones
+    """
+    entries = iter_entries(fileobj, **limits)
+    done = object()
+    while True:
+        entry = await asyncio.to_thread(next, entries, done)
+        if entry is done:
+            return
+        yield entry
@@ -0,0 +1,168 @@
+"""
+Content type detection from magic bytes
+"""
+import os
+from collections import namedtuple
+from typing import AsyncIterator
+
+# Number of leading bytes inspected to classify content
+CONTENT_SNIFF_BYTES = int(os.getenv('CONTENT_SNIFF_BYTES', 4096))
+
+# Categories of content refused before it is transferred
+CONTENT_REJECT_CATEGORIES = {
+    category.strip() for category in os.getenv('CONTENT_REJECT_CATEGORIES', 'executable').split(',')
+    if category.strip()
+}
+
+ContentType = namedtuple('ContentType', ['mime_type', 'category', 'extension'])
+
+class UnsupportedContentError(Exception):
+    """Raised when a file's content is of a type the bot refuses"""
+
+# Magic bytes lookup table, as (offset, signature, mime type, category, extension).
+# More specific entries come first where signatures share a prefix.
+SIGNATURES = (
+    # Images
+    (0, b'\xff\xd8\xff', 'image/jpeg', 'image', '.jpg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png', 'image', '.png'),
+    (0, b'GIF87a', 'image/gif', 'image', '.gif'),
+    (0, b'GIF89a', 'image/gif', 'image', '.gif'),
+    (8, b'WEBP', 'image/webp', 'image', '.webp'),
+    (0, b'BM', 'image/bmp', 'image', '.bmp'),
+    (0, b'II*\x00', 'image/tiff', 'image', '.tiff'),
+    (0, b'MM\x00*', 'image/tiff', 'image', '.tiff'),
+    (0, b'\x00\x00\x01\x00', 'image/x-icon', 'image', '.ico'),
+    (4, b'ftypheic', 'image/heic', 'image', '.heic'),
+    (4, b'ftypheix', 'image/heic', 'image', '.heic'),
+    (4, b'ftypmif1', 'image/heif', 'image', '.heif'),
+    (4, b'ftypavif', 'image/avif', 'image', '.avif'),
+    (4, b'ftypavis', 'image/avif', 'image', '.avif'),
+    (4, b'ftypheis', 'image/heic-sequence', 'image', '.heics'),
+    (4, b'ftyphevc', 'image/heic-sequence', 'image', '.heics'),
+    (4, b'ftypmsf1', 'image/heif-sequence', 'image', '.heifs'),
+    (4, b'ftypcrx ', 'image/x-canon-cr3', 'image', '.cr3'),
+    (0, b'8BPS', 'image/vnd.adobe.photoshop', 'image', '.psd'),
+    # Audio, before video since some share the ISO media container
+    (4, b'ftypM4A ', 'audio/mp4', 'audio', '.m4a'),
+    (4, b'ftypM4B ', 'audio/mp4', 'audio', '.m4b'),
+    (8, b'WAVE', 'audio/wav', 'audio', '.wav'),
+    (0, b'ID3', 'audio/mpeg', 'audio', '.mp3'),
+    (0, b'\xff\xfb', 'audio/mpeg', 'audio', '.mp3'),
+    (0, b'\xff\xf3', 'audio/mpeg', 'audio', '.mp3'),
+    (0, b'\xff\xf2', 'audio/mpeg', 'audio', '.mp3'),
+    (0, b'\xff\xf1', 'audio/aac', 'audio', '.aac'),
+    (0, b'\xff\xf9', 'audio/aac', 'audio', '.aac'),
+    (0, b'fLaC', 'audio/flac', 'audio', '.flac'),
+    (0, b'OggS', 'audio/ogg', 'audio', '.ogg'),
+    (0, b'#!AMR', 'audio/amr', 'audio', '.amr'),
+    # Video
+    (4, b'ftypqt', 'video/quicktime', 'video', '.mov'),
+    (4, b'ftyp3gp', 'video/3gpp', 'video', '.3gp'),
+    # Only the brands known to be MP4 video; any other ISO media brand is
+    # left unrecognised rather than sent to Telegraph as video/mp4
+    *((4, b'ftyp' + brand, 'video/mp4', 'video', '.mp4')
+      for brand in (b'isom', b'iso2', b'iso4', b'iso5', b'iso6', b'mp41', b'mp42', b'avc1', b'dash', b'M4V ',
+                    b'mmp4')),
+    (0, b'\x1aE\xdf\xa3', 'video/webm', 'video', '.webm'),
+    (8, b'AVI ', 'video/x-msvideo', 'video', '.avi'),
+    (0, b'FLV', 'video/x-flv', 'video', '.flv'),
+    (0, b'\x00\x00\x01\xba', 'video/mpeg', 'video', '.mpg'),
+    (0, b'\x00\x00\x01\xb3', 'video/mpeg', 'video', '.mpg'),
+    # Documents and archives
+    (0, b'%PDF-', 'application/pdf', 'document', '.pdf'),
+    (0, b'{\\rtf', 'application/rtf', 'document', '.rtf'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage', 'document', '.doc'),
+    (0, b'PK\x03\x04', 'application/zip', 'archive', '.zip'),
+    (0, b'PK\x05\x06', 'application/zip', 'archive', '.zip'),
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar', 'archive', '.rar'),
+    (0, b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed', 'archive', '.7z'),
+    (0, b'\x1f\x8b', 'application/gzip', 'archive', '.gz'),
+    (0, b'BZh', 'application/x-bzip2', 'archive', '.bz2'),
+    (0, b'\xfd7zXZ\x00', 'application/x-xz', 'archive', '.xz'),
+    (257, b'ustar', 'application/x-tar', 'archive', '.tar'),
+    # Executables
+    (0, b'MZ', 'application/x-msdownload', 'executable', '.exe'),
+    (0, b'\x7fELF', 'application/x-executable', 'executable', ''),
+    (0, b'\xcf\xfa\xed\xfe', 'application/x-mach-binary', 'executable', ''),
+    (0, b'\xca\xfe\xba\xbe', 'application/x-mach-binary', 'executable', ''),
+)
+
+def sniff_content_type(head: bytes):
+    """
+    Identify content from its first bytes
+
+    Args:
+        head: Leading bytes of the content, CONTENT_SNIFF_BYTES is plenty
+
+    Returns:
+        ContentType, or None when the signature is unknown
+    """
+    for offset, signature, mime_type, category, extension in SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            # RIFF containers carry their real type at offset 8
+            if offset == 8 and head[:4] != b'RIFF':
+                continue
+            return ContentType(mime_type, category, extension)
+    return None
+
+def check_content_type(content_type, file_name: str) -> None:
+    """
+    Refuse content of a rejected category
+
+    Args:
+        content_type: ContentType of the file, or None
+        file_name: Name of the file, for the error message
+    """
+    if content_type and content_type.category in CONTENT_REJECT_CATEGORIES:
+        raise UnsupportedContentError(
+            f"{file_name} looks like {content_type.category} content ({content_type.mime_type}), "
+            f"which is not supported"
+        )
+
+class PeekedStream:
+    """
+    Async iterable replaying the bytes read by peek_stream before the rest
+
+    Args:
+        buffered: Chunks already read from the stream
+        chunks: The rest of the stream
+    """
+
+    def __init__(self, buffered: list, chunks: AsyncIterator[bytes]):
+        self._buffered = buffered
+        self._chunks = chunks
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._buffered:
+            yield chunk
+        async for chunk in self._chunks:
+            yield chunk
+
+    async def aclose(self) -> None:
+        """Stop the underlying download"""
+        await self._chunks.aclose()
+
+async def peek_stream(chunks: AsyncIterator[bytes], size: int = CONTENT_SNIFF_BYTES) -> tuple:
+    """
+    Read the start of a stream without losing it
+
+    Args:
+        chunks: Async generator of byte chunks
+        size: Number of bytes wanted
+
+    Returns:
+        Tuple of the leading bytes (shorter only at end of stream) and a
+        PeekedStream yielding the whole stream again
+    """
+    buffered = []
+    buffered_size = 0
+    async for chunk in chunks:
+        buffered.append(chunk)
+        buffered_size += len(chunk)
+        if buffered_size >= size:
+            break
+
+    return b''.join(buffered)[:size], PeekedStream(buffered, chunks)
@@ -0,0 +1,106 @@
+"""
+On-disk dead-letter queue for jobs that could not be completed
+"""
+import os
+import json
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from utils.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock only the threads of one process are kept apart
+    fcntl = None
+
+# Get logger
+logger = get_logger(__name__)
+
+# Location of the dead-letter file
+DEAD_LETTER_PATH = os.getenv(
+    'DEAD_LETTER_PATH', str(Path(__file__).parent.parent / 'data' / 'dead_letter.jsonl')
+)
+
+class DeadLetterQueue:
+    """
+    Append-only JSON lines file of failed jobs
+
+    Transfer and webhook worker processes share the file, so every access
+    holds an flock on a lock file next to it. A drain cannot lose a job
+    appended between reading and removing the file.
+
+    Args:
+        path: Path of the JSON lines file
+    """
+
+    def __init__(self, path: str = DEAD_LETTER_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        """Hold the queue lock across threads and processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def push(self, entry: dict) -> None:
+        """
+        Persist a failed job
+
+        Args:
+            entry: JSON-serializable job description
+        """
+        with self._locked():
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        logger.warning("Job moved to dead-letter queue: %s", entry.get('file_name'))
+
+    def drain(self) -> list:
+        """
+        Remove and return every persisted job
+
+        Returns:
+            List of job descriptions
+        """
+        with self._locked():
+            if not self.path.exists():
+                return []
+            with open(self.path, encoding='utf-8') as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            self.path.unlink()
+        return entries
+
+    def __len__(self) -> int:
+        with self._locked():
+            if not self.path.exists():
+                return 0
+            with open(self.path, encoding='utf-8') as f:
+                return sum(1 for line in f if line.strip())
+
+# Shared queue instance
+_queue = None
+
+def get_dead_letter_queue() -> DeadLetterQueue:
+    """
+    Get the shared dead-letter queue
+
+    Returns:
+        The queue instance
+    """
+    global _queue
+    if _queue is None:
+        _queue = DeadLetterQueue()
+    return _queue
@@ -0,0 +1,205 @@
+"""
+Content-addressed dedup cache mapping Telegram files to Telegraph URLs
+"""
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+from utils.logger import get_logger
+
+# Get logger
+logger = get_logger(__name__)
+
+# Cache settings
+DEDUP_CACHE_ENABLED = os.getenv('DEDUP_CACHE_ENABLED', 'true').lower() == 'true'
+DEDUP_CACHE_PATH = os.getenv(
+    'DEDUP_CACHE_PATH', str(Path(__file__).parent.parent / 'data' / 'dedup.sqlite3')
+)
+DEDUP_MEMORY_SIZE = int(os.getenv('DEDUP_MEMORY_SIZE', 1024))
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', 100000))
+DEDUP_TTL = int(os.getenv('DEDUP_TTL', 30 * 24 * 3600))
+
+# Run disk eviction once every this many writes
+_EVICT_EVERY = 100
+
+class DedupCache:
+    """
+    Two-tier cache with an in-memory LRU in front of a SQLite index
+
+    Entries are stored under 'uid:<file_unique_id>' and 'sha256:<hexdigest>'
+    keys so a forwarded file can be matched by Telegram ID or by content.
+
+    Args:
+        db_path: Path of the SQLite database
+        memory_size: Number of entries kept in the in-memory LRU
+        max_entries: Maximum number of rows kept on disk
+        ttl: Lifetime of an entry in seconds
+    """
+
+    def __init__(self, db_path: str, memory_size: int = DEDUP_MEMORY_SIZE,
+                 max_entries: int = DEDUP_MAX_ENTRIES, ttl: int = DEDUP_TTL):
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, media_url TEXT, page_url TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._conn.commit()
+
+    def _remember(self, key: str, entry: dict) -> None:
+        """Insert an entry into the in-memory LRU"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _get_sync(self, key: str) -> Optional[dict]:
+        """Look up a key in memory, then on disk"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry['created_at'] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return entry
+
+            row = self._conn.execute(
+                "SELECT media_url, page_url, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[2] >= self.ttl:
+                self._memory.pop(key, None)
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            entry = {'media_url': row[0], 'page_url': row[1], 'created_at': row[2]}
+            self._remember(key, entry)
+            self.hits += 1
+            return entry
+
+    def _put_sync(self, keys: list, media_url: Optional[str], page_url: str) -> None:
+        """Store an entry under every given key"""
+        now = time.time()
+        entry = {'media_url': media_url, 'page_url': page_url, 'created_at': now}
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                [(key, media_url, page_url, now, now) for key in keys]
+            )
+            for key in keys:
+                self._remember(key, entry)
+
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """Drop expired rows and trim the table to max_entries"""
+        self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    async def get_by_unique_id(self, file_unique_id: str) -> Optional[dict]:
+        """
+        Look up a file by its Telegram file_unique_id
+
+        Args:
+            file_unique_id: Telegram file_unique_id
+
+        Returns:
+            Dict with media_url and page_url, or None on a miss
+        """
+        return await asyncio.to_thread(self._get_sync, f"uid:{file_unique_id}")
+
+    async def get_by_hash(self, sha256: str) -> Optional[dict]:
+        """
+        Look up a file by the SHA-256 of its content
+
+        Args:
+            sha256: Hex digest of the content
+
+        Returns:
+            Dict with media_url and page_url, or None on a miss
+        """
+        return await asyncio.to_thread(self._get_sync, f"sha256:{sha256}")
+
+    async def put(self, page_url: str, media_url: Optional[str] = None,
+                  file_unique_id: Optional[str] = None, sha256: Optional[str] = None) -> None:
+        """
+        Remember the Telegraph URLs created for a file
+
+        Args:
+            page_url: URL of the Telegraph page
+            media_url: URL of the uploaded media, if any
+            file_unique_id: Telegram file_unique_id
+            sha256: Hex digest of the content
+        """
+        keys = []
+        if file_unique_id:
+            keys.append(f"uid:{file_unique_id}")
+        if sha256:
+            keys.append(f"sha256:{sha256}")
+        if keys:
+            await asyncio.to_thread(self._put_sync, keys, media_url, page_url)
+
+    def stats(self) -> dict:
+        """
+        Get hit and miss counters
+
+        Returns:
+            Dict of cache counters
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'memory_hits': self.memory_hits,
+            'hit_rate': self.hits / total if total else 0.0,
+            'memory_entries': len(self._memory)
+        }
+
+    def close(self) -> None:
+        """Close the SQLite connection"""
+        with self._lock:
+            self._conn.close()
+
+# Shared cache instance, opened on first use
+_cache = None
+
+def get_dedup_cache() -> Optional[DedupCache]:
+    """
+    Get the shared dedup cache
+
+    Returns:
+        The cache, or None when deduplication is disabled
+    """
+    global _cache
+    if not DEDUP_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = DedupCache(DEDUP_CACHE_PATH)
+        logger.info("Dedup cache opened at %s", DEDUP_CACHE_PATH)
+    return _cache
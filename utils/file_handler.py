@@ -2,43 +2,325 @@
 File handling utilities
 """
 import os
+import mmap
+import shutil
+import asyncio
+from contextlib import contextmanager
 from pathlib import Path
-import aiohttp
+from typing import AsyncIterator, BinaryIO, Iterator, Optional
+from utils.http_client import get_http_session
 from utils.logger import get_logger
+from utils.retry import TransferError, get_breaker, retry_async
+from utils.metrics import bytes_transferred, timed_stage
+from utils.ranged_download import RANGED_DOWNLOAD_ENABLED, download_ranged
 
 # Get logger
 logger = get_logger(__name__)
 
-# Create temp directory if it doesn't exist
+# Temp directory, created when the first temp file is made
 temp_dir = Path(__file__).parent.parent / 'temp'
-temp_dir.mkdir(exist_ok=True)
+_temp_dir_ready = False
+
+# Temp entries are named <prefix><pid>.<start time>- so orphans can be told
+# from live files even after their PID was reused
+TEMP_PREFIX = 'm2t-'
+_temp_prefix = None
+
+# Size of the buffer used when streaming file bodies
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 64 * 1024))
+
+# Bot API server, without the /bot<token> part
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+
+# The server is a self-hosted telegram-bot-api started with --local, which
+# lifts the download limit and hands out absolute paths on its disk
+TELEGRAM_LOCAL_MODE = os.getenv('TELEGRAM_LOCAL_MODE', 'false').lower() == 'true'
+
+def ensure_temp_dir() -> Path:
+    """
+    Create the temp directory if it does not exist yet
+
+    Returns:
+        The temp directory
+    """
+    global _temp_dir_ready
+    if not _temp_dir_ready:
+        temp_dir.mkdir(exist_ok=True)
+        _temp_dir_ready = True
+    return temp_dir
+
+def process_start_time(pid: int) -> Optional[int]:
+    """
+    Get the time a process started, in clock ticks since boot
+
+    Together with the PID it identifies a process, since PIDs are reused
+    once their process is gone.
+
+    Args:
+        pid: Process ID
+
+    Returns:
+        Field 22 of /proc/<pid>/stat, or None if it cannot be read
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name in field 2 may contain spaces, so count from its end
+    return int(stat[stat.rindex(b')') + 2:].split()[19])
+
+def temp_prefix() -> str:
+    """
+    Get the name prefix for temp files and directories of this process
+
+    Every temp entry is named with this prefix, so it also makes sure the
+    temp directory exists.
+
+    Returns:
+        Prefix carrying the process ID and start time, for the startup sweeper
+    """
+    global _temp_prefix
+    ensure_temp_dir()
+    pid = os.getpid()
+    if _temp_prefix is None or _temp_prefix[0] != pid:
+        started = process_start_time(pid)
+        _temp_prefix = (pid, f"{TEMP_PREFIX}{pid}-" if started is None else f"{TEMP_PREFIX}{pid}.{started}-")
+    return _temp_prefix[1]
+
+def get_file_url(file_path: str) -> str:
+    """
+    Build the download URL for a Telegram file path
+
+    Args:
+        file_path: Telegram file path, or the full URL python-telegram-bot
+            puts in File.file_path
+
+    Returns:
+        Full Telegram file URL
+    """
+    if file_path.startswith(('http://', 'https://')):
+        return file_path
+    return f"{TELEGRAM_API_URL}/file/bot{os.getenv('TELEGRAM_BOT_TOKEN')}/{file_path}"
+
+def local_path(file_path: str) -> Optional[str]:
+    """
+    Get the path of a file a local Bot API server stored on this machine
+
+    python-telegram-bot keeps the absolute path a server in --local mode
+    returns when the file exists here, instead of turning it into a URL.
+
+    Args:
+        file_path: Telegram file path returned by get_file
+
+    Returns:
+        The local path, or None when the file has to be downloaded
+    """
+    if file_path and os.path.isabs(file_path):
+        return file_path
+    return None
+
+@contextmanager
+def map_local_file(path: str) -> Iterator[memoryview]:
+    """
+    Map a local file into memory, read-only
+
+    The content goes from the page cache to the upload socket without
+    being read into Python objects first.
+
+    Args:
+        path: Path of the file
+
+    Yields:
+        memoryview of the whole file
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield memoryview(b'')
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapped)
+    try:
+        yield view
+    finally:
+        try:
+            view.release()
+            mapped.close()
+        except BufferError:
+            # A failed upload still holds a slice; the mapping goes away with it
+            pass
+
+async def iter_local_file(path: str, chunk_size: int = STREAM_CHUNK_SIZE, offset: int = 0) -> AsyncIterator[bytes]:
+    """
+    Read a local file chunk by chunk without blocking the event loop
+
+    Args:
+        path: Path of the file
+        chunk_size: Maximum size of each chunk in bytes
+        offset: Number of leading bytes to skip
+
+    Yields:
+        Chunks of the file content
+    """
+    fd = await asyncio.to_thread(os.open, path, os.O_RDONLY)
+    try:
+        while chunk := await asyncio.to_thread(os.pread, fd, chunk_size, offset):
+            offset += len(chunk)
+            yield chunk
+    finally:
+        os.close(fd)
+
+async def iter_file(file_path: str, chunk_size: int = STREAM_CHUNK_SIZE, offset: int = 0) -> AsyncIterator[bytes]:
+    """
+    Stream a file from Telegram's servers chunk by chunk
+
+    Files of a local Bot API server are read straight from disk.
+
+    Args:
+        file_path: Telegram file path
+        chunk_size: Maximum size of each chunk in bytes
+        offset: Number of leading bytes to skip, used to resume a download
+
+    Yields:
+        Chunks of the file content
+    """
+    path = local_path(file_path)
+    if path:
+        async for chunk in iter_local_file(path, chunk_size, offset):
+            yield chunk
+        return
+
+    session = get_http_session()
+    headers = {'Range': f"bytes={offset}-"} if offset else None
+    async with session.get(get_file_url(file_path), headers=headers) as response:
+        if offset and response.status == 416:
+            # Everything has been received already
+            return
+        if response.status not in (200, 206):
+            raise TransferError(f"Failed to download file: HTTP {response.status}", response.status)
+
+        # Skip the bytes we already have if the server ignored the Range header
+        skip = offset if response.status == 200 else 0
+        async for chunk in response.content.iter_chunked(chunk_size):
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+            bytes_transferred.inc(len(chunk), direction='download')
+            yield chunk
+
+async def hash_chunks(chunks: AsyncIterator[bytes], digest) -> AsyncIterator[bytes]:
+    """
+    Feed chunks into a hashlib digest while passing them through
+
+    Args:
+        chunks: Async iterable of byte chunks
+        digest: hashlib object updated with every chunk
+
+    Yields:
+        The unchanged chunks
+    """
+    async for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+def hash_file(path: str, digest, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Feed a local file into a hashlib digest
+
+    Args:
+        path: Path of the file
+        digest: hashlib object to update
+        chunk_size: Read buffer size in bytes
+
+    Returns:
+        The updated digest
+    """
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest
+
+async def get_telegram_file(bot, file_id: str):
+    """
+    Call getFile, retrying timeouts, 5xx answers and flood waits
+
+    Args:
+        bot: The bot to call getFile with
+        file_id: Telegram file ID
+
+    Returns:
+        The telegram File object
+    """
+    return await retry_async(
+        lambda: bot.get_file(file_id), get_breaker('telegram'), description=f"getFile for {file_id}"
+    )
+
+@timed_stage('download')
+async def download_to_fileobj(file_path: str, fileobj: BinaryIO, digest=None) -> None:
+    """
+    Download a file from Telegram's servers into an open file object
+
+    Transient failures are retried, resuming after the bytes that were
+    already written. Files of a local Bot API server are copied from disk.
+
+    Args:
+        file_path: Telegram file path
+        fileobj: Writable binary file object
+        digest: Optional hashlib object updated with the content
+    """
+    path = local_path(file_path)
+    if path and digest is None:
+        def copy():
+            with open(path, 'rb') as source:
+                shutil.copyfileobj(source, fileobj, STREAM_CHUNK_SIZE)
+
+        await asyncio.to_thread(copy)
+        return
+
+    written = 0
+
+    async def attempt():
+        nonlocal written
+        async for chunk in iter_file(file_path, offset=written):
+            fileobj.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            written += len(chunk)
+
+    await retry_async(attempt, get_breaker('telegram'), description=f"Download of {file_path}")
 
 async def download_file(file_path: str, output_path: str) -> str:
     """
     Download a file from Telegram's servers
-    
+
+    Big files are fetched over parallel range requests, see download_ranged.
+
     Args:
         file_path: Telegram file path
         output_path: Path where the file should be saved
-        
+
     Returns:
         Path to the downloaded file
     """
     try:
-        # Full Telegram file URL
-        url = f"https://api.telegram.org/file/bot{os.getenv('TELEGRAM_BOT_TOKEN')}/{file_path}"
-        
-        logger.info(f"Downloading file from {url} to {output_path}")
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    with open(output_path, 'wb') as f:
-                        f.write(await response.read())
-                    logger.info(f"File downloaded successfully to {output_path}")
-                    return output_path
-                else:
-                    raise Exception(f"Failed to download file: HTTP {response.status}")
+        logger.info("Downloading file %s to %s", file_path, output_path)
+
+        path = local_path(file_path)
+        if path:
+            # Copied inside the kernel with sendfile where available
+            await asyncio.to_thread(shutil.copyfile, path, output_path)
+        elif RANGED_DOWNLOAD_ENABLED:
+            await download_ranged(get_file_url(file_path), output_path, STREAM_CHUNK_SIZE)
+        else:
+            with open(output_path, 'wb') as f:
+                await download_to_fileobj(file_path, f)
+
+        logger.info("File downloaded successfully to %s", output_path)
+        return output_path
     except Exception as e:
-        logger.error(f"Error downloading file: {str(e)}", exc_info=True)
-        raise Exception(f"Failed to download file: {str(e)}")
\ No newline at end of file
+        logger.error("Error downloading file: %s", e, exc_info=True)
+        raise Exception(f"Failed to download file: {str(e)}")
@@ -0,0 +1,84 @@
+"""
+Shared HTTP client for Telegram and Telegraph traffic
+"""
+import os
+from typing import TYPE_CHECKING
+from utils.logger import get_logger
+
+if TYPE_CHECKING:
+    import aiohttp
+
+# Get logger
+logger = get_logger(__name__)
+
+# Application-lifetime session, created in the post-init hook
+_session = None
+
+def _get_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment"""
+    return int(os.getenv(name, default))
+
+def _get_float(name: str, default: float) -> float:
+    """Read a float setting from the environment"""
+    return float(os.getenv(name, default))
+
+def create_http_session() -> 'aiohttp.ClientSession':
+    """
+    Create a pooled HTTP session configured from the environment
+
+    aiohttp is imported here rather than at the top so that importing the
+    bot stays fast; the startup warm-up loads it while getMe is in flight.
+
+    Returns:
+        A new aiohttp client session
+    """
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(
+        limit=_get_int('HTTP_POOL_LIMIT', 100),
+        limit_per_host=_get_int('HTTP_POOL_LIMIT_PER_HOST', 20),
+        keepalive_timeout=_get_float('HTTP_KEEPALIVE_TIMEOUT', 60.0),
+        ttl_dns_cache=_get_int('HTTP_DNS_CACHE_TTL', 300),
+        use_dns_cache=True
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=_get_float('HTTP_TIMEOUT_TOTAL', 300.0),
+        connect=_get_float('HTTP_TIMEOUT_CONNECT', 10.0),
+        sock_read=_get_float('HTTP_TIMEOUT_SOCK_READ', 60.0)
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def get_http_session() -> 'aiohttp.ClientSession':
+    """
+    Get the shared HTTP session, creating it on first use
+
+    Returns:
+        The shared aiohttp client session
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = create_http_session()
+        logger.info("Shared HTTP session created")
+    return _session
+
+async def init_http_session(application=None) -> None:
+    """
+    Application post-init hook that opens the shared HTTP session
+
+    Args:
+        application: The telegram Application (unused)
+    """
+    get_http_session()
+
+async def close_http_session(application=None) -> None:
+    """
+    Application post-shutdown hook that closes the shared HTTP session
+
+    Args:
+        application: The telegram Application (unused)
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("Shared HTTP session closed")
+    _session = None
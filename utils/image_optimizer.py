@@ -0,0 +1,211 @@
+"""
+Optional image optimization before upload: format conversion, downscaling
+and metadata stripping in a process pool
+"""
+import os
+import io
+import time
+import asyncio
+import importlib.util
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from utils.logger import get_logger
+from utils.metrics import counter, stage_timer
+from utils.content_type import sniff_content_type
+
+# Pillow is optional and only imported by the worker processes that use it
+PILLOW_INSTALLED = importlib.util.find_spec('PIL') is not None
+
+# Get logger
+logger = get_logger(__name__)
+
+# Optimization settings
+IMAGE_OPTIMIZE = os.getenv('IMAGE_OPTIMIZE', 'false').lower() == 'true'
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 2560))
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', 85))
+IMAGE_OPTIMIZE_MIN_SIZE = int(os.getenv('IMAGE_OPTIMIZE_MIN_SIZE', 256 * 1024))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Formats Telegraph accepts as images
+SUPPORTED_FORMATS = {'JPEG', 'PNG', 'GIF'}
+
+# Pillow format names of the image types the optimizer can read
+PILLOW_FORMATS = {
+    'image/jpeg': 'JPEG',
+    'image/png': 'PNG',
+    'image/gif': 'GIF',
+    'image/webp': 'WEBP',
+    'image/bmp': 'BMP',
+    'image/tiff': 'TIFF',
+    'image/x-icon': 'ICO',
+}
+
+# Optimization metrics
+images_optimized = counter('m2t_images_optimized_total', 'Images run through the optimizer', ('result',))
+image_bytes_saved = counter('m2t_image_bytes_saved_total', 'Bytes saved by image optimization')
+
+def detect_image_format(head: bytes):
+    """
+    Detect the image format from the first bytes of a file
+
+    Args:
+        head: First bytes of the file, at least 16
+
+    Returns:
+        Pillow format name, or None if the data is not an image Pillow reads
+    """
+    content_type = sniff_content_type(head)
+    return PILLOW_FORMATS.get(content_type.mime_type) if content_type else None
+
+def optimize_image_bytes(data: bytes, max_dimension: int = IMAGE_MAX_DIMENSION,
+                         quality: int = IMAGE_JPEG_QUALITY) -> tuple:
+    """
+    Recompress an image, converting it to JPEG or PNG when needed
+
+    Runs in a worker process. Images are rotated according to their EXIF
+    orientation, downscaled so neither side exceeds max_dimension and
+    saved without metadata.
+
+    Args:
+        data: Image content
+        max_dimension: Maximum width and height in pixels
+        quality: JPEG quality
+
+    Returns:
+        Tuple of the new content and its format; the content is None when
+        the image is better uploaded unchanged
+    """
+    from PIL import Image, ImageOps
+
+    source_format = detect_image_format(data[:16])
+    image = Image.open(io.BytesIO(data))
+
+    # Animated images would lose their frames
+    if getattr(image, 'is_animated', False):
+        return None, source_format
+
+    # Let the JPEG decoder skip detail we would throw away anyway
+    if image.format == 'JPEG':
+        image.draft('RGB', (max_dimension, max_dimension))
+
+    image = ImageOps.exif_transpose(image)
+    resized = max(image.size) > max_dimension
+    if resized:
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    # GIFs are accepted as they are and re-encoding rarely helps
+    if source_format == 'GIF' and not resized:
+        return None, source_format
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    if source_format == 'GIF':
+        target_format = 'GIF'
+        options = {'optimize': True}
+    elif source_format == 'PNG' or (source_format not in SUPPORTED_FORMATS and has_alpha):
+        target_format = 'PNG'
+        if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        options = {'optimize': True}
+    else:
+        target_format = 'JPEG'
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        options = {'quality': quality, 'optimize': True, 'progressive': True}
+
+    output = io.BytesIO()
+    image.save(output, target_format, **options)
+    optimized = output.getvalue()
+
+    if source_format in SUPPORTED_FORMATS and not resized and len(optimized) >= len(data):
+        return None, source_format
+    return optimized, target_format
+
+# Shared process pool, created on first use
+_pool = None
+
+def get_image_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool running the optimizer
+
+    Returns:
+        The process pool
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(IMAGE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+def close_image_pool() -> None:
+    """Shut the optimizer process pool down"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+def optimizer_enabled() -> bool:
+    """Check whether images go through the optimizer before upload"""
+    return IMAGE_OPTIMIZE and PILLOW_INSTALLED
+
+def should_optimize(data: bytes) -> bool:
+    """
+    Check whether an image is worth sending through the optimizer
+
+    Args:
+        data: Image content
+
+    Returns:
+        True when optimization is enabled and the content needs it
+    """
+    if not optimizer_enabled():
+        return False
+    image_format = detect_image_format(data[:16])
+    if image_format is None:
+        return False
+    return image_format not in SUPPORTED_FORMATS or len(data) >= IMAGE_OPTIMIZE_MIN_SIZE
+
+async def optimize_image(data: bytes, file_name: str) -> tuple:
+    """
+    Optimize an image in the process pool before it is uploaded
+
+    Content that is not an image, or small enough already, is returned
+    as it is; so is everything when Pillow is not installed.
+
+    Args:
+        data: Image content
+        file_name: Name of the file
+
+    Returns:
+        Tuple of the content to upload and its file name
+    """
+    if not should_optimize(data):
+        return data, file_name
+
+    start = time.perf_counter()
+    try:
+        async with stage_timer('optimize'):
+            optimized, image_format = await asyncio.get_running_loop().run_in_executor(
+                get_image_pool(), optimize_image_bytes, data, IMAGE_MAX_DIMENSION, IMAGE_JPEG_QUALITY
+            )
+    except Exception as e:
+        images_optimized.inc(result='error')
+        logger.warning("Could not optimize %s, uploading it as is: %s", file_name, e)
+        return data, file_name
+
+    if optimized is None:
+        images_optimized.inc(result='unchanged')
+        return data, file_name
+
+    saved = len(data) - len(optimized)
+    images_optimized.inc(result='optimized')
+    image_bytes_saved.inc(max(saved, 0))
+    logger.info(
+        "Optimized %s: %s -> %s bytes (%s) in %.2fs",
+        file_name, len(data), len(optimized), image_format, time.perf_counter() - start
+    )
+
+    extension = '.jpg' if image_format == 'JPEG' else '.' + image_format.lower()
+    return optimized, str(Path(file_name).with_suffix(extension))
+
+if IMAGE_OPTIMIZE and not PILLOW_INSTALLED:
+    logger.warning("IMAGE_OPTIMIZE is enabled but Pillow is not installed; images are uploaded as they are")
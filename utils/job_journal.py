@@ -0,0 +1,354 @@
+"""
+Durable on-disk journal of queued and running jobs, used to recover after a crash
+"""
+import os
+import json
+import time
+import shutil
+import sqlite3
+import threading
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+from utils.logger import get_logger
+from utils.metrics import counter
+from utils.file_handler import TEMP_PREFIX, process_start_time, temp_dir
+
+# Get logger
+logger = get_logger(__name__)
+
+# Journal settings
+JOB_JOURNAL_ENABLED = os.getenv('JOB_JOURNAL_ENABLED', 'true').lower() == 'true'
+JOB_JOURNAL_PATH = os.getenv(
+    'JOB_JOURNAL_PATH', str(Path(__file__).parent.parent / 'data' / 'jobs.sqlite3')
+)
+JOB_JOURNAL_FLUSH_INTERVAL = float(os.getenv('JOB_JOURNAL_FLUSH_INTERVAL', 0.5))
+JOB_JOURNAL_MAX_RECOVERIES = int(os.getenv('JOB_JOURNAL_MAX_RECOVERIES', 2))
+JOB_JOURNAL_MAX_AGE = int(os.getenv('JOB_JOURNAL_MAX_AGE', 6 * 3600))
+JOB_JOURNAL_RECOVERY_INTERVAL = float(os.getenv('JOB_JOURNAL_RECOVERY_INTERVAL', 30))
+
+# Temp files without an owner PID are swept once they are this old
+TEMP_SWEEP_AGE = int(os.getenv('TEMP_SWEEP_AGE', 3600))
+
+# Finished jobs are kept this long so a late insert from another process
+# cannot bring them back
+_TOMBSTONE_TTL = 600
+
+# Journal ID of the job running in the current task
+current_job_id = ContextVar('current_job_id', default=None)
+
+# Jobs found in the journal on startup
+jobs_recovered = counter('m2t_jobs_recovered_total', 'Jobs left behind by a process that stopped', ('result',))
+
+def process_alive(pid: int, started: Optional[int] = None) -> bool:
+    """
+    Check whether a process is still running
+
+    Args:
+        pid: Process ID
+        started: Start time the process had, see process_start_time; a
+            process with the same ID but another start time is a new one
+
+    Returns:
+        True if that process still exists
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    if started is None:
+        return True
+    current = process_start_time(pid)
+    return current is None or current == started
+
+# ID and start time of the current process, read once
+_identity = None
+
+def process_identity() -> tuple:
+    """
+    Get the ID and start time of the current process
+
+    Returns:
+        (pid, start time) tuple; the start time is None where /proc is missing
+    """
+    global _identity
+    if _identity is None or _identity[0] != os.getpid():
+        _identity = (os.getpid(), process_start_time(os.getpid()))
+    return _identity
+
+class JobJournal:
+    """
+    SQLite journal of every job between submission and its final status
+
+    Writes are buffered in memory and committed by a background thread in
+    one transaction per flush interval. A job that finishes before its
+    first flush never touches the disk, so quick jobs cost a few dict
+    operations; a crash loses at most one interval of journal writes.
+
+    Several processes may share the journal. Finished jobs are written as
+    tombstones rather than deleted, so the order in which two processes
+    flush cannot resurrect a job, and every row records the PID and start
+    time of the process that last worked on it so recovery only claims the
+    jobs of processes that are gone, even when their PID was reused.
+
+    Args:
+        db_path: Path of the SQLite database
+        flush_interval: Seconds between commits, 0 commits every write
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = JOB_JOURNAL_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.writes = 0
+        self.commits = 0
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._inserts = {}
+        self._stages = {}
+        self._done = {}
+        self._closed = threading.Event()
+        self._flusher = None
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, job TEXT, stage TEXT NOT NULL, pid INTEGER, "
+            "created_at REAL, updated_at REAL NOT NULL, started INTEGER)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if 'started' not in columns:
+            # Journals written before the start time was recorded
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN started INTEGER")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_stage ON jobs (stage)")
+        self._conn.commit()
+
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name='job-journal', daemon=True)
+            self._flusher.start()
+
+    def record(self, job: dict) -> None:
+        """
+        Journal a job that was just queued
+
+        Args:
+            job: Job description with a journal_id key
+        """
+        now = time.time()
+        pid, started = process_identity()
+        with self._lock:
+            self._inserts[job['journal_id']] = [json.dumps(job), 'queued', pid, now, now, started]
+        self._written()
+
+    def mark(self, stage: str, journal_id: str = None) -> None:
+        """
+        Record the stage a job has reached
+
+        Args:
+            stage: Stage name, e.g. 'downloading'
+            journal_id: Job to update, defaults to the job running in the current task
+        """
+        journal_id = journal_id or current_job_id.get()
+        if journal_id is None:
+            return
+        now = time.time()
+        pid, started = process_identity()
+        with self._lock:
+            row = self._inserts.get(journal_id)
+            if row is not None:
+                row[1:3] = [stage, pid]
+                row[4:6] = [now, started]
+            else:
+                self._stages[journal_id] = (stage, pid, now, started)
+        self._written()
+
+    def finish(self, journal_id: str) -> None:
+        """
+        Take a job out of the journal once it reached a final status
+
+        Args:
+            journal_id: Journal ID of the job
+        """
+        with self._lock:
+            self._stages.pop(journal_id, None)
+            if self._inserts.pop(journal_id, None) is None:
+                self._done[journal_id] = time.time()
+        self._written()
+
+    def _written(self) -> None:
+        """Count a write and commit it right away when there is no flusher"""
+        self.writes += 1
+        if self._flusher is None:
+            self.flush()
+
+    def flush(self) -> None:
+        """Commit the buffered writes in one transaction"""
+        with self._lock:
+            inserts, self._inserts = self._inserts, {}
+            stages, self._stages = self._stages, {}
+            done, self._done = self._done, {}
+        if not (inserts or stages or done):
+            return
+
+        now = time.time()
+        try:
+            with self._db_lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO jobs (id, job, stage, pid, created_at, updated_at, started) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(journal_id, *row) for journal_id, row in inserts.items()]
+                )
+                self._conn.executemany(
+                    "UPDATE jobs SET stage = ?, pid = ?, updated_at = ?, started = ? WHERE id = ? AND stage != 'done'",
+                    [(*row, journal_id) for journal_id, row in stages.items()]
+                )
+                self._conn.executemany(
+                    "INSERT INTO jobs (id, stage, updated_at) VALUES (?, 'done', ?) "
+                    "ON CONFLICT (id) DO UPDATE SET stage = 'done', job = NULL, updated_at = excluded.updated_at",
+                    list(done.items())
+                )
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE stage = 'done' AND updated_at < ?", (now - _TOMBSTONE_TTL,)
+                )
+            self.commits += 1
+        except sqlite3.Error as e:
+            logger.error("Could not write the job journal: %s", e)
+
+    def _flush_loop(self) -> None:
+        """Commit buffered writes every flush interval until closed"""
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def claim_orphans(self) -> list:
+        """
+        Take over the unfinished jobs of processes that are no longer running
+
+        The recoveries count of every claimed job is increased in the journal
+        before it is returned, so a job that keeps crashing the bot gives up
+        after JOB_JOURNAL_MAX_RECOVERIES restarts.
+
+        Returns:
+            List of (job, stage, created_at) tuples; each job's row now belongs to this process
+        """
+        self.flush()
+        pid, started = process_identity()
+        claimed = []
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT id, job, stage, pid, started, created_at FROM jobs WHERE stage != 'done' ORDER BY created_at"
+            ).fetchall()
+            for journal_id, data, stage, owner, owner_started, created_at in rows:
+                if (owner, owner_started) == (pid, started) or (owner and process_alive(owner, owner_started)):
+                    continue
+                job = json.loads(data)
+                job['recoveries'] = job.get('recoveries', 0) + 1
+                with self._conn:
+                    cursor = self._conn.execute(
+                        "UPDATE jobs SET job = ?, pid = ?, started = ?, updated_at = ? "
+                        "WHERE id = ? AND pid IS ? AND started IS ? AND stage != 'done'",
+                        (json.dumps(job), pid, started, time.time(), journal_id, owner, owner_started)
+                    )
+                if cursor.rowcount:
+                    claimed.append((job, stage, created_at))
+        return claimed
+
+    def pending(self) -> int:
+        """
+        Count the unfinished jobs in the journal
+
+        Returns:
+            Number of jobs not yet finished, including unflushed ones
+        """
+        with self._db_lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE stage != 'done'").fetchone()
+        return row[0] + len(self._inserts) - len(self._done)
+
+    def close(self) -> None:
+        """Commit what is buffered and close the database"""
+        self._closed.set()
+        if self._flusher:
+            self._flusher.join()
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+# Shared journal instance, opened on first use
+_journal = None
+
+def get_job_journal() -> Optional[JobJournal]:
+    """
+    Get the shared job journal
+
+    Returns:
+        The journal, or None when journaling is disabled
+    """
+    global _journal
+    if not JOB_JOURNAL_ENABLED:
+        return None
+    if _journal is None:
+        _journal = JobJournal(JOB_JOURNAL_PATH)
+        logger.info("Job journal opened at %s", JOB_JOURNAL_PATH)
+    return _journal
+
+def close_job_journal() -> None:
+    """Flush and close the shared job journal, if it was opened"""
+    global _journal
+    if _journal is not None:
+        _journal.close()
+        _journal = None
+
+def mark_stage(stage: str) -> None:
+    """
+    Record the stage reached by the job running in the current task
+
+    Args:
+        stage: Stage name
+    """
+    journal = get_job_journal()
+    if journal:
+        journal.mark(stage)
+
+def sweep_temp_files(directory: Path = temp_dir, max_age: int = TEMP_SWEEP_AGE) -> int:
+    """
+    Delete temp files and directories left behind by processes that died
+
+    Entries created through temp_prefix carry the PID and start time of
+    their process and are removed as soon as that process is gone, even if
+    a new process got its PID; anything else is removed once it is older
+    than max_age.
+
+    Args:
+        directory: Temp directory to sweep
+        max_age: Age in seconds after which unowned entries are removed
+
+    Returns:
+        Number of entries removed
+    """
+    removed = 0
+    now = time.time()
+    if not directory.exists():
+        return removed
+    for entry in directory.iterdir():
+        owner = entry.name[len(TEMP_PREFIX):].split('-', 1)[0] if entry.name.startswith(TEMP_PREFIX) else ''
+        pid, _, started = owner.partition('.')
+        try:
+            if pid.isdigit() and (started.isdigit() or not started):
+                if process_alive(int(pid), int(started) if started else None):
+                    continue
+            elif now - entry.lstat().st_mtime < max_age:
+                continue
+
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry)
+            else:
+                entry.unlink()
+            removed += 1
+        except OSError as e:
+            logger.warning("Could not remove orphaned temp file %s: %s", entry, e)
+
+    if removed:
+        logger.info("Removed %s orphaned temp files from %s", removed, directory)
+    return removed
@@ -1,58 +1,264 @@
 """
 Logger configuration
+
+Records are handed to a bounded queue and written by a background thread,
+so slow disks or terminals never block the event loop. Only the process
+that called setup_logger writes to the console and the log files; worker
+processes send their records to it through a multiprocessing queue, so
+rotation is never raced by several writers.
 """
 import os
 import sys
+import json
+import queue
+import atexit
 import logging
+import threading
+import multiprocessing
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 from pathlib import Path
 
+# Logging settings
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_DIR = os.getenv('LOG_DIR', str(Path(__file__).parent.parent / 'logs'))
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() == 'true'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+LOG_ROTATE_BYTES = int(os.getenv('LOG_ROTATE_BYTES', 10 * 1024 * 1024))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_INFO_SAMPLE_EVERY = int(os.getenv('LOG_INFO_SAMPLE_EVERY', 1))
+
+# Handlers installed by setup_logger, and the background writer feeding them
+_handlers = []
+_listener = None
+_queue_handler = None
+
+# Queue worker processes log to, and the writer draining it in this process
+_worker_queue = None
+_worker_listener = None
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep one in every N info records of each message template
+
+    Warnings and errors always pass. Since messages are logged with lazy
+    arguments, records are grouped by their unformatted template, so a
+    chatty line is thinned out without hiding rarer ones.
+
+    Args:
+        every: Keep one record in this many, 1 keeps everything
+    """
+
+    def __init__(self, every: int = LOG_INFO_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(every, 1)
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1 or record.levelno != logging.INFO:
+            return True
+        with self._lock:
+            seen = self._seen.get(record.msg, 0)
+            self._seen[record.msg] = seen + 1
+        return seen % self.every == 0
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that does not wait for the writer
+
+    Like QueueHandler, the message is merged with its arguments and any
+    traceback is rendered before the record is queued, so it can be sent
+    to another process and does not keep frames or mutable arguments
+    alive. The layout is applied by the handlers on the writer thread.
+    When the queue is full, info and debug records are dropped and counted
+    while warnings and errors wait for room.
+
+    Args:
+        log_queue: Queue read by the writer, a multiprocessing queue in workers
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record)
+            else:
+                self.dropped += 1
+
+class BackgroundListener(QueueListener):
+    """Queue listener that waits for room for its stop sentinel"""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+def create_handlers(formatter: logging.Formatter, logs_dir: Path) -> list:
+    """
+    Create the console, error and combined log handlers
+
+    Args:
+        formatter: Formatter for every handler
+        logs_dir: Directory of the log files
+
+    Returns:
+        List of handlers
+    """
+    def file_handler(name: str) -> logging.Handler:
+        if LOG_ROTATE_WHEN:
+            return TimedRotatingFileHandler(
+                logs_dir / name, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+            )
+        return RotatingFileHandler(
+            logs_dir / name, maxBytes=LOG_ROTATE_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+
+    # Create console handler
+    console_handler = logging.StreamHandler(sys.stdout)
+
+    # Create file handlers
+    error_handler = file_handler('error.log')
+    error_handler.setLevel(logging.ERROR)
+    all_handler = file_handler('combined.log')
+
+    handlers = [console_handler, error_handler, all_handler]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
 def setup_logger():
     """
     Set up and configure the logger
-    
+
+    Calling it again returns the already configured logger. In a spawned
+    worker process, which re-imports the entry point, nothing is set up;
+    the worker logs through its parent, see setup_worker_logger.
+
     Returns:
         The configured logger instance
     """
-    # Get log level from environment
-    log_level_str = os.getenv('LOG_LEVEL', 'INFO').upper()
-    log_level = getattr(logging, log_level_str, logging.INFO)
-    
-    # Create logs directory if it doesn't exist
-    logs_dir = Path(__file__).parent.parent / 'logs'
-    logs_dir.mkdir(exist_ok=True)
-    
+    global _handlers, _listener, _queue_handler
+
     # Configure root logger
     logger = logging.getLogger()
-    logger.setLevel(log_level)
-    
+    # The name of a spawned process is set before it re-imports the entry point
+    if _handlers or _worker_queue is not None or multiprocessing.current_process().name != 'MainProcess':
+        return logger
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+
+    # Create logs directory if it doesn't exist
+    logs_dir = Path(LOG_DIR)
+    logs_dir.mkdir(parents=True, exist_ok=True)
+
     # Create formatter
-    formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s', 
-                                 datefmt='%Y-%m-%d %H:%M:%S')
-    
-    # Create console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    # Create file handlers
-    error_handler = logging.FileHandler(logs_dir / 'error.log')
-    error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(formatter)
-    logger.addHandler(error_handler)
-    
-    all_handler = logging.FileHandler(logs_dir / 'combined.log')
-    all_handler.setFormatter(formatter)
-    logger.addHandler(all_handler)
-    
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s',
+                                      datefmt='%Y-%m-%d %H:%M:%S')
+    handlers = _handlers = create_handlers(formatter, logs_dir)
+
+    if LOG_ASYNC:
+        _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(SamplingFilter())
+        logger.addHandler(_queue_handler)
+        _listener = BackgroundListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logger)
+    else:
+        sampler = SamplingFilter()
+        for handler in handlers:
+            handler.addFilter(sampler)
+            logger.addHandler(handler)
+
     return logger
 
+def worker_log_queue():
+    """
+    Get the queue worker processes send their log records to
+
+    In the process that owns the log files the queue is created on first
+    use, together with a background writer passing what arrives to the
+    same handlers. A worker process hands on the queue it was given, so
+    the workers it starts log to the same place.
+
+    Returns:
+        The multiprocessing queue, or None when logging was not set up
+    """
+    global _worker_queue, _worker_listener
+    if _worker_queue is None and _handlers:
+        _worker_queue = multiprocessing.get_context('spawn').Queue(LOG_QUEUE_SIZE)
+        _worker_listener = BackgroundListener(_worker_queue, *_handlers, respect_handler_level=True)
+        _worker_listener.start()
+        atexit.register(stop_logger)
+    return _worker_queue
+
+def setup_worker_logger(log_queue) -> None:
+    """
+    Send the log records of a worker process to its parent
+
+    Args:
+        log_queue: Queue returned by worker_log_queue in the parent, None
+            to leave logging alone
+    """
+    global _worker_queue, _queue_handler
+    if log_queue is None or _worker_queue is not None:
+        return
+    _worker_queue = log_queue
+
+    logger = logging.getLogger()
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter())
+    logger.addHandler(_queue_handler)
+
+def stop_logger() -> None:
+    """Write out queued records and stop the background writers"""
+    global _listener, _worker_listener
+    if _worker_listener is not None:
+        _worker_listener.stop()
+        _worker_listener = None
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    for handler in _handlers:
+        handler.close()
+    if _queue_handler.dropped:
+        sys.stderr.write(f"{_queue_handler.dropped} log records were dropped, the log queue was full\n")
+
+def dropped_log_records() -> int:
+    """Number of records dropped because the log queue was full"""
+    return _queue_handler.dropped if _queue_handler else 0
+
 def get_logger(name):
     """
     Get a logger instance with the specified name
-    
+
     Args:
         name: Name for the logger
-        
+
     Returns:
         The logger instance
     """
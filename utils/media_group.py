@@ -0,0 +1,91 @@
+"""
+Aggregation of album messages that share a media_group_id
+"""
+import os
+import asyncio
+from typing import Awaitable, Callable, Hashable
+from utils.logger import get_logger
+
+# Get logger
+logger = get_logger(__name__)
+
+# Seconds to wait for more items of the same album
+MEDIA_GROUP_WINDOW = float(os.getenv('MEDIA_GROUP_WINDOW', 1.5))
+
+class MediaGroupCollector:
+    """
+    Collects album items and hands them over as one batch
+
+    Telegram delivers every item of an album as its own message. Items
+    are buffered per group until no new item has arrived for `window`
+    seconds, then the callback registered by the first item runs once
+    with all of them.
+
+    Args:
+        window: Quiet period in seconds that closes a group
+    """
+
+    def __init__(self, window: float = MEDIA_GROUP_WINDOW):
+        self.window = window
+        self._groups = {}
+        self._tasks = set()
+
+    def add(self, group_key: Hashable, item, on_complete: Callable[[list], Awaitable]) -> None:
+        """
+        Add an item to a group
+
+        Args:
+            group_key: Key identifying the album, e.g. (chat_id, media_group_id)
+            item: Item to collect
+            on_complete: Coroutine function called with the collected items
+        """
+        group = self._groups.get(group_key)
+        if group is None:
+            group = self._groups[group_key] = {'items': [], 'on_complete': on_complete, 'timer': None}
+        else:
+            group['timer'].cancel()
+
+        group['items'].append(item)
+        group['timer'] = asyncio.get_running_loop().call_later(self.window, self._close, group_key)
+
+    def _close(self, group_key: Hashable) -> None:
+        """Hand a finished group to its callback"""
+        group = self._groups.pop(group_key)
+        # The loop only keeps weak references to tasks
+        task = asyncio.create_task(self._run(group_key, group))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, group_key: Hashable, group: dict) -> None:
+        """Run the callback of a finished group"""
+        try:
+            await group['on_complete'](group['items'])
+        except Exception as e:
+            logger.error("Error handling media group %s: %s", group_key, e, exc_info=True)
+
+    async def close(self) -> None:
+        """
+        Hand over the groups still collecting and wait for all callbacks
+
+        Called on shutdown so albums received just before it are not lost.
+        """
+        for group_key, group in list(self._groups.items()):
+            group['timer'].cancel()
+            self._close(group_key)
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+# Shared collector instance
+_collector = None
+
+def get_media_group_collector() -> MediaGroupCollector:
+    """
+    Get the shared media group collector
+
+    Returns:
+        The collector instance
+    """
+    global _collector
+    if _collector is None:
+        _collector = MediaGroupCollector()
+    return _collector
@@ -0,0 +1,327 @@
+"""
+Prometheus-style metrics and per-stage latency instrumentation
+"""
+import os
+import time
+import bisect
+import functools
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Callable
+from utils.logger import get_logger
+
+# Get logger
+logger = get_logger(__name__)
+
+# Metrics endpoint settings, off unless a port is set; 9090 is left to
+# Prometheus itself
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT') or 0)
+
+# Media type of the job running in the current task, used as an error label
+current_media_type = ContextVar('current_media_type', default='unknown')
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    """Render a label set in exposition format"""
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    """
+    Base class of a labelled metric
+
+    Args:
+        name: Metric name
+        documentation: Help text
+        labels: Label names
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def render(self) -> list:
+        """Render the metric in exposition format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+    def take(self) -> dict:
+        """Remove and return the recorded values"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+
+    kind = 'counter'
+
+    def merge(self, values: dict) -> None:
+        """
+        Add values taken from the same counter in another process
+
+        Args:
+            values: Values by label key, as returned by take
+        """
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """
+        Increase the counter
+
+        Args:
+            amount: Amount to add
+            **labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a callback"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), function: Callable = None):
+        super().__init__(name, documentation, labels)
+        self._function = function
+
+    def set(self, value: float, **labels) -> None:
+        """
+        Set the gauge
+
+        Args:
+            value: New value
+            **labels: Label values
+        """
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Increase the gauge"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        """Decrease the gauge"""
+        self.inc(-amount, **labels)
+
+    def render(self) -> list:
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception as e:
+                logger.warning("Gauge %s callback failed: %s", self.name, e)
+                values = {}
+            with self._lock:
+                self._values = values if isinstance(values, dict) else {(): values}
+        return super().render()
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        """
+        Record an observation
+
+        Args:
+            value: Observed value
+            **labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def merge(self, values: dict) -> None:
+        """
+        Add observations taken from the same histogram in another process
+
+        Args:
+            values: Bucket counts and sums by label key, as returned by take
+        """
+        with self._lock:
+            for key, (counts, total) in values.items():
+                own_counts, own_total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+                self._values[key] = ([a + b for a, b in zip(own_counts, counts)], own_total + total)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+# All registered metrics
+_registry = []
+
+def _register(metric: _Metric) -> _Metric:
+    _registry.append(metric)
+    return metric
+
+def counter(name: str, documentation: str, labels: tuple = ()) -> Counter:
+    """Create and register a counter"""
+    return _register(Counter(name, documentation, labels))
+
+def gauge(name: str, documentation: str, labels: tuple = (), function: Callable = None) -> Gauge:
+    """Create and register a gauge"""
+    return _register(Gauge(name, documentation, labels, function))
+
+def histogram(name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    """Create and register a histogram"""
+    return _register(Histogram(name, documentation, labels, buckets))
+
+def render_metrics() -> str:
+    """
+    Render every registered metric
+
+    Returns:
+        Metrics in Prometheus text exposition format
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+def collect_metrics() -> dict:
+    """
+    Take the counter and histogram values recorded since the last call
+
+    Transfer worker processes have no endpoint of their own; they send
+    these values to the bot process, which merges them into its metrics.
+    Gauges describe the process they live in and are not collected.
+
+    Returns:
+        Values by metric name, only for metrics that recorded anything
+    """
+    collected = {}
+    for metric in _registry:
+        if isinstance(metric, (Counter, Histogram)):
+            values = metric.take()
+            if values:
+                collected[metric.name] = values
+    return collected
+
+def merge_metrics(collected: dict) -> None:
+    """
+    Add values collected in another process to the metrics of this one
+
+    Args:
+        collected: Values by metric name, as returned by collect_metrics
+    """
+    metrics = {metric.name: metric for metric in _registry}
+    for name, values in collected.items():
+        metric = metrics.get(name)
+        if metric is None:
+            logger.debug("Dropping values of unknown metric %s", name)
+            continue
+        metric.merge(values)
+
+# Transfer metrics
+stage_latency = histogram('m2t_stage_latency_seconds', 'Latency of each transfer stage', ('stage',))
+stage_errors = counter('m2t_stage_errors_total', 'Failed transfer stages', ('stage', 'media_type'))
+bytes_transferred = counter('m2t_bytes_total', 'Bytes moved through the pipeline', ('direction',))
+throughput = histogram(
+    'm2t_throughput_bytes_per_second', 'End-to-end throughput of completed jobs', ('media_type',),
+    buckets=(1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+)
+jobs_total = counter('m2t_jobs_total', 'Finished jobs by outcome', ('media_type', 'outcome'))
+
+@asynccontextmanager
+async def stage_timer(stage: str):
+    """
+    Time a block of code as a transfer stage
+
+    Args:
+        stage: Stage name used as the label
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage=stage, media_type=current_media_type.get())
+        raise
+    finally:
+        stage_latency.observe(time.perf_counter() - start, stage=stage)
+
+def timed_stage(stage: str):
+    """
+    Decorate a coroutine function so every call is timed as a stage
+
+    Args:
+        stage: Stage name used as the label
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            async with stage_timer(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """
+    Serve the metrics on a local /metrics HTTP endpoint
+
+    The bot keeps running without the endpoint when the port cannot be
+    bound, e.g. because it is taken.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind, 0 disables the endpoint
+
+    Returns:
+        The aiohttp AppRunner, or None when disabled or not bound
+    """
+    if not port:
+        return None
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.error("Could not serve metrics on %s:%s, continuing without them: %s", host, port, e)
+        await runner.cleanup()
+        return None
+    logger.info("Metrics served on http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,388 @@
+"""
+Parallel HTTP range downloads into a preallocated file
+"""
+import os
+import re
+import time
+import asyncio
+from utils.http_client import get_http_session
+from utils.logger import get_logger
+from utils.retry import TransferError, get_breaker, retry_async
+from utils.metrics import bytes_transferred, counter, timed_stage
+
+# Get logger
+logger = get_logger(__name__)
+
+# Ranged download settings
+RANGED_DOWNLOAD_ENABLED = os.getenv('RANGED_DOWNLOAD_ENABLED', 'true').lower() == 'true'
+RANGED_DOWNLOAD_MAX_PARALLEL = int(os.getenv('RANGED_DOWNLOAD_MAX_PARALLEL', 8))
+RANGED_DOWNLOAD_MIN_CHUNK = int(os.getenv('RANGED_DOWNLOAD_MIN_CHUNK', 1024 * 1024))
+RANGED_DOWNLOAD_MAX_CHUNK = int(os.getenv('RANGED_DOWNLOAD_MAX_CHUNK', 16 * 1024 * 1024))
+
+# Segments are sized so one request takes about this many seconds on one
+# connection, long enough to amortise the request round trip
+RANGED_DOWNLOAD_SEGMENT_SECONDS = float(os.getenv('RANGED_DOWNLOAD_SEGMENT_SECONDS', 1.0))
+
+# Connections keep doubling as long as the last doubling raised the total
+# throughput by at least this fraction
+_RAMP_GAIN = 0.1
+
+# Segment sizes are rounded to this, the size of a typical read
+_ALIGN = 64 * 1024
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+# Downloads by how they were transferred
+ranged_downloads = counter('m2t_ranged_downloads_total', 'HTTP downloads by transfer mode', ('mode',))
+
+def parse_content_range(value: str) -> tuple:
+    """
+    Parse a Content-Range header
+
+    Args:
+        value: Header value, e.g. 'bytes 0-1023/4096'
+
+    Returns:
+        Tuple of first byte, last byte and total size (None when unknown)
+    """
+    match = _CONTENT_RANGE.fullmatch((value or '').strip())
+    if not match:
+        raise TransferError(f"Invalid Content-Range: {value!r}")
+    first, last, total = match.groups()
+    return int(first), int(last), None if total == '*' else int(total)
+
+def preallocate(fd: int, size: int) -> None:
+    """
+    Reserve the space of a file up front so segments can land anywhere
+
+    Args:
+        fd: Open file descriptor
+        size: Final size of the file
+    """
+    os.ftruncate(fd, size)
+    if size and hasattr(os, 'posix_fallocate'):
+        try:
+            # Allocates the blocks too, so a full disk fails now rather than mid-download
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            pass
+
+class RangedDownload:
+    """
+    Download of one file over parallel range requests
+
+    A first request for the initial segment tells whether the server honors
+    ranges and how big the file is. Without a 206 answer the body of that
+    same request is written out as a single stream. Otherwise the file is
+    preallocated and the rest is fetched in segments that are written in
+    place with pwrite, each retried and resumed on its own. Disk calls run in
+    worker threads so a slow disk does not stall the event loop.
+
+    Both knobs adapt to what the link delivers: segments are sized to take
+    about segment_seconds at the measured per-connection rate, and the
+    number of connections doubles each time every connection has finished
+    a segment, for as long as doubling raised the total throughput by more
+    than 10%. When it did not, it drops back to the previous number.
+
+    Args:
+        url: URL of the file
+        fd: File descriptor opened for writing
+        read_size: Size of the reads from the response bodies
+        max_parallel: Most connections used at once
+        min_chunk: Size of the first and of the smallest segments
+        max_chunk: Size of the largest segments
+        segment_seconds: Target duration of one segment request
+    """
+
+    def __init__(self, url: str, fd: int, read_size: int = _ALIGN,
+                 max_parallel: int = RANGED_DOWNLOAD_MAX_PARALLEL, min_chunk: int = RANGED_DOWNLOAD_MIN_CHUNK,
+                 max_chunk: int = RANGED_DOWNLOAD_MAX_CHUNK,
+                 segment_seconds: float = RANGED_DOWNLOAD_SEGMENT_SECONDS):
+        self.url = url
+        self.fd = fd
+        self.read_size = read_size
+        self.max_parallel = max(max_parallel, 1)
+        self.min_chunk = max(min_chunk, _ALIGN)
+        self.max_chunk = max(max_chunk, self.min_chunk)
+        self.segment_seconds = segment_seconds
+
+        self.mode = None
+        self.size = None
+        self.chunk_size = self.min_chunk
+        self.connections = 1
+        self.peak_connections = 1
+        self.segments = []
+        self._next_offset = 0
+        self._rate = 0.0
+        self._best_rate = 0.0
+        self._best_connections = 1
+        self._ramping = True
+        self._level_started = None
+        self._level_bytes = 0
+        self._level_segments = 0
+        self._tasks = set()
+        self._active = 0
+        self._disk_calls = set()
+
+    def _pwrite(self, chunk: bytes, offset: int) -> None:
+        """Write a piece of the body at its place in the file, blocking"""
+        view = memoryview(chunk)
+        while view:
+            written = os.pwrite(self.fd, view, offset)
+            view = view[written:]
+            offset += written
+
+    async def _disk(self, func, *args):
+        """
+        Run a blocking call on the file descriptor in a worker thread
+
+        The call is shielded and tracked, so one that outlives a cancelled
+        segment is still waited for by close before the descriptor goes away.
+        """
+        call = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        self._disk_calls.add(call)
+        call.add_done_callback(self._disk_calls.discard)
+        return await asyncio.shield(call)
+
+    async def close(self) -> None:
+        """Wait for the disk calls still running, so the descriptor can be closed"""
+        await asyncio.gather(*self._disk_calls, return_exceptions=True)
+
+    async def _write(self, chunk: bytes, offset: int) -> None:
+        """Write a piece of the body at its place in the file"""
+        await self._disk(self._pwrite, chunk, offset)
+        bytes_transferred.inc(len(chunk), direction='download')
+
+    async def _probe(self, ranged: bool = True) -> int:
+        """
+        Request the first segment, learning the size and whether ranges work
+
+        Args:
+            ranged: Ask for the first segment rather than the whole file
+
+        Returns:
+            Number of bytes written
+        """
+        session = get_http_session()
+        headers = {'Range': f"bytes=0-{self.min_chunk - 1}"} if ranged else None
+        async with session.get(self.url, headers=headers) as response:
+            if response.status == 416:
+                # Only an empty file has no first byte
+                self.mode, self.size = 'ranged', 0
+                self.segments = []
+                return 0
+            if response.status not in (200, 206):
+                raise TransferError(f"Download failed with HTTP {response.status}", response.status)
+
+            total = None
+            if response.status == 206 and response.headers.get('Accept-Ranges', 'bytes').lower() != 'none':
+                first, _, total = parse_content_range(response.headers.get('Content-Range'))
+                if first != 0:
+                    raise TransferError(f"Server answered range 0- from byte {first}")
+            unsized = response.status == 206 and total is None
+
+            if not unsized:
+                await self._disk(os.ftruncate, self.fd, 0)
+                if total is None:
+                    # No ranges: this response already carries the whole file
+                    self.mode, self.size = 'single', None
+                else:
+                    self.mode, self.size = 'ranged', total
+                    await self._disk(preallocate, self.fd, total)
+
+                written = 0
+                async for chunk in response.content.iter_chunked(self.read_size):
+                    await self._write(chunk, written)
+                    written += len(chunk)
+
+        if unsized:
+            # A partial answer without the total size is no use for segments
+            return await self._probe(ranged=False)
+        if self.mode == 'single':
+            self.size = written
+        self.segments = [(0, written)]
+        return written
+
+    async def _fetch(self, start: int, length: int) -> None:
+        """Fetch one segment, resuming within it when an attempt fails"""
+        end = start + length - 1
+        received = 0
+
+        async def attempt():
+            nonlocal received
+            session = get_http_session()
+            headers = {'Range': f"bytes={start + received}-{end}"}
+            async with session.get(self.url, headers=headers) as response:
+                if response.status != 206:
+                    # Ranges stopped working mid-download, which retrying will not fix
+                    raise TransferError(f"Range request answered with HTTP {response.status}", response.status)
+                first, last, total = parse_content_range(response.headers.get('Content-Range'))
+                if (first, last) != (start + received, end) or total not in (None, self.size):
+                    raise TransferError(
+                        f"Server sent {response.headers.get('Content-Range')} for bytes {start + received}-{end}",
+                        response.status
+                    )
+                async for chunk in response.content.iter_chunked(self.read_size):
+                    if received + len(chunk) > length:
+                        raise TransferError(f"Segment at {start} is longer than {length} bytes", response.status)
+                    await self._write(chunk, start + received)
+                    received += len(chunk)
+            if received != length:
+                raise TransferError(f"Segment at {start} ended after {received} of {length} bytes")
+
+        await retry_async(attempt, get_breaker('telegram'), description=f"Download of bytes {start}-{end}")
+
+    def _take_segment(self):
+        """Hand out the next segment as (start, length), or None when all are taken"""
+        remaining = self.size - self._next_offset
+        if remaining <= 0:
+            return None
+        # Near the end, split what is left between the connections so none
+        # of them is left finishing a long segment alone
+        length = min(self.chunk_size, max(self.min_chunk, -(-remaining // self.connections)))
+        if remaining - length < self.min_chunk:
+            length = remaining
+        start = self._next_offset
+        self._next_offset += length
+        return start, length
+
+    def _segment_done(self, start: int, length: int, elapsed: float) -> None:
+        """Record a finished segment and adapt segment size and parallelism"""
+        self.segments.append((start, length))
+
+        rate = length / max(elapsed, 1e-6)
+        self._rate = rate if not self._rate else 0.7 * self._rate + 0.3 * rate
+        chunk = int(self._rate * self.segment_seconds) // _ALIGN * _ALIGN
+        self.chunk_size = min(max(chunk, self.min_chunk), self.max_chunk)
+
+        self._level_bytes += length
+        self._level_segments += 1
+        if not self._ramping or self._level_segments < self.connections:
+            return
+
+        level_rate = self._level_bytes / max(time.monotonic() - self._level_started, 1e-6)
+        if level_rate <= self._best_rate * (1 + _RAMP_GAIN):
+            # The extra connections did not pay off, so they close again
+            self.connections = self._best_connections
+            self._ramping = False
+            return
+        self._best_rate = level_rate
+        self._best_connections = self.connections
+        if self.connections >= self.max_parallel:
+            self._ramping = False
+            return
+
+        added = min(self.connections, self.max_parallel - self.connections)
+        self.connections += added
+        self.peak_connections = max(self.peak_connections, self.connections)
+        self._start_level()
+        for _ in range(added):
+            self._spawn()
+
+    def _start_level(self) -> None:
+        """Start measuring the throughput of the current number of connections"""
+        self._level_started = time.monotonic()
+        self._level_bytes = 0
+        self._level_segments = 0
+
+    async def _worker(self) -> None:
+        """Fetch segments one after another until none are left"""
+        self._active += 1
+        try:
+            while self._active <= self.connections:
+                segment = self._take_segment()
+                if segment is None:
+                    return
+                started = time.monotonic()
+                await self._fetch(*segment)
+                self._segment_done(*segment, time.monotonic() - started)
+        finally:
+            self._active -= 1
+
+    def _spawn(self) -> None:
+        """Open one more connection"""
+        if self._next_offset < self.size:
+            self._tasks.add(asyncio.create_task(self._worker()))
+
+    async def _fetch_rest(self) -> None:
+        """Fetch everything after the first segment"""
+        self._start_level()
+        self._spawn()
+        try:
+            while True:
+                pending = [task for task in self._tasks if not task.done()]
+                if not pending:
+                    break
+                await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in self._tasks:
+                    if task.done() and task.exception():
+                        raise task.exception()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _verify(self) -> None:
+        """Check that the segments cover the file exactly once"""
+        position = 0
+        for start, length in sorted(self.segments):
+            if start != position:
+                raise TransferError(f"Segments do not line up at byte {position}, next starts at {start}")
+            position += length
+        if position != self.size:
+            raise TransferError(f"Segments add up to {position} bytes instead of {self.size}")
+        file_size = (await self._disk(os.fstat, self.fd)).st_size
+        if file_size != self.size:
+            raise TransferError(f"Downloaded file has {file_size} bytes instead of {self.size}")
+
+    async def run(self) -> dict:
+        """
+        Download the whole file
+
+        Returns:
+            Dict with the mode, size, peak connections, segment count and final segment size
+        """
+        self._next_offset = await retry_async(self._probe, get_breaker('telegram'), description="Download probe")
+        if self.mode == 'ranged':
+            await self._fetch_rest()
+        await self._verify()
+        ranged_downloads.inc(mode=self.mode)
+        return {
+            'mode': self.mode,
+            'size': self.size,
+            'connections': self.peak_connections,
+            'segments': len(self.segments),
+            'chunk_size': self.chunk_size
+        }
+
+@timed_stage('download')
+async def download_ranged(url: str, output_path: str, read_size: int = _ALIGN, **options) -> dict:
+    """
+    Download a URL to a file over parallel range requests
+
+    Falls back to a single stream when the server does not answer range
+    requests with 206 Partial Content.
+
+    Args:
+        url: URL of the file
+        output_path: Path the file is written to
+        read_size: Size of the reads from the response bodies
+        **options: Settings passed to RangedDownload
+
+    Returns:
+        See RangedDownload.run
+    """
+    fd = await asyncio.to_thread(os.open, output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    download = RangedDownload(url, fd, read_size, **options)
+    try:
+        started = time.monotonic()
+        stats = await download.run()
+    finally:
+        await download.close()
+        os.close(fd)
+
+    logger.debug(
+        "Downloaded %s bytes in %.2fs (%s, %s connections, %s segments)",
+        stats['size'], time.monotonic() - started, stats['mode'], stats['connections'], stats['segments']
+    )
+    return stats
@@ -0,0 +1,242 @@
+"""
+Retries with jittered backoff and per-endpoint circuit breakers
+"""
+import os
+import time
+import random
+import asyncio
+from typing import Awaitable, Callable
+from utils.logger import get_logger
+
+# Get logger
+logger = get_logger(__name__)
+
+# Retry settings
+RETRY_ATTEMPTS = int(os.getenv('RETRY_ATTEMPTS', 4))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 0.5))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 15.0))
+
+# Circuit breaker settings
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 30.0))
+
+class TransferError(Exception):
+    """
+    HTTP error from Telegram or Telegraph
+
+    Args:
+        message: Error message
+        status: HTTP status code, if any
+    """
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+class RetryAfterError(Exception):
+    """
+    Flood wait asked for by an endpoint
+
+    Args:
+        retry_after: Seconds to wait before the next call
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Flood control exceeded. Retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose breaker is open"""
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Check whether an error is worth retrying
+
+    Args:
+        error: The raised exception
+
+    Returns:
+        True for timeouts, connection errors, 5xx, 429 and flood waits
+    """
+    if isinstance(error, TransferError):
+        return error.status is None or error.status >= 500 or error.status == 429
+    # Imported here so the retry module stays cheap to import at startup
+    import aiohttp
+    from telegram.error import BadRequest, NetworkError, RetryAfter
+    # python-telegram-bot raises NetworkError for timeouts, connection
+    # errors and 5xx answers, and BadRequest, a subclass, for 400s
+    if isinstance(error, RetryAfter):
+        return True
+    if isinstance(error, NetworkError):
+        return not isinstance(error, BadRequest)
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, RetryAfterError))
+
+def is_transient(error: Exception) -> bool:
+    """
+    Check whether an error or any error it was raised from is transient
+
+    Args:
+        error: The raised exception
+
+    Returns:
+        True if the failure is worth trying again later
+    """
+    while error is not None:
+        if isinstance(error, CircuitOpenError) or is_retryable(error):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+def backoff_delay(attempt: int, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> float:
+    """
+    Get the full-jitter exponential backoff delay for an attempt
+
+    Args:
+        attempt: Number of the attempt that just failed, starting at 1
+        base_delay: Delay after the first failure
+        max_delay: Upper bound of the delay
+
+    Returns:
+        Delay in seconds
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+class CircuitBreaker:
+    """
+    Fails fast while an endpoint keeps failing
+
+    After failure_threshold consecutive retryable failures the breaker
+    opens and calls raise CircuitOpenError. Once reset_timeout has passed
+    a single trial call is let through; its outcome closes or reopens the
+    breaker.
+
+    Args:
+        name: Endpoint name used in logs
+        failure_threshold: Consecutive failures that open the breaker
+        reset_timeout: Seconds to stay open before a trial call
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._listeners = []
+
+    @property
+    def state(self) -> str:
+        """Current state: 'closed', 'open' or 'half_open'"""
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def on_close(self, callback: Callable[[], None]) -> None:
+        """
+        Register a callback run when the breaker closes again
+
+        Args:
+            callback: Function called without arguments
+        """
+        self._listeners.append(callback)
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go through"""
+        state = self.state
+        if state == 'open' or (state == 'half_open' and self._trial):
+            raise CircuitOpenError(f"{self.name} is unavailable, try again later")
+        if state == 'half_open':
+            self._trial = True
+
+    def record_success(self) -> None:
+        """Record a call that reached a healthy endpoint"""
+        was_open = self.opened_at is not None
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        if was_open:
+            logger.info("Circuit breaker for %s closed", self.name)
+            for callback in self._listeners:
+                callback()
+
+    def abort_call(self) -> None:
+        """Forget a call that was cancelled before it finished"""
+        self._trial = False
+
+    def record_failure(self) -> None:
+        """Record a retryable failure"""
+        self.failures += 1
+        if self._trial or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._trial:
+                logger.warning("Circuit breaker for %s opened after %s failures", self.name, self.failures)
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+# Breakers by endpoint name
+_breakers = {}
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    Get the circuit breaker of an endpoint
+
+    Args:
+        name: Endpoint name, e.g. 'telegram' or 'telegraph'
+
+    Returns:
+        The breaker instance
+    """
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+async def retry_async(func: Callable[[], Awaitable], breaker: CircuitBreaker = None,
+                      attempts: int = RETRY_ATTEMPTS, description: str = 'request',
+                      retry_if: Callable[[Exception], bool] = None):
+    """
+    Call a coroutine function, retrying retryable errors with backoff
+
+    Args:
+        func: Coroutine function to call
+        breaker: Circuit breaker guarding the endpoint
+        attempts: Maximum number of attempts
+        description: What is being attempted, used in logs
+        retry_if: Optional check a retryable error must also pass to be
+            retried, e.g. that a non-idempotent request was never sent
+
+    Returns:
+        The result of func
+    """
+    for attempt in range(1, attempts + 1):
+        if breaker:
+            breaker.before_call()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            if breaker:
+                breaker.abort_call()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                # The endpoint answered, so it is healthy as far as the breaker goes
+                if breaker:
+                    breaker.record_success()
+                raise
+            if breaker:
+                breaker.record_failure()
+            if attempt == attempts or (retry_if and not retry_if(e)):
+                raise
+
+            delay = backoff_delay(attempt)
+            retry_after = getattr(e, 'retry_after', None)
+            if retry_after is not None:
+                delay = max(delay, float(retry_after))
+            logger.warning("%s failed (attempt %s/%s), retrying in %.1fs: %s", description, attempt, attempts, delay, e)
+            await asyncio.sleep(delay)
+        else:
+            if breaker:
+                breaker.record_success()
+            return result
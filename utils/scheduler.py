@@ -0,0 +1,237 @@
+"""
+Bounded job scheduler with per-chat fairness for media transfers
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+from utils.logger import get_logger
+
+# Get logger
+logger = get_logger(__name__)
+
+# Scheduler settings
+SCHEDULER_MAX_JOBS = int(os.getenv('SCHEDULER_MAX_JOBS', 8))
+SCHEDULER_MAX_DOWNLOADS = int(os.getenv('SCHEDULER_MAX_DOWNLOADS', 4))
+SCHEDULER_MAX_UPLOADS = int(os.getenv('SCHEDULER_MAX_UPLOADS', 4))
+SCHEDULER_QUEUE_SIZE = int(os.getenv('SCHEDULER_QUEUE_SIZE', 100))
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted to a full queue"""
+
+class JobScheduler:
+    """
+    Runs transfer jobs on a fixed pool of workers
+
+    Pending jobs are kept in one queue per chat and workers take them
+    round-robin across chats, so a single chat sending many files cannot
+    starve the others. The download and upload stages have their own
+    concurrency caps on top of the global worker count.
+
+    Args:
+        max_jobs: Number of jobs running at the same time
+        max_downloads: Number of concurrent downloads
+        max_uploads: Number of concurrent uploads
+        max_queue: Maximum number of jobs waiting to run
+        per_chat_serial: Run at most one job per chat at a time, keeping
+            the jobs of a chat in submission order
+    """
+
+    def __init__(self, max_jobs: int = SCHEDULER_MAX_JOBS, max_downloads: int = SCHEDULER_MAX_DOWNLOADS,
+                 max_uploads: int = SCHEDULER_MAX_UPLOADS, max_queue: int = SCHEDULER_QUEUE_SIZE,
+                 per_chat_serial: bool = False):
+        self.max_jobs = max_jobs
+        self.max_queue = max_queue
+        self.per_chat_serial = per_chat_serial
+        self._stages = {
+            'download': asyncio.Semaphore(max_downloads),
+            'upload': asyncio.Semaphore(max_uploads)
+        }
+        self._queues = OrderedDict()
+        self._running_chats = set()
+        self._pending = 0
+        self._active = 0
+        self._wakeup = asyncio.Event()
+        self._progress = asyncio.Condition()
+        self._workers = []
+
+        # Metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting to run"""
+        return self._pending
+
+    @property
+    def in_flight(self) -> int:
+        """Number of jobs currently running"""
+        return self._active
+
+    def is_full(self) -> bool:
+        """Check whether the queue can take another job"""
+        return self._pending >= self.max_queue
+
+    async def wait_for_room(self) -> None:
+        """Wait until the queue can take another job"""
+        async with self._progress:
+            await self._progress.wait_for(lambda: not self.is_full())
+
+    async def join(self) -> None:
+        """Wait until no job is queued or running"""
+        async with self._progress:
+            await self._progress.wait_for(lambda: not (self._pending or self._active))
+
+    async def _notify_progress(self) -> None:
+        """Wake the callers of wait_for_room and join"""
+        async with self._progress:
+            self._progress.notify_all()
+
+    def position_for(self, chat_id: int) -> int:
+        """
+        Estimate the queue position a new job from a chat would get
+
+        Args:
+            chat_id: Chat the job belongs to
+
+        Returns:
+            0 when the job would start right away, otherwise its position
+        """
+        if self._pending == 0 and self._active < self.max_jobs:
+            return 0
+
+        # Round-robin serves one job per chat per turn, so other chats only
+        # get ahead of us by as many turns as we are deep in our own queue
+        turns = len(self._queues.get(chat_id, ())) + 1
+        ahead = sum(min(len(queue), turns) for key, queue in self._queues.items() if key != chat_id)
+        return ahead + turns
+
+    def submit(self, chat_id: int, job: Callable[[], Awaitable]) -> None:
+        """
+        Queue a job for a chat
+
+        Args:
+            chat_id: Chat the job belongs to
+            job: Coroutine function run by a worker
+        """
+        if self.is_full():
+            self.rejected += 1
+            raise QueueFullError("Job queue is full")
+
+        self._queues.setdefault(chat_id, deque()).append((time.monotonic(), job))
+        self._pending += 1
+        self.submitted += 1
+        self._wakeup.set()
+
+    def _next_chat(self):
+        """Get the chat whose turn it is, or None when no chat may run"""
+        for chat_id in self._queues:
+            if not self.per_chat_serial or chat_id not in self._running_chats:
+                return chat_id
+        return None
+
+    def _next_job(self, chat_id):
+        """Take the next job of a chat and rotate it to the back"""
+        queue = self._queues[chat_id]
+        enqueued_at, job = queue.popleft()
+        del self._queues[chat_id]
+        if queue:
+            # Move the chat to the back of the rotation
+            self._queues[chat_id] = queue
+        self._pending -= 1
+        return chat_id, enqueued_at, job
+
+    async def _worker(self) -> None:
+        """Run jobs until cancelled"""
+        while True:
+            while (chat_id := self._next_chat()) is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            chat_id, enqueued_at, job = self._next_job(chat_id)
+            await self._notify_progress()
+            wait = time.monotonic() - enqueued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+            self._active += 1
+            self._running_chats.add(chat_id)
+            try:
+                await job()
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Job for chat %s failed: %s", chat_id, e, exc_info=True)
+            finally:
+                self._active -= 1
+                self._running_chats.discard(chat_id)
+                if self.per_chat_serial and self._queues:
+                    # The chat's next job may be waiting for this one
+                    self._wakeup.set()
+                await self._notify_progress()
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """
+        Hold a concurrency slot for a transfer stage
+
+        Args:
+            name: Stage name, 'download' or 'upload'
+        """
+        async with self._stages[name]:
+            yield
+
+    def stats(self) -> dict:
+        """
+        Get queue metrics
+
+        Returns:
+            Dict of scheduler counters
+        """
+        started = self.completed + self.failed + self._active
+        return {
+            'queue_depth': self._pending,
+            'in_flight': self._active,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'avg_wait': self.total_wait / started if started else 0.0,
+            'max_wait': self.max_wait
+        }
+
+    async def start(self) -> None:
+        """Start the worker tasks"""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_jobs)]
+            logger.info("Job scheduler started with %s workers", self.max_jobs)
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Job scheduler stopped: %s", self.stats())
+
+# Shared scheduler instance
+_scheduler = None
+
+def get_scheduler() -> JobScheduler:
+    """
+    Get the shared job scheduler
+
+    Returns:
+        The scheduler instance
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = JobScheduler()
+    return _scheduler
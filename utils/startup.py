@@ -0,0 +1,180 @@
+"""
+Cold start: startup phase timings and the warm-up overlapped with getMe
+"""
+import os
+import time
+import asyncio
+import importlib
+import threading
+from urllib.parse import urlsplit
+from telegram.ext import Application
+from utils.logger import get_logger
+from utils.metrics import gauge
+from utils.http_client import get_http_session
+from utils.file_handler import TELEGRAM_API_URL, TELEGRAM_LOCAL_MODE
+from utils.telegraph_api import TELEGRAPH_API_URL
+from telegraph_client import TELEGRAPH_UPLOAD_URL
+
+# Get logger
+logger = get_logger(__name__)
+
+# Warm-up settings
+STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'true').lower() == 'true'
+
+# Modules kept off the import path of the bot, loaded in a thread while
+# the application is built and getMe is in flight instead
+DEFERRED_MODULES = ('aiohttp', 'aiohttp.web')
+
+def _process_started() -> float:
+    """
+    Get the time the process was started, on the perf_counter clock
+
+    Read from /proc on Linux so interpreter startup is included; elsewhere
+    the time this module was imported is used.
+    """
+    now = time.perf_counter()
+    try:
+        with open('/proc/self/stat') as stat_file:
+            # Field 22, counted after the parenthesised command name
+            start_ticks = int(stat_file.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return now
+    return now - max(uptime - start_ticks / os.sysconf('SC_CLK_TCK'), 0.0)
+
+# Seconds spent in each startup phase, in the order they ended
+_phases = {}
+_phase_started = _process_started()
+_process_start = _phase_started
+_reported = False
+
+# Thread importing the deferred modules, and the connection warm-ups
+# still running in the background
+_preload_thread = None
+_warm_tasks = set()
+
+def mark_phase(name: str) -> None:
+    """
+    End a startup phase
+
+    Everything since the previous mark, or since the process started, is
+    counted towards the phase. Marking the same phase again adds to it.
+
+    Args:
+        name: Phase name, e.g. 'imports'
+    """
+    global _phase_started
+    now = time.perf_counter()
+    _phases[name] = _phases.get(name, 0.0) + now - _phase_started
+    _phase_started = now
+
+def startup_phases() -> dict:
+    """
+    Get the time spent in each startup phase so far
+
+    Returns:
+        Dict of phase name to seconds, in the order the phases ended
+    """
+    return dict(_phases)
+
+def report_startup(what: str = 'Bot') -> None:
+    """
+    Log the startup breakdown once the process is ready to serve
+
+    Args:
+        what: Name of the process in the log message
+    """
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    total = time.perf_counter() - _process_start
+    breakdown = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in _phases.items())
+    logger.info("%s ready %.2fs after process start (%s)", what, total, breakdown)
+
+def warm_up_urls() -> list:
+    """
+    Get the origins the bot downloads files from and uploads them to
+
+    Returns:
+        List of distinct scheme://host:port origins
+    """
+    urls = [TELEGRAPH_UPLOAD_URL, TELEGRAPH_API_URL]
+    if not TELEGRAM_LOCAL_MODE:
+        # getMe warms up python-telegram-bot's own client, not this one
+        urls.insert(0, TELEGRAM_API_URL)
+    origins = []
+    for url in urls:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}/"
+        if parts.netloc and origin not in origins:
+            origins.append(origin)
+    return origins
+
+def preload_modules() -> None:
+    """Import the deferred modules, skipping any that are not installed"""
+    for name in DEFERRED_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.debug("Could not preload %s: %s", name, e)
+
+def start_preload() -> None:
+    """Start importing the deferred modules in a background thread, once"""
+    global _preload_thread
+    if STARTUP_WARMUP and _preload_thread is None:
+        _preload_thread = threading.Thread(target=preload_modules, name='preload', daemon=True)
+        _preload_thread.start()
+
+async def _open_connection(url: str) -> None:
+    """Resolve a host and leave a keep-alive connection to it in the pool"""
+    try:
+        async with get_http_session().head(url, allow_redirects=False):
+            pass
+    except Exception as e:
+        logger.debug("Could not pre-open a connection to %s: %s", url, e)
+
+async def warm_up(urls: list = None) -> None:
+    """
+    Do the startup work that does not depend on Telegram
+
+    Waits for the deferred modules to be loaded in a thread and opens the
+    shared HTTP session. A connection to each host files are downloaded
+    from or uploaded to is then opened in the background, which also fills
+    the DNS cache, so the first transfer does not pay for the handshakes.
+    Startup does not wait for those connections.
+
+    Args:
+        urls: URLs of the hosts to connect to, see warm_up_urls by default
+    """
+    if not STARTUP_WARMUP:
+        return
+    start_preload()
+    await asyncio.to_thread(_preload_thread.join)
+    get_http_session()
+    for url in urls if urls is not None else warm_up_urls():
+        task = asyncio.create_task(_open_connection(url))
+        _warm_tasks.add(task)
+        task.add_done_callback(_warm_tasks.discard)
+
+class WarmStartApplication(Application):
+    """
+    Application that runs the warm-up while getMe is in flight
+
+    Set through ApplicationBuilder.application_class, so polling and the
+    webhook server both get it. The deferred modules start loading as soon
+    as the application is built.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        start_preload()
+
+    async def initialize(self) -> None:
+        """Initialize the application, overlapping getMe with the warm-up"""
+        await asyncio.gather(super().initialize(), warm_up())
+        mark_phase('initialize')
+
+gauge('m2t_startup_seconds', 'Seconds spent in each startup phase', ('phase',),
+      function=lambda: {(name,): round(seconds, 4) for name, seconds in _phases.items()})
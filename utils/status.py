@@ -0,0 +1,166 @@
+"""
+Rate-limit-aware coalescing of status message edits
+"""
+import os
+import time
+import asyncio
+from telegram.error import BadRequest, RetryAfter
+from utils.logger import get_logger
+
+# Get logger
+logger = get_logger(__name__)
+
+# Status update settings
+STATUS_MIN_INTERVAL = float(os.getenv('STATUS_MIN_INTERVAL', 1.0))
+STATUS_QUIET_BELOW = int(os.getenv('STATUS_QUIET_BELOW', 1024 * 1024))
+
+class StatusCoalescer:
+    """
+    Throttles status message edits per chat
+
+    Intermediate states are sent in the background at most once per
+    min_interval per chat, and a state that is superseded before it could
+    be sent is dropped. Final states always go out, waiting out any
+    flood-wait reported by Telegram.
+
+    Args:
+        min_interval: Minimum number of seconds between edits in one chat
+        quiet_below: Files smaller than this many bytes get no intermediate states
+    """
+
+    def __init__(self, min_interval: float = STATUS_MIN_INTERVAL, quiet_below: int = STATUS_QUIET_BELOW):
+        self.min_interval = min_interval
+        self.quiet_below = quiet_below
+        self.calls_made = 0
+        self.calls_saved = 0
+        self._next_allowed = {}
+        self._pending = {}
+        self._tasks = {}
+
+    def is_quiet(self, file_size) -> bool:
+        """
+        Check whether intermediate states can be skipped for a file
+
+        Args:
+            file_size: Size of the file in bytes, if known
+
+        Returns:
+            True if the file is small enough to finish without progress edits
+        """
+        return file_size is not None and file_size < self.quiet_below
+
+    def _delay(self, chat_id: int) -> float:
+        """Seconds to wait before the chat may be edited again"""
+        return max(0.0, self._next_allowed.get(chat_id, 0.0) - time.monotonic())
+
+    async def _send(self, message, text: str, retry: bool, **kwargs) -> None:
+        """Edit a message, tracking the chat's rate limit"""
+        chat_id = message.chat_id
+        while True:
+            await asyncio.sleep(self._delay(chat_id))
+            self._next_allowed[chat_id] = time.monotonic() + self.min_interval
+            try:
+                self.calls_made += 1
+                await message.edit_text(text, **kwargs)
+                return
+            except RetryAfter as e:
+                self._next_allowed[chat_id] = time.monotonic() + float(e.retry_after)
+                logger.warning("Flood wait of %ss for chat %s", e.retry_after, chat_id)
+                if not retry:
+                    self.calls_saved += 1
+                    return
+            except BadRequest as e:
+                if 'not modified' in str(e).lower():
+                    return
+                raise
+
+    async def _flush(self, key) -> None:
+        """
+        Send the latest pending intermediate state for a message
+
+        States queued while an edit is in flight are picked up by the same
+        task, which only exits once nothing is pending for the message.
+        """
+        try:
+            while key in self._pending:
+                await asyncio.sleep(self._delay(key[0]))
+                pending = self._pending.pop(key, None)
+                if pending is None:
+                    break
+                message, text = pending
+                try:
+                    await self._send(message, text, retry=False)
+                except Exception as e:
+                    logger.warning("Status update failed: %s", e)
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+    async def update(self, message, text: str, quiet: bool = False) -> None:
+        """
+        Queue an intermediate state for a status message
+
+        Args:
+            message: Status message to edit
+            text: New message text
+            quiet: Skip the edit entirely
+        """
+        if quiet:
+            self.calls_saved += 1
+            return
+
+        key = (message.chat_id, message.message_id)
+        if key in self._pending:
+            # The older state was never sent
+            self.calls_saved += 1
+        self._pending[key] = (message, text)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._flush(key))
+
+    async def final(self, message, text: str, **kwargs) -> None:
+        """
+        Send the final state of a status message
+
+        Args:
+            message: Status message to edit
+            text: Final message text
+            **kwargs: Extra arguments passed to edit_text
+        """
+        key = (message.chat_id, message.message_id)
+        if self._pending.pop(key, None) is not None:
+            self.calls_saved += 1
+        task = self._tasks.pop(key, None)
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        await self._send(message, text, retry=True, **kwargs)
+
+        # Forget chats whose rate limit window has passed
+        if len(self._next_allowed) > 10000:
+            now = time.monotonic()
+            self._next_allowed = {k: v for k, v in self._next_allowed.items() if v > now}
+
+    def stats(self) -> dict:
+        """
+        Get edit counters
+
+        Returns:
+            Dict with the number of Bot API calls made and saved
+        """
+        return {'calls_made': self.calls_made, 'calls_saved': self.calls_saved}
+
+# Shared coalescer instance
+_coalescer = None
+
+def get_status_coalescer() -> StatusCoalescer:
+    """
+    Get the shared status coalescer
+
+    Returns:
+        The coalescer instance
+    """
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = StatusCoalescer()
+    return _coalescer
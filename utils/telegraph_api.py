@@ -0,0 +1,221 @@
+"""
+Asyncio-native Telegraph API client built on the shared HTTP session
+"""
+import os
+import json
+from utils.http_client import get_http_session
+from utils.retry import RetryAfterError, TransferError, get_breaker, retry_async
+
+# Telegraph API base URL
+TELEGRAPH_API_URL = os.getenv('TELEGRAPH_API_URL', 'https://api.telegra.ph')
+
+class TelegraphException(Exception):
+    """Error returned by the Telegraph API"""
+
+def json_dumps(value) -> str:
+    """Serialize page content the way the Telegraph API expects it"""
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+def html_to_nodes(html_content: str) -> list:
+    """
+    Convert HTML to Telegraph content nodes
+
+    The telegraph package pulls in requests, so it is only imported when
+    a page is actually given as HTML.
+
+    Args:
+        html_content: Page content as HTML
+
+    Returns:
+        List of Telegraph nodes
+    """
+    from telegraph.utils import html_to_nodes as convert
+    return convert(html_content)
+
+class FloodWaitError(TelegraphException):
+    """
+    Flood wait handed to the caller instead of being slept through
+
+    Args:
+        retry_after: Seconds the account has to wait
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Flood control exceeded. Retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+def request_not_sent(error: Exception) -> bool:
+    """
+    Check whether a failed call certainly had no effect on Telegraph
+
+    Args:
+        error: The raised exception
+
+    Returns:
+        True for flood waits, 429 answers and failures to connect
+    """
+    import aiohttp
+    if isinstance(error, RetryAfterError):
+        return True
+    if isinstance(error, TransferError):
+        return error.status == 429
+    return isinstance(error, aiohttp.ClientConnectorError)
+
+class AsyncTelegraph:
+    """
+    Non-blocking Telegraph API client
+
+    Args:
+        access_token: Telegraph access token
+        api_url: Base URL of the Telegraph API
+        wait_on_flood: Sleep through flood waits and retry, otherwise
+            raise FloodWaitError right away
+    """
+
+    def __init__(self, access_token: str = None, api_url: str = None, wait_on_flood: bool = True):
+        self.access_token = access_token
+        self.api_url = (api_url or TELEGRAPH_API_URL).rstrip('/')
+        self.wait_on_flood = wait_on_flood
+
+    async def method(self, method: str, values: dict = None, path: str = '', idempotent: bool = True) -> dict:
+        """
+        Call a Telegraph API method
+
+        Args:
+            method: API method name
+            values: Method parameters
+            path: Optional page path appended to the method URL
+            idempotent: Whether the call may be repeated after a timeout or
+                5xx; otherwise it is only retried when it cannot have
+                reached Telegraph, so a lost answer never creates a duplicate
+
+        Returns:
+            The method result
+        """
+        values = {k: v for k, v in (values or {}).items() if v is not None}
+        if 'access_token' not in values and self.access_token:
+            values['access_token'] = self.access_token
+
+        url = f"{self.api_url}/{method}/{path}" if path else f"{self.api_url}/{method}"
+
+        async def attempt():
+            try:
+                return await self._post(url, values)
+            except RetryAfterError as e:
+                if self.wait_on_flood:
+                    raise
+                raise FloodWaitError(e.retry_after) from None
+
+        return await retry_async(attempt, get_breaker('telegraph'), description=f"Telegraph {method}",
+                                 retry_if=None if idempotent else request_not_sent)
+
+    async def _post(self, url: str, values: dict) -> dict:
+        """Send one API request and unwrap the result"""
+        session = get_http_session()
+        async with session.post(url, data=values) as response:
+            if response.status >= 500 or response.status == 429:
+                raise TransferError(f"Telegraph API returned status code {response.status}", response.status)
+            result = await response.json(content_type=None)
+
+        if result.get('ok'):
+            return result['result']
+
+        error = result.get('error')
+        if isinstance(error, str) and error.startswith('FLOOD_WAIT_'):
+            raise RetryAfterError(int(error.rsplit('_', 1)[-1]))
+        raise TelegraphException(error)
+
+    async def create_account(self, short_name: str, author_name: str = None,
+                             author_url: str = None, replace_token: bool = True) -> dict:
+        """
+        Create a new Telegraph account
+
+        Args:
+            short_name: Account name shown to the user
+            author_name: Default author name for new pages
+            author_url: Default profile link for new pages
+            replace_token: Use the new account's token for later calls
+
+        Returns:
+            Account information including the access token
+        """
+        account = await self.method('createAccount', {
+            'short_name': short_name,
+            'author_name': author_name,
+            'author_url': author_url
+        }, idempotent=False)
+        if replace_token:
+            self.access_token = account['access_token']
+        return account
+
+    async def create_page(self, title: str, content: list = None, html_content: str = None,
+                          author_name: str = None, author_url: str = None,
+                          return_content: bool = False) -> dict:
+        """
+        Create a new Telegraph page
+
+        Args:
+            title: Page title
+            content: Content as a list of Telegraph nodes
+            html_content: Content as HTML, used when content is empty
+            author_name: Author name
+            author_url: Author profile link
+            return_content: Include the content in the result
+
+        Returns:
+            The created page
+        """
+        if not content and html_content:
+            content = html_to_nodes(html_content)
+
+        return await self.method('createPage', {
+            'title': title,
+            'content': json_dumps(content or []),
+            'author_name': author_name,
+            'author_url': author_url,
+            'return_content': str(return_content).lower()
+        }, idempotent=False)
+
+    async def edit_page(self, path: str, title: str, content: list = None, html_content: str = None,
+                        author_name: str = None, author_url: str = None,
+                        return_content: bool = False) -> dict:
+        """
+        Edit an existing Telegraph page
+
+        Args:
+            path: Path of the page
+            title: Page title
+            content: Content as a list of Telegraph nodes
+            html_content: Content as HTML, used when content is empty
+            author_name: Author name
+            author_url: Author profile link
+            return_content: Include the content in the result
+
+        Returns:
+            The edited page
+        """
+        if not content and html_content:
+            content = html_to_nodes(html_content)
+
+        return await self.method('editPage', {
+            'title': title,
+            'content': json_dumps(content or []),
+            'author_name': author_name,
+            'author_url': author_url,
+            'return_content': str(return_content).lower()
+        }, path=path)
+
+    async def get_page(self, path: str, return_content: bool = True) -> dict:
+        """
+        Get a Telegraph page
+
+        Args:
+            path: Path of the page
+            return_content: Include the content in the result
+
+        Returns:
+            The page
+        """
+        return await self.method('getPage', {
+            'return_content': str(return_content).lower()
+        }, path=path)
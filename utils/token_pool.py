@@ -0,0 +1,246 @@
+"""
+Pool of Telegraph accounts sharing the page creation load
+"""
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from pathlib import Path
+from utils.logger import get_logger
+from utils.metrics import counter, gauge
+from utils.telegraph_api import AsyncTelegraph, FloodWaitError
+
+# Get logger
+logger = get_logger(__name__)
+
+# Token pool settings
+TELEGRAPH_TOKENS_PATH = os.getenv(
+    'TELEGRAPH_TOKENS_PATH', str(Path(__file__).parent.parent / 'data' / 'telegraph_tokens.json')
+)
+TELEGRAPH_TOKEN_MAX_RATE = int(os.getenv('TELEGRAPH_TOKEN_MAX_RATE', 0))
+TELEGRAPH_POOL_ATTEMPTS = int(os.getenv('TELEGRAPH_POOL_ATTEMPTS', 5))
+
+# Window over which each account's call rate is tracked, in seconds
+RATE_WINDOW = 60
+
+# Page creation per account, labelled by position in the pool, never by token
+pages_created = counter('m2t_telegraph_pages_total', 'Telegraph pages created per account', ('account',))
+flood_waits = counter('m2t_telegraph_flood_waits_total', 'Flood waits hit per Telegraph account', ('account',))
+
+def load_tokens(path: str = TELEGRAPH_TOKENS_PATH) -> list:
+    """
+    Collect the configured Telegraph access tokens
+
+    Tokens come from TELEGRAPH_ACCESS_TOKENS (comma separated), the tokens
+    file written by create_token.py and TELEGRAPH_ACCESS_TOKEN, in that order.
+
+    Args:
+        path: Path of the tokens file
+
+    Returns:
+        List of distinct tokens
+    """
+    tokens = [token.strip() for token in os.getenv('TELEGRAPH_ACCESS_TOKENS', '').split(',')]
+
+    if os.path.exists(path):
+        try:
+            with open(path) as tokens_file:
+                tokens.extend(account['access_token'] for account in json.load(tokens_file))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error("Could not read Telegraph tokens from %s: %s", path, e)
+
+    tokens.append(os.getenv('TELEGRAPH_ACCESS_TOKEN', ''))
+    return list(dict.fromkeys(token for token in tokens if token))
+
+def save_accounts(accounts: list, path: str = TELEGRAPH_TOKENS_PATH) -> int:
+    """
+    Append accounts to the tokens file
+
+    Args:
+        accounts: Account dicts as returned by createAccount
+        path: Path of the tokens file
+
+    Returns:
+        Number of accounts now stored
+    """
+    stored = []
+    if os.path.exists(path):
+        with open(path) as tokens_file:
+            stored = json.load(tokens_file)
+
+    known = {account['access_token'] for account in stored}
+    stored.extend(account for account in accounts if account['access_token'] not in known)
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as tokens_file:
+        json.dump(stored, tokens_file, indent=2)
+    os.chmod(temp_path, 0o600)
+    os.replace(temp_path, path)
+    return len(stored)
+
+class _Account:
+    """One Telegraph account and its load"""
+
+    def __init__(self, index: int, token: str, api_url: str = None):
+        self.index = index
+        self.client = AsyncTelegraph(access_token=token, api_url=api_url, wait_on_flood=False)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.calls = deque()
+
+    def recent_calls(self, now: float) -> int:
+        """Number of calls started within the rate window"""
+        while self.calls and self.calls[0] <= now - RATE_WINDOW:
+            self.calls.popleft()
+        return len(self.calls)
+
+    def available(self, now: float, max_rate: int) -> bool:
+        """Check whether the account may take another call"""
+        if now < self.cooldown_until:
+            return False
+        return not max_rate or self.recent_calls(now) < max_rate
+
+    def ready_at(self, now: float, max_rate: int) -> float:
+        """Earliest time the account may take another call"""
+        ready = max(now, self.cooldown_until)
+        if max_rate and self.recent_calls(now) >= max_rate:
+            ready = max(ready, self.calls[-max_rate] + RATE_WINDOW)
+        return ready
+
+class TelegraphTokenPool:
+    """
+    Spreads page creation over several Telegraph accounts
+
+    Each call goes to the least loaded account, by calls in flight and then
+    by calls over the last minute. An account that hits a flood wait is
+    cooled down for the time Telegraph asks for while the call moves on to
+    another account. When every account is cooling down, callers wait for
+    the first one to come back.
+
+    Args:
+        tokens: Telegraph access tokens, at least one
+        api_url: Base URL of the Telegraph API
+        max_rate: Calls per minute allowed per account, 0 for no limit
+        attempts: Flood waits tolerated per call before giving up
+    """
+
+    def __init__(self, tokens: list, api_url: str = None, max_rate: int = TELEGRAPH_TOKEN_MAX_RATE,
+                 attempts: int = TELEGRAPH_POOL_ATTEMPTS):
+        self._accounts = [_Account(index, token, api_url) for index, token in enumerate(tokens or [None])]
+        self.max_rate = max_rate
+        self.attempts = max(attempts, len(self._accounts))
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+    def _select(self, now: float):
+        """Pick the least loaded available account, or None"""
+        candidates = [account for account in self._accounts if account.available(now, self.max_rate)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda account: (account.in_flight, account.recent_calls(now)))
+
+    async def _acquire(self) -> _Account:
+        """Wait for an account and reserve a call on it"""
+        while True:
+            now = time.monotonic()
+            account = self._select(now)
+            if account is not None:
+                account.in_flight += 1
+                account.calls.append(now)
+                return account
+
+            delay = min(account.ready_at(now, self.max_rate) for account in self._accounts) - now
+            logger.warning("All %s Telegraph accounts are cooling down, waiting %.1fs", len(self._accounts), delay)
+            await asyncio.sleep(max(delay, 0.01))
+
+    async def call(self, method: str, *args, **kwargs):
+        """
+        Run an AsyncTelegraph method on the least loaded account
+
+        Args:
+            method: Name of the AsyncTelegraph method
+            *args: Positional arguments for the method
+            **kwargs: Keyword arguments for the method
+
+        Returns:
+            The method result
+        """
+        for attempt in range(1, self.attempts + 1):
+            account = await self._acquire()
+            try:
+                result = await getattr(account.client, method)(*args, **kwargs)
+            except FloodWaitError as e:
+                account.cooldown_until = time.monotonic() + e.retry_after
+                flood_waits.inc(account=str(account.index))
+                logger.warning(
+                    "Telegraph account %s hit a flood wait, cooling down for %ss (attempt %s/%s)",
+                    account.index, e.retry_after, attempt, self.attempts
+                )
+                if attempt == self.attempts:
+                    raise
+                continue
+            finally:
+                account.in_flight -= 1
+
+            if method == 'create_page':
+                pages_created.inc(account=str(account.index))
+            return result
+
+    async def create_page(self, *args, **kwargs) -> dict:
+        """Create a Telegraph page, see AsyncTelegraph.create_page"""
+        return await self.call('create_page', *args, **kwargs)
+
+    async def get_page(self, *args, **kwargs) -> dict:
+        """Get a Telegraph page, see AsyncTelegraph.get_page"""
+        return await self.call('get_page', *args, **kwargs)
+
+    def stats(self) -> list:
+        """
+        Get the load of each account
+
+        Returns:
+            List of dicts with in_flight, recent_calls and cooldown per account
+        """
+        now = time.monotonic()
+        return [
+            {
+                'in_flight': account.in_flight,
+                'recent_calls': account.recent_calls(now),
+                'cooldown': round(max(account.cooldown_until - now, 0), 1)
+            }
+            for account in self._accounts
+        ]
+
+# Shared token pool instance
+_pool = None
+
+def get_token_pool() -> TelegraphTokenPool:
+    """
+    Get the shared Telegraph token pool
+
+    Returns:
+        The token pool instance
+    """
+    global _pool
+    if _pool is None:
+        _pool = TelegraphTokenPool(load_tokens())
+        logger.info("Telegraph token pool ready with %s account(s)", len(_pool))
+    return _pool
+
+def _account_load() -> dict:
+    """Calls in flight per account, for the metrics gauge"""
+    if _pool is None:
+        return {}
+    return {(str(index),): account['in_flight'] for index, account in enumerate(_pool.stats())}
+
+def _accounts_cooling() -> int:
+    """Accounts currently cooling down, for the metrics gauge"""
+    if _pool is None:
+        return 0
+    return sum(1 for account in _pool.stats() if account['cooldown'] > 0)
+
+gauge('m2t_telegraph_account_in_flight', 'Telegraph calls in flight per account', ('account',), _account_load)
+gauge('m2t_telegraph_accounts_cooling', 'Telegraph accounts cooling down after a flood wait', (), _accounts_cooling)
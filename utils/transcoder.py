@@ -0,0 +1,135 @@
+"""
+Optional video transcoding to Telegraph-compatible MP4 with ffmpeg
+"""
+import os
+import json
+import shutil
+import asyncio
+import functools
+from utils.content_type import UnsupportedContentError
+from utils.logger import get_logger
+from utils.metrics import counter, stage_timer
+
+# Get logger
+logger = get_logger(__name__)
+
+# Transcoding settings
+VIDEO_TRANSCODE = os.getenv('VIDEO_TRANSCODE', 'false').lower() == 'true'
+FFMPEG_PATH = os.getenv('FFMPEG_PATH', 'ffmpeg')
+FFPROBE_PATH = os.getenv('FFPROBE_PATH', 'ffprobe')
+VIDEO_TRANSCODE_CONCURRENCY = int(os.getenv('VIDEO_TRANSCODE_CONCURRENCY', 2))
+VIDEO_TRANSCODE_TIMEOUT = float(os.getenv('VIDEO_TRANSCODE_TIMEOUT', 300))
+VIDEO_MAX_DIMENSION = int(os.getenv('VIDEO_MAX_DIMENSION', 1280))
+
+# Transcoding results
+videos_transcoded = counter('m2t_videos_transcoded_total', 'Videos run through ffmpeg', ('result',))
+
+# Limits the number of ffmpeg processes running at once
+_slots = None
+
+@functools.lru_cache(maxsize=None)
+def _installed(command: str) -> bool:
+    """Check once whether a command is on the PATH"""
+    return shutil.which(command) is not None
+
+def transcoder_enabled() -> bool:
+    """Check whether videos can be converted with ffmpeg"""
+    return VIDEO_TRANSCODE and _installed(FFMPEG_PATH)
+
+async def _run(*args, timeout: float = VIDEO_TRANSCODE_TIMEOUT) -> bytes:
+    """Run a command, killing it when it takes too long or is cancelled, and return its stdout"""
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        raise Exception(f"{os.path.basename(args[0])} timed out after {timeout:.0f}s")
+    finally:
+        # Also reached on cancellation, by a shutdown, job timeout or worker restart
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    if process.returncode != 0:
+        raise Exception(f"{os.path.basename(args[0])} failed: {stderr.decode(errors='replace')[-500:]}")
+    return stdout
+
+async def probe_duration(input_path: str):
+    """
+    Get the duration of a media file with ffprobe
+
+    Args:
+        input_path: Path of the media file
+
+    Returns:
+        Duration in seconds, or None when it cannot be determined
+    """
+    if not _installed(FFPROBE_PATH):
+        return None
+    try:
+        output = await _run(
+            FFPROBE_PATH, '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', input_path,
+            timeout=30
+        )
+        return float(json.loads(output)['format']['duration'])
+    except Exception as e:
+        logger.warning("Could not probe %s: %s", input_path, e)
+        return None
+
+async def transcode_to_mp4(input_path: str, output_path: str, max_size: int = None) -> str:
+    """
+    Convert a video or animation to H.264 MP4
+
+    At most VIDEO_TRANSCODE_CONCURRENCY ffmpeg processes run at a time.
+    When max_size is given and the duration is known, the bitrate is
+    chosen so the result fits; a result that still does not fit raises
+    UnsupportedContentError rather than being uploaded to be refused.
+
+    Args:
+        input_path: Path of the source file
+        output_path: Path of the MP4 to write
+        max_size: Target maximum size of the output in bytes
+
+    Returns:
+        The output path
+    """
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(VIDEO_TRANSCODE_CONCURRENCY)
+
+    async with _slots, stage_timer('transcode'):
+        rate_control = ['-crf', '28']
+        duration = await probe_duration(input_path) if max_size else None
+        if duration:
+            # Leave a tenth of the budget for audio and container overhead
+            video_bitrate = max(int(max_size * 8 * 0.9 / duration) - 96_000, 100_000)
+            rate_control = ['-b:v', str(video_bitrate), '-maxrate', str(video_bitrate),
+                            '-bufsize', str(video_bitrate * 2)]
+
+        scale = f"scale='min({VIDEO_MAX_DIMENSION},iw)':'min({VIDEO_MAX_DIMENSION},ih)':" \
+                f"force_original_aspect_ratio=decrease,scale=trunc(iw/2)*2:trunc(ih/2)*2"
+        try:
+            await _run(
+                FFMPEG_PATH, '-nostdin', '-y', '-i', input_path,
+                '-map', '0:v:0', '-map', '0:a:0?',
+                '-c:v', 'libx264', '-preset', 'veryfast', *rate_control,
+                '-vf', scale, '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac', '-b:a', '96k',
+                '-movflags', '+faststart',
+                output_path
+            )
+        except Exception:
+            videos_transcoded.inc(result='error')
+            raise
+
+    output_size = os.path.getsize(output_path)
+    if max_size and output_size > max_size:
+        videos_transcoded.inc(result='too_large')
+        raise UnsupportedContentError(
+            f"{os.path.basename(input_path)} is {output_size} bytes after conversion, "
+            f"over the upload limit of {max_size} bytes"
+        )
+
+    videos_transcoded.inc(result='success')
+    logger.info("Transcoded %s: %s -> %s bytes", os.path.basename(input_path), os.path.getsize(input_path), output_size)
+    return output_path
@@ -0,0 +1,83 @@
+"""
+Which media can be embedded in a Telegraph page, and how large it may be
+"""
+import os
+from utils.image_optimizer import PILLOW_FORMATS, optimizer_enabled
+from utils.transcoder import transcoder_enabled
+
+# Media types the Telegraph upload endpoint accepts
+UPLOADABLE_MIME_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'video/mp4'}
+
+# Largest file the Telegraph upload endpoint accepts
+TELEGRAPH_MAX_UPLOAD_SIZE = int(os.getenv('TELEGRAPH_MAX_UPLOAD_SIZE', 5 * 1024 * 1024))
+
+# Largest video or animation downloaded to be transcoded
+VIDEO_MAX_SIZE = int(os.getenv('VIDEO_MAX_SIZE', 20 * 1024 * 1024))
+
+def is_uploadable(content_type) -> bool:
+    """
+    Check whether content can be uploaded and embedded in a page
+
+    Args:
+        content_type: ContentType sniffed from the file, or None
+
+    Returns:
+        True if the content should be uploaded to Telegraph
+    """
+    if content_type is None:
+        return False
+    if content_type.mime_type in UPLOADABLE_MIME_TYPES:
+        return True
+    # Other formats are converted by the optimizer or ffmpeg
+    if content_type.category == 'video':
+        return transcoder_enabled()
+    return optimizer_enabled() and content_type.mime_type in PILLOW_FORMATS
+
+def is_transcodable(content_type) -> bool:
+    """Check whether content is a video or animation ffmpeg can convert"""
+    return transcoder_enabled() and (content_type.category == 'video' or content_type.mime_type == 'image/gif')
+
+def max_upload_size(content_type) -> int:
+    """
+    Get the largest file of a type worth downloading for upload
+
+    Args:
+        content_type: ContentType of the file
+
+    Returns:
+        Size limit in bytes
+    """
+    if is_transcodable(content_type):
+        return VIDEO_MAX_SIZE
+    if optimizer_enabled() and content_type.mime_type in PILLOW_FORMATS:
+        # The optimizer shrinks the image; the Bot API caps the download anyway
+        return VIDEO_MAX_SIZE
+    return TELEGRAPH_MAX_UPLOAD_SIZE
+
+def needs_transcode(content_type, file_size: int = None) -> bool:
+    """
+    Check whether a video or animation has to go through ffmpeg first
+
+    Args:
+        content_type: ContentType of the file
+        file_size: Size of the file in bytes, if known
+
+    Returns:
+        True for formats Telegraph cannot embed and for files over its size limit
+    """
+    if not is_transcodable(content_type):
+        return False
+    if content_type.mime_type not in UPLOADABLE_MIME_TYPES:
+        return True
+    return bool(file_size and file_size > TELEGRAPH_MAX_UPLOAD_SIZE)
+
+def largest_upload_size() -> int:
+    """
+    Get the largest file of any type worth downloading for upload
+
+    Returns:
+        Size limit in bytes
+    """
+    if transcoder_enabled() or optimizer_enabled():
+        return max(VIDEO_MAX_SIZE, TELEGRAPH_MAX_UPLOAD_SIZE)
+    return TELEGRAPH_MAX_UPLOAD_SIZE
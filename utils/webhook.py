@@ -0,0 +1,240 @@
+"""
+Webhook serving mode backed by an aiohttp server
+"""
+import os
+import json
+import signal
+import asyncio
+import secrets
+import multiprocessing
+from typing import TYPE_CHECKING, Callable, Optional
+from telegram import Update
+from telegram.ext import Application
+from utils.http_client import get_http_session
+from utils.logger import get_logger, setup_worker_logger, worker_log_queue
+from utils.startup import mark_phase
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+# Get logger
+logger = get_logger(__name__)
+
+# Webhook settings
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 1))
+
+# Update types the handlers actually consume
+ALLOWED_UPDATES = [Update.MESSAGE]
+
+# Header Telegram sends the secret token in
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+def worker_url(index: int) -> str:
+    """
+    Get the local URL webhook worker N serves updates on
+
+    Args:
+        index: Worker index
+
+    Returns:
+        URL of the worker's webhook path
+    """
+    host = '127.0.0.1' if WEBHOOK_LISTEN in ('', '0.0.0.0', '::') else WEBHOOK_LISTEN
+    return f"http://{host}:{WEBHOOK_PORT + index}{WEBHOOK_PATH}"
+
+def update_chat_id(data: dict) -> Optional[int]:
+    """
+    Get the chat a raw update belongs to
+
+    Args:
+        data: Update as sent by Telegram
+
+    Returns:
+        The chat ID, or None for updates without a chat
+    """
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        chat = (data.get(key) or {}).get('chat') or {}
+        if isinstance(chat.get('id'), int):
+            return chat['id']
+    return None
+
+def create_webhook_app(application: Application, secret_token: str, index: int = 0,
+                       worker_urls: list = None) -> 'web.Application':
+    """
+    Create the aiohttp app that feeds webhook updates into the Application
+
+    With several workers, every chat belongs to one of them. An update the
+    reverse proxy delivered to another worker is forwarded to the owner, so
+    albums, per-chat fairness and the status edit throttle of a chat all
+    live in one process however the proxy spreads requests.
+
+    Args:
+        application: The telegram Application
+        secret_token: Expected X-Telegram-Bot-Api-Secret-Token header
+        index: Index of this worker
+        worker_urls: Webhook URLs of all workers by index, see worker_url
+
+    Returns:
+        The aiohttp application
+    """
+    from aiohttp import web
+
+    expected = secret_token.encode()
+
+    async def forward(owner: int, body: bytes) -> 'web.Response':
+        try:
+            async with get_http_session().post(
+                worker_urls[owner], data=body,
+                headers={SECRET_HEADER: secret_token, 'Content-Type': 'application/json'}
+            ) as response:
+                return web.Response(status=response.status)
+        except Exception as e:
+            # Telegram delivers the update again later
+            logger.warning("Could not forward update to webhook worker %s: %s", owner, e)
+            return web.Response(status=502)
+
+    async def handle_update(request):
+        # Compared as bytes, a str with non-ASCII characters would raise
+        received = request.headers.get(SECRET_HEADER, '').encode('utf-8', 'surrogateescape')
+        if not secrets.compare_digest(received, expected):
+            logger.warning("Rejected webhook request from %s: bad secret token", request.remote)
+            return web.Response(status=403)
+        try:
+            body = await request.read()
+            data = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(data, dict):
+            return web.Response(status=400)
+
+        chat_id = update_chat_id(data)
+        workers = len(worker_urls) if worker_urls else 1
+        if workers > 1 and chat_id is not None and chat_id % workers != index:
+            return await forward(chat_id % workers, body)
+
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        return web.Response()
+
+    async def handle_health(request):
+        return web.Response(text='ok' if application.running else 'starting',
+                            status=200 if application.running else 503)
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    app.router.add_get('/healthz', handle_health)
+    return app
+
+async def serve_webhook(application: Application, port: int = WEBHOOK_PORT, secret_token: str = WEBHOOK_SECRET,
+                        set_webhook: bool = True, stop_event: asyncio.Event = None,
+                        index: int = 0, workers: int = 1) -> None:
+    """
+    Run an Application behind the webhook server until stopped
+
+    Args:
+        application: The telegram Application
+        port: Port to listen on
+        secret_token: Secret token Telegram sends with every update
+        set_webhook: Register the webhook URL with Telegram
+        stop_event: Event that stops the server, SIGINT/SIGTERM by default
+        index: Index of this worker
+        workers: Number of webhook workers sharing the chats
+    """
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+
+    if set_webhook:
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL + WEBHOOK_PATH if WEBHOOK_URL else None,
+            secret_token=secret_token,
+            allowed_updates=ALLOWED_UPDATES
+        )
+        logger.info("Webhook registered at %s%s", WEBHOOK_URL, WEBHOOK_PATH)
+
+    await application.start()
+    from aiohttp import web
+    worker_urls = [worker_url(worker) for worker in range(workers)] if workers > 1 else None
+    runner = web.AppRunner(create_webhook_app(application, secret_token, index, worker_urls), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_LISTEN, port).start()
+    logger.info("Webhook server listening on %s:%s", WEBHOOK_LISTEN, port)
+
+    try:
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+def _run_worker(build_application: Callable[[], Application], index: int, secret_token: str,
+                log_queue=None, workers: int = 1) -> None:
+    """Entry point of a webhook worker process"""
+    setup_worker_logger(log_queue)
+    mark_phase('imports')
+    application = build_application()
+    mark_phase('build')
+    application.bot_data['worker_index'] = index
+    asyncio.run(serve_webhook(
+        application, port=WEBHOOK_PORT + index, secret_token=secret_token, set_webhook=index == 0,
+        index=index, workers=workers
+    ))
+
+def run_webhook(build_application: Callable[[], Application], workers: int = WEBHOOK_WORKERS) -> None:
+    """
+    Serve updates through a webhook, optionally in several processes
+
+    Worker N listens on WEBHOOK_PORT + N; a local reverse proxy is
+    expected to spread the public webhook URL across them. Each worker
+    owns the chats whose ID modulo the number of workers is N and forwards
+    the updates of other chats to their owner.
+
+    Args:
+        build_application: Function returning a configured Application
+        workers: Number of worker processes
+    """
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL must be set to use webhook mode")
+
+    # Every worker has to accept the same secret
+    secret_token = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+    if workers <= 1:
+        _run_worker(build_application, 0, secret_token)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    log_queue = worker_log_queue()
+    processes = [
+        context.Process(target=_run_worker, args=(build_application, index, secret_token, log_queue, workers),
+                        daemon=False)
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info("Started %s webhook workers on ports %s-%s", workers, WEBHOOK_PORT, WEBHOOK_PORT + workers - 1)
+
+    def stop_workers(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    for process in processes:
+        process.join()
@@ -0,0 +1,338 @@
+"""
+Pool of transfer worker processes sharded by chat ID
+"""
+import os
+import time
+import queue
+import asyncio
+import threading
+import multiprocessing
+from typing import Awaitable, Callable
+from utils.logger import get_logger, setup_worker_logger, worker_log_queue
+from utils.metrics import collect_metrics, merge_metrics
+from utils.scheduler import QueueFullError, get_scheduler
+
+# Get logger
+logger = get_logger(__name__)
+
+# Worker pool settings, 0 processes keeps transfers in the bot process
+TRANSFER_WORKERS = int(os.getenv('TRANSFER_WORKERS', 0))
+WORKER_QUEUE_SIZE = int(os.getenv('WORKER_QUEUE_SIZE', 100))
+WORKER_HEALTH_INTERVAL = float(os.getenv('WORKER_HEALTH_INTERVAL', 5.0))
+WORKER_HEARTBEAT_TIMEOUT = float(os.getenv('WORKER_HEARTBEAT_TIMEOUT', 30.0))
+WORKER_DRAIN_TIMEOUT = float(os.getenv('WORKER_DRAIN_TIMEOUT', 60.0))
+
+# Seconds between heartbeats sent by a worker
+_HEARTBEAT_EVERY = 1.0
+
+def _worker_main(index: int, jobs, metrics, log_queue, counters, setup: Callable[[int], Awaitable],
+                 handle: Callable, teardown: Callable[[object], Awaitable]) -> None:
+    """Entry point of a worker process"""
+    setup_worker_logger(log_queue)
+    asyncio.run(_worker_loop(index, jobs, metrics, counters, setup, handle, teardown))
+
+def _send_metrics(metrics) -> None:
+    """Send the metrics recorded since the last call to the bot process"""
+    collected = collect_metrics()
+    if collected:
+        try:
+            metrics.send(collected)
+        except OSError as e:
+            logger.warning("Could not send metrics to the bot process: %s", e)
+
+async def _worker_loop(index: int, jobs, metrics, counters, setup, handle, teardown) -> None:
+    """Pull jobs from the shard pipe and run them until a sentinel arrives"""
+    heartbeat, taken, completed = counters
+    state = await setup(index)
+
+    # The worker's scheduler runs jobs of different chats in parallel
+    # while keeping the jobs of each chat in order
+    scheduler = get_scheduler()
+    scheduler.per_chat_serial = True
+    await scheduler.start()
+
+    async def beat():
+        while True:
+            heartbeat.value = time.time()
+            _send_metrics(metrics)
+            await asyncio.sleep(_HEARTBEAT_EVERY)
+
+    beater = asyncio.create_task(beat())
+    logger.info("Transfer worker %s started (pid %s)", index, os.getpid())
+
+    try:
+        while True:
+            # Leave jobs in the pipe while the scheduler is full
+            await scheduler.wait_for_room()
+
+            job = await asyncio.to_thread(jobs.recv)
+            if job is None:
+                break
+            with taken.get_lock():
+                taken.value += 1
+
+            async def run(job=job):
+                try:
+                    await handle(state, job)
+                finally:
+                    _send_metrics(metrics)
+                    with completed.get_lock():
+                        completed.value += 1
+
+            scheduler.submit(job['chat_id'], run)
+
+        # Drain: let everything already accepted finish
+        await scheduler.join()
+    finally:
+        beater.cancel()
+        await scheduler.stop()
+        await teardown(state)
+        _send_metrics(metrics)
+        logger.info("Transfer worker %s stopped", index)
+
+class WorkerPool:
+    """
+    Runs jobs in worker processes, one job pipe per process
+
+    Jobs are routed by chat_id so every job of a chat lands on the same
+    worker, which keeps per-chat ordering. Each pipe has a single reader,
+    so a killed worker cannot leave a lock behind and its replacement
+    picks up the jobs still waiting in the pipe. Jobs are written to the
+    pipes by one sender thread per worker, so a pipe filled by a busy or
+    dead worker never blocks the event loop. Workers report a
+    heartbeat that the pool checks to restart dead or stuck processes.
+    Counters and histograms recorded by a worker come back over a second
+    pipe after every job and heartbeat, and are merged into this process's
+    metrics so /metrics covers the work done in the workers.
+
+    Args:
+        workers: Number of worker processes
+        setup: Coroutine function called with the worker index, returning its state
+        handle: Coroutine function called with the worker state and a job dict
+        teardown: Coroutine function called with the worker state on exit
+        queue_size: Maximum number of jobs waiting in a worker's pipe
+    """
+
+    def __init__(self, workers: int, setup: Callable, handle: Callable, teardown: Callable,
+                 queue_size: int = WORKER_QUEUE_SIZE):
+        self.workers = workers
+        self.setup = setup
+        self.handle = handle
+        self.teardown = teardown
+        self.queue_size = queue_size
+        self.restarts = 0
+        self.lost = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._pipes = [self._context.Pipe(duplex=False) for _ in range(workers)]
+        self._outboxes = [queue.SimpleQueue() for _ in range(workers)]
+        self._senders = []
+        self._metric_pipes = [self._context.Pipe(duplex=False) for _ in range(workers)]
+        self._metric_readers = []
+        self._log_queue = worker_log_queue()
+        self._submitted = [0] * workers
+        self._heartbeats = [self._context.Value('d', 0.0) for _ in range(workers)]
+        self._taken = [self._context.Value('L', 0) for _ in range(workers)]
+        self._completed = [self._context.Value('L', 0) for _ in range(workers)]
+        self._processes = [None] * workers
+        self._monitor = None
+
+    def _spawn(self, index: int) -> None:
+        """Start the process of one shard"""
+        self._heartbeats[index].value = time.time()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self._pipes[index][0], self._metric_pipes[index][1], self._log_queue,
+                  (self._heartbeats[index], self._taken[index], self._completed[index]),
+                  self.setup, self.handle, self.teardown),
+            name=f"transfer-worker-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _send_jobs(self, index: int) -> None:
+        """Write one shard's jobs to its pipe until the None sentinel was sent"""
+        writer = self._pipes[index][1]
+        while True:
+            job = self._outboxes[index].get()
+            try:
+                writer.send(job)
+            except OSError as e:
+                logger.error("Could not send job to transfer worker %s: %s", index, e)
+            if job is None:
+                return
+
+    def _read_metrics(self, index: int) -> None:
+        """Merge the metrics sent by one shard's workers until a sentinel arrives"""
+        reader = self._metric_pipes[index][0]
+        while True:
+            try:
+                collected = reader.recv()
+            except (EOFError, OSError):
+                return
+            if collected is None:
+                return
+            merge_metrics(collected)
+
+    def shard_for(self, chat_id: int) -> int:
+        """
+        Get the worker index responsible for a chat
+
+        Args:
+            chat_id: Chat ID
+
+        Returns:
+            Worker index
+        """
+        return chat_id % self.workers
+
+    def _waiting(self, index: int) -> int:
+        """Number of jobs sent to a worker that it has not picked up yet"""
+        return self._submitted[index] - self._taken[index].value
+
+    def position_for(self, chat_id: int) -> int:
+        """
+        Get the number of jobs waiting for the chat's worker
+
+        Args:
+            chat_id: Chat ID
+
+        Returns:
+            Number of jobs waiting in the shard pipe
+        """
+        return self._waiting(self.shard_for(chat_id))
+
+    def submit(self, job: dict) -> None:
+        """
+        Queue a job on the worker owning its chat
+
+        Args:
+            job: Picklable job dict with a chat_id key
+        """
+        index = self.shard_for(job['chat_id'])
+        if self._waiting(index) >= self.queue_size:
+            raise QueueFullError("Worker queue is full")
+        self._outboxes[index].put(job)
+        self._submitted[index] += 1
+
+    @property
+    def completed(self) -> int:
+        """Number of jobs finished by all workers"""
+        return sum(value.value for value in self._completed)
+
+    def health(self) -> list:
+        """
+        Get the health of every worker
+
+        Returns:
+            List of dicts with alive flag, heartbeat age and completed jobs
+        """
+        now = time.time()
+        return [
+            {
+                'index': index,
+                'pid': process.pid if process else None,
+                'alive': bool(process and process.is_alive()),
+                'heartbeat_age': now - self._heartbeats[index].value,
+                'waiting': self._waiting(index),
+                'running': self._taken[index].value - self._completed[index].value,
+                'completed': self._completed[index].value
+            }
+            for index, process in enumerate(self._processes)
+        ]
+
+    async def _monitor_loop(self) -> None:
+        """Restart workers that died or stopped sending heartbeats"""
+        while True:
+            await asyncio.sleep(WORKER_HEALTH_INTERVAL)
+            for state in self.health():
+                index = state['index']
+                if state['alive'] and state['heartbeat_age'] < WORKER_HEARTBEAT_TIMEOUT:
+                    continue
+                logger.error(
+                    "Transfer worker %s unhealthy (alive=%s, heartbeat %.0fs ago), restarting",
+                    index, state['alive'], state['heartbeat_age']
+                )
+                process = self._processes[index]
+                if process.is_alive():
+                    process.kill()
+                await asyncio.to_thread(process.join)
+
+                # Jobs the worker was running are gone, the ones still in
+                # the pipe go to its replacement
+                if state['running']:
+                    logger.error("Transfer worker %s lost %s running jobs", index, state['running'])
+                    self.lost += state['running']
+                    with self._taken[index].get_lock():
+                        self._taken[index].value -= state['running']
+                    self._submitted[index] -= state['running']
+                self._spawn(index)
+                self.restarts += 1
+
+    async def start(self) -> None:
+        """Start all workers and the health monitor"""
+        for index in range(self.workers):
+            self._spawn(index)
+            sender = threading.Thread(target=self._send_jobs, args=(index,), name=f"worker-jobs-{index}",
+                                      daemon=True)
+            sender.start()
+            self._senders.append(sender)
+            reader = threading.Thread(target=self._read_metrics, args=(index,), name=f"worker-metrics-{index}",
+                                      daemon=True)
+            reader.start()
+            self._metric_readers.append(reader)
+        self._monitor = asyncio.create_task(self._monitor_loop())
+        logger.info("Started %s transfer workers", self.workers)
+
+    async def stop(self, timeout: float = WORKER_DRAIN_TIMEOUT) -> None:
+        """
+        Drain the workers and stop them
+
+        Args:
+            timeout: Seconds to wait for queued jobs before killing workers
+        """
+        if self._monitor:
+            self._monitor.cancel()
+
+        # The sentinel is queued behind every accepted job
+        for outbox in self._outboxes:
+            outbox.put(None)
+
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("%s did not drain in time, terminating", process.name)
+                process.terminate()
+                await asyncio.to_thread(process.join)
+
+        for thread in self._senders:
+            await asyncio.to_thread(thread.join, 5)
+
+        # Stop the metric readers behind everything the workers sent
+        for reader, writer in self._metric_pipes:
+            writer.send(None)
+        for thread in self._metric_readers:
+            await asyncio.to_thread(thread.join, 5)
+        logger.info("Transfer workers stopped after %s jobs", self.completed)
+
+# Shared pool, set when the bot runs in sharded mode
+_pool = None
+
+def get_worker_pool():
+    """
+    Get the active worker pool
+
+    Returns:
+        The pool, or None when transfers run in the bot process
+    """
+    return _pool
+
+def set_worker_pool(pool) -> None:
+    """
+    Set the active worker pool
+
+    Args:
+        pool: The pool, or None
+    """
+    global _pool
+    _pool = pool